@@ -43,6 +43,7 @@ CREATE TABLE company_info (
 	logo VARCHAR(120), 
 	ncf_final INTEGER, 
 	ncf_fiscal INTEGER, 
+	ncf_epoch INTEGER NOT NULL DEFAULT 0, 
 	PRIMARY KEY (id)
 );
 
@@ -125,7 +126,7 @@ CREATE TABLE product (
 	min_stock INTEGER, 
 	company_id INTEGER NOT NULL, 
 	PRIMARY KEY (id), 
-	UNIQUE (code), 
+	CONSTRAINT uq_product_company_code UNIQUE (company_id, code), 
 	FOREIGN KEY(company_id) REFERENCES company_info (id)
 );
 
@@ -215,6 +216,7 @@ CREATE TABLE inventory_movement (
 	warehouse_id INTEGER, 
 	company_id INTEGER NOT NULL, 
 	executed_by INTEGER NOT NULL, 
+	delta INTEGER, 
 	PRIMARY KEY (id), 
 	FOREIGN KEY(product_id) REFERENCES product (id), 
 	FOREIGN KEY(warehouse_id) REFERENCES warehouse (id), 
@@ -222,6 +224,8 @@ CREATE TABLE inventory_movement (
 	FOREIGN KEY(executed_by) REFERENCES user (id)
 );
 
+CREATE INDEX ix_inventory_movement_company_wh_ts ON inventory_movement (company_id, warehouse_id, timestamp);
+
 
 CREATE TABLE ncf_log (
 	id INTEGER NOT NULL AUTO_INCREMENT, 
@@ -262,6 +266,8 @@ CREATE TABLE product_stock (
 	stock INTEGER, 
 	min_stock INTEGER, 
 	company_id INTEGER NOT NULL, 
+	low_stock_alert_at DATETIME, 
+	suggested_min_stock INTEGER, 
 	PRIMARY KEY (id), 
 	CONSTRAINT uix_product_wh UNIQUE (product_id, warehouse_id), 
 	FOREIGN KEY(product_id) REFERENCES product (id), 
@@ -428,6 +434,89 @@ CREATE TABLE payment (
 	FOREIGN KEY(company_id) REFERENCES company_info (id)
 );
 
+
+CREATE TABLE email_outbox (
+	id INTEGER NOT NULL AUTO_INCREMENT, 
+	company_id INTEGER, 
+	to_address VARCHAR(255) NOT NULL, 
+	subject VARCHAR(255) NOT NULL, 
+	html MEDIUMTEXT NOT NULL, 
+	attachments LONGTEXT, 
+	status VARCHAR(20) NOT NULL DEFAULT 'pending', 
+	attempts INTEGER NOT NULL DEFAULT 0, 
+	max_attempts INTEGER NOT NULL DEFAULT 5, 
+	next_attempt_at DATETIME NOT NULL, 
+	locked_by VARCHAR(80), 
+	locked_until DATETIME, 
+	last_error VARCHAR(500), 
+	created_at DATETIME NOT NULL, 
+	sent_at DATETIME, 
+	PRIMARY KEY (id)
+);
+
+CREATE INDEX ix_email_outbox_status_next_attempt ON email_outbox (status, next_attempt_at);
+CREATE INDEX ix_email_outbox_created_at ON email_outbox (created_at);
+
+
+CREATE TABLE email_metric_counter (
+	name VARCHAR(40) NOT NULL, 
+	value BIGINT NOT NULL DEFAULT 0, 
+	updated_at DATETIME NOT NULL, 
+	PRIMARY KEY (name)
+);
+
+
+CREATE TABLE sql_query_stat (
+	id INTEGER NOT NULL AUTO_INCREMENT, 
+	fingerprint VARCHAR(16) NOT NULL, 
+	statement TEXT NOT NULL, 
+	calls INTEGER NOT NULL DEFAULT 0, 
+	total_ms FLOAT NOT NULL DEFAULT 0, 
+	max_ms FLOAT NOT NULL DEFAULT 0, 
+	p95_ms FLOAT NOT NULL DEFAULT 0, 
+	sample_request_id VARCHAR(64), 
+	worker VARCHAR(80), 
+	window_start DATETIME NOT NULL, 
+	window_end DATETIME NOT NULL, 
+	PRIMARY KEY (id)
+);
+
+CREATE INDEX ix_sql_query_stat_window_end ON sql_query_stat (window_end);
+CREATE INDEX ix_sql_query_stat_fingerprint_window_end ON sql_query_stat (fingerprint, window_end);
+
+
+CREATE TABLE notification_counter (
+	company_id INTEGER NOT NULL, 
+	unread INTEGER NOT NULL DEFAULT 0, 
+	updated_at DATETIME NOT NULL, 
+	PRIMARY KEY (company_id)
+);
+
+
+CREATE TABLE catalog_version (
+	company_id INTEGER NOT NULL, 
+	version INTEGER NOT NULL DEFAULT 0, 
+	updated_at DATETIME NOT NULL, 
+	PRIMARY KEY (company_id)
+);
+
+
+CREATE TABLE inventory_checkpoint (
+	id INTEGER NOT NULL AUTO_INCREMENT, 
+	company_id INTEGER NOT NULL, 
+	warehouse_id INTEGER NOT NULL, 
+	product_id INTEGER NOT NULL, 
+	stock INTEGER NOT NULL DEFAULT 0, 
+	taken_at DATETIME NOT NULL, 
+	last_movement_id INTEGER NOT NULL DEFAULT 0, 
+	PRIMARY KEY (id), 
+	FOREIGN KEY(company_id) REFERENCES company_info (id), 
+	FOREIGN KEY(warehouse_id) REFERENCES warehouse (id), 
+	FOREIGN KEY(product_id) REFERENCES product (id)
+);
+
+CREATE INDEX ix_inventory_checkpoint_company_wh_taken ON inventory_checkpoint (company_id, warehouse_id, taken_at);
+
 -- Notes:
 -- 1) Import this SQL in phpMyAdmin with the target DB selected.
 -- 2) Then run: flask db upgrade
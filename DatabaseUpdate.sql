@@ -85,6 +85,42 @@ BEGIN
         PREPARE stmt FROM @sql; EXECUTE stmt; DEALLOCATE PREPARE stmt;
     END IF;
 
+    -- 2.2) open low-stock alert marker per product/warehouse
+    IF NOT EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_schema = @db AND table_name = 'product_stock' AND column_name = 'low_stock_alert_at'
+    ) THEN
+        SET @sql := 'ALTER TABLE `product_stock` ADD COLUMN `low_stock_alert_at` DATETIME NULL';
+        PREPARE stmt FROM @sql; EXECUTE stmt; DEALLOCATE PREPARE stmt;
+    END IF;
+
+    -- 2.3) reorder point suggested from sales history
+    IF NOT EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_schema = @db AND table_name = 'product_stock' AND column_name = 'suggested_min_stock'
+    ) THEN
+        SET @sql := 'ALTER TABLE `product_stock` ADD COLUMN `suggested_min_stock` INT NULL';
+        PREPARE stmt FROM @sql; EXECUTE stmt; DEALLOCATE PREPARE stmt;
+    END IF;
+
+    -- 2.4) signed stock change per movement (point-in-time inventory)
+    IF NOT EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_schema = @db AND table_name = 'inventory_movement' AND column_name = 'delta'
+    ) THEN
+        SET @sql := 'ALTER TABLE `inventory_movement` ADD COLUMN `delta` INT NULL';
+        PREPARE stmt FROM @sql; EXECUTE stmt; DEALLOCATE PREPARE stmt;
+    END IF;
+
+    -- 2.5) NCF counter epoch, bumped when the counters are set by hand
+    IF NOT EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_schema = @db AND table_name = 'company_info' AND column_name = 'ncf_epoch'
+    ) THEN
+        SET @sql := 'ALTER TABLE `company_info` ADD COLUMN `ncf_epoch` INT NOT NULL DEFAULT 0';
+        PREPARE stmt FROM @sql; EXECUTE stmt; DEALLOCATE PREPARE stmt;
+    END IF;
+
     -- 3) New operational tables
     SET @sql := 'CREATE TABLE IF NOT EXISTS `error_report` (
       `id` INT NOT NULL AUTO_INCREMENT,
@@ -161,6 +197,83 @@ BEGIN
     ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci';
     PREPARE stmt FROM @sql; EXECUTE stmt; DEALLOCATE PREPARE stmt;
 
+    SET @sql := 'CREATE TABLE IF NOT EXISTS `email_outbox` (
+      `id` INT NOT NULL AUTO_INCREMENT,
+      `company_id` INT NULL,
+      `to_address` VARCHAR(255) NOT NULL,
+      `subject` VARCHAR(255) NOT NULL,
+      `html` MEDIUMTEXT NOT NULL,
+      `attachments` LONGTEXT NULL,
+      `status` VARCHAR(20) NOT NULL DEFAULT ''pending'',
+      `attempts` INT NOT NULL DEFAULT 0,
+      `max_attempts` INT NOT NULL DEFAULT 5,
+      `next_attempt_at` DATETIME NOT NULL,
+      `locked_by` VARCHAR(80) NULL,
+      `locked_until` DATETIME NULL,
+      `last_error` VARCHAR(500) NULL,
+      `created_at` DATETIME NOT NULL,
+      `sent_at` DATETIME NULL,
+      PRIMARY KEY (`id`),
+      KEY `ix_email_outbox_status_next_attempt` (`status`, `next_attempt_at`),
+      KEY `ix_email_outbox_created_at` (`created_at`)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci';
+    PREPARE stmt FROM @sql; EXECUTE stmt; DEALLOCATE PREPARE stmt;
+
+    SET @sql := 'CREATE TABLE IF NOT EXISTS `email_metric_counter` (
+      `name` VARCHAR(40) NOT NULL,
+      `value` BIGINT NOT NULL DEFAULT 0,
+      `updated_at` DATETIME NOT NULL,
+      PRIMARY KEY (`name`)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci';
+    PREPARE stmt FROM @sql; EXECUTE stmt; DEALLOCATE PREPARE stmt;
+
+    SET @sql := 'CREATE TABLE IF NOT EXISTS `sql_query_stat` (
+      `id` INT NOT NULL AUTO_INCREMENT,
+      `fingerprint` VARCHAR(16) NOT NULL,
+      `statement` TEXT NOT NULL,
+      `calls` INT NOT NULL DEFAULT 0,
+      `total_ms` DOUBLE NOT NULL DEFAULT 0,
+      `max_ms` DOUBLE NOT NULL DEFAULT 0,
+      `p95_ms` DOUBLE NOT NULL DEFAULT 0,
+      `sample_request_id` VARCHAR(64) NULL,
+      `worker` VARCHAR(80) NULL,
+      `window_start` DATETIME NOT NULL,
+      `window_end` DATETIME NOT NULL,
+      PRIMARY KEY (`id`),
+      KEY `ix_sql_query_stat_window_end` (`window_end`),
+      KEY `ix_sql_query_stat_fingerprint_window_end` (`fingerprint`, `window_end`)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci';
+    PREPARE stmt FROM @sql; EXECUTE stmt; DEALLOCATE PREPARE stmt;
+
+    SET @sql := 'CREATE TABLE IF NOT EXISTS `notification_counter` (
+      `company_id` INT NOT NULL,
+      `unread` INT NOT NULL DEFAULT 0,
+      `updated_at` DATETIME NOT NULL,
+      PRIMARY KEY (`company_id`)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci';
+    PREPARE stmt FROM @sql; EXECUTE stmt; DEALLOCATE PREPARE stmt;
+
+    SET @sql := 'CREATE TABLE IF NOT EXISTS `catalog_version` (
+      `company_id` INT NOT NULL,
+      `version` INT NOT NULL DEFAULT 0,
+      `updated_at` DATETIME NOT NULL,
+      PRIMARY KEY (`company_id`)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci';
+    PREPARE stmt FROM @sql; EXECUTE stmt; DEALLOCATE PREPARE stmt;
+
+    SET @sql := 'CREATE TABLE IF NOT EXISTS `inventory_checkpoint` (
+      `id` INT NOT NULL AUTO_INCREMENT,
+      `company_id` INT NOT NULL,
+      `warehouse_id` INT NOT NULL,
+      `product_id` INT NOT NULL,
+      `stock` INT NOT NULL DEFAULT 0,
+      `taken_at` DATETIME NOT NULL,
+      `last_movement_id` INT NOT NULL DEFAULT 0,
+      PRIMARY KEY (`id`),
+      KEY `ix_inventory_checkpoint_company_wh_taken` (`company_id`, `warehouse_id`, `taken_at`)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci';
+    PREPARE stmt FROM @sql; EXECUTE stmt; DEALLOCATE PREPARE stmt;
+
     -- 4) Performance indexes (if missing)
     IF NOT EXISTS (
         SELECT 1 FROM information_schema.statistics
@@ -194,6 +307,23 @@ BEGIN
         PREPARE stmt FROM @sql; EXECUTE stmt; DEALLOCATE PREPARE stmt;
     END IF;
 
+    -- Product codes are unique per company, not across tenants
+    IF NOT EXISTS (
+        SELECT 1 FROM information_schema.statistics
+        WHERE table_schema = @db AND table_name = 'product' AND index_name = 'uq_product_company_code'
+    ) THEN
+        SET @sql := 'CREATE UNIQUE INDEX `uq_product_company_code` ON `product` (`company_id`, `code`)';
+        PREPARE stmt FROM @sql; EXECUTE stmt; DEALLOCATE PREPARE stmt;
+    END IF;
+
+    IF EXISTS (
+        SELECT 1 FROM information_schema.statistics
+        WHERE table_schema = @db AND table_name = 'product' AND index_name = 'code' AND non_unique = 0
+    ) THEN
+        SET @sql := 'ALTER TABLE `product` DROP INDEX `code`';
+        PREPARE stmt FROM @sql; EXECUTE stmt; DEALLOCATE PREPARE stmt;
+    END IF;
+
     IF NOT EXISTS (
         SELECT 1 FROM information_schema.statistics
         WHERE table_schema = @db AND table_name = 'rnc_registry' AND index_name = 'ix_rnc_registry_updated_at'
@@ -202,6 +332,14 @@ BEGIN
         PREPARE stmt FROM @sql; EXECUTE stmt; DEALLOCATE PREPARE stmt;
     END IF;
 
+    IF NOT EXISTS (
+        SELECT 1 FROM information_schema.statistics
+        WHERE table_schema = @db AND table_name = 'inventory_movement' AND index_name = 'ix_inventory_movement_company_wh_ts'
+    ) THEN
+        SET @sql := 'CREATE INDEX `ix_inventory_movement_company_wh_ts` ON `inventory_movement` (`company_id`, `warehouse_id`, `timestamp`)';
+        PREPARE stmt FROM @sql; EXECUTE stmt; DEALLOCATE PREPARE stmt;
+    END IF;
+
     -- 5) Default app setting used by cpanel flow
     INSERT INTO app_setting (`key`, `value`, `updated_at`)
     VALUES ('signup_auto_approve', '0', NOW())
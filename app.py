@@ -1,5 +1,6 @@
 from flask import (
     Flask,
+    copy_current_request_context,
     render_template,
     request,
     redirect,
@@ -14,13 +15,12 @@ from flask import (
     Response,
     stream_with_context,
     has_request_context,
+    has_app_context,
 )
 import logging
-from logging.handlers import RotatingFileHandler
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from email.mime.application import MIMEApplication
+from flask.logging import default_handler
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+import atexit
 from flask_wtf import CSRFProtect
 from models import (
     db,
@@ -48,35 +48,49 @@ from models import (
     AuditLog,
     AppSetting,
     RNCRegistry,
+    EmailOutbox,
+    EmailMetricCounter,
+    SqlQueryStat,
+    NotificationCounter,
+    CatalogVersion,
+    InventoryCheckpoint,
     dom_now,
 )
-from io import BytesIO, StringIO
+from io import BytesIO, StringIO, TextIOWrapper
 from urllib.parse import quote_plus, urlparse
 import csv
-try:
-    from openpyxl import Workbook
-except ModuleNotFoundError:  # pragma: no cover
-    Workbook = None
 from datetime import datetime, timedelta
 from pathlib import Path
-from sqlalchemy import and_, extract, func, inspect, or_, case, event, text
-from sqlalchemy.exc import NoSuchTableError
+from sqlalchemy import and_, bindparam, extract, func, inspect, or_, case, event, text
+from sqlalchemy.exc import IntegrityError, NoSuchTableError
 from sqlalchemy.orm import load_only, joinedload
 from sqlalchemy.engine import make_url
 from werkzeug.utils import secure_filename
 from werkzeug.exceptions import HTTPException
 from werkzeug.security import generate_password_hash
+from werkzeug.local import LocalProxy
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+import click
 import os
 import re
 import json
+import math
 import uuid
+import base64
+import socket
 import importlib.util
 import hashlib
+import hmac
 import imghdr
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
 from ai import recommend_products
-from weasy_pdf import generate_pdf, generate_pdf_bytes, generate_service_pdf_bytes
-from account_pdf import generate_account_statement_pdf, generate_account_statement_pdf_bytes
-from functools import wraps
+import inventory
+import ncf_sequence
+import product_search
+from metrics import MetricsRegistry
+from functools import lru_cache, wraps
+from collections import deque
 from auth import auth_bp, generate_reset_token
 from ecf.blueprints.ecf_api import ecf_api_bp
 from ecf.blueprints.ecf_admin import ecf_admin_bp
@@ -100,7 +114,9 @@ import threading
 from queue import Queue as ThreadQueue, Empty
 import time
 import random
+import tempfile
 import unicodedata
+from contextlib import contextmanager
 
 load_dotenv()
 
@@ -125,12 +141,44 @@ def _parse_rnc_line(raw_line: str) -> tuple[str, str] | tuple[None, None]:
     return None, None
 
 
-if os.path.exists(DATA_PATH):
-    with open(DATA_PATH, encoding='utf-8') as f:
-        for row in f:
-            rnc, name = _parse_rnc_line(row)
-            if rnc and name:
-                RNC_DATA[rnc] = name
+_rnc_data_state = {'loaded': False}
+_rnc_data_lock = threading.Lock()
+
+
+def load_rnc_data() -> dict[str, str]:
+    """Load the DGII RNC file into ``RNC_DATA`` on first use.
+
+    Names imported from CPanel in this process win over the file.
+    """
+    if _rnc_data_state['loaded']:
+        return RNC_DATA
+    with _rnc_data_lock:
+        if not _rnc_data_state['loaded']:
+            if os.path.exists(DATA_PATH):
+                with open(DATA_PATH, encoding='utf-8') as f:
+                    for row in f:
+                        rnc, name = _parse_rnc_line(row)
+                        if rnc and name:
+                            RNC_DATA.setdefault(rnc, name)
+            _rnc_data_state['loaded'] = True
+    return RNC_DATA
+
+
+# Startup phases are timed so cold starts on each Passenger worker can be audited.
+_IMPORT_STARTED_AT = time.perf_counter()
+STARTUP_PHASES: list[tuple[str, float]] = []
+
+
+@contextmanager
+def _startup_phase(name: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STARTUP_PHASES.append((name, round((time.perf_counter() - started) * 1000, 1)))
+
+
+FAST_START = str(os.getenv('FAST_START', '0')).strip().lower() in {'1', 'true', 'yes', 'on'}
 
 app = Flask(__name__)
 APP_ENV = os.getenv('APP_ENV', 'development').strip().lower()
@@ -149,6 +197,58 @@ REQUEST_SLOW_ERROR_MS = max(int(os.getenv('SLOW_REQUEST_ERROR_MS', '10000')), RE
 SLOW_QUERY_WARN_MS = max(int(os.getenv('SLOW_QUERY_WARN_MS', '500')), 50)
 ENABLE_ROUTE_PROFILING = str(os.getenv('ENABLE_ROUTE_PROFILING', '0')).strip().lower() in {'1','true','yes','on'}
 _SQL_TIMING_INSTALLED = False
+METRICS_FLUSH_INTERVAL_SEC = max(float(os.getenv('METRICS_FLUSH_INTERVAL_SEC', '5')), 0.5)
+
+# Per-process samples are flushed to METRICS_DIR so /__metrics can sum every worker.
+# Without it the directory is picked on the first flush (see _flush_metrics).
+METRICS = MetricsRegistry(os.getenv('METRICS_DIR') or None, flush_interval=METRICS_FLUSH_INTERVAL_SEC)
+METRICS.describe('tiendix_http_requests_total', 'counter', 'HTTP requests by endpoint, method and status.')
+METRICS.describe('tiendix_http_request_duration_seconds', 'histogram', 'HTTP request latency by endpoint.')
+METRICS.describe('tiendix_sql_queries_total', 'counter', 'SQL statements executed, by endpoint.')
+METRICS.describe('tiendix_sql_query_seconds_total', 'counter', 'Time spent in SQL statements, by endpoint.')
+METRICS.describe('tiendix_pdf_render_seconds', 'histogram', 'PDF render duration by renderer.')
+METRICS.describe('tiendix_db_pool_checked_out', 'gauge', 'SQLAlchemy connections checked out per worker.')
+METRICS.describe('tiendix_db_pool_overflow', 'gauge', 'SQLAlchemy pool overflow per worker.')
+METRICS.describe('tiendix_email_memory_queue_depth', 'gauge', 'Emails waiting in the in-memory fallback queue per worker.')
+
+
+def _timed_pdf_renderer(fn):
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            METRICS.observe('tiendix_pdf_render_seconds', time.perf_counter() - started, renderer=fn.__name__)
+    return wrapper
+
+
+def _lazy_renderer(module_name: str, name: str):
+    """Return ``module_name.name`` as a callable that imports its module on first use.
+
+    The PDF modules pull in fpdf and fontTools, which dominate worker import
+    time; workers that never render a document never pay for them.
+    """
+    def renderer(*args, **kwargs):
+        return getattr(importlib.import_module(module_name), name)(*args, **kwargs)
+    renderer.__name__ = renderer.__qualname__ = name
+    return renderer
+
+
+def _new_workbook():
+    """Return an empty openpyxl ``Workbook``, or ``None`` when openpyxl is missing."""
+    try:
+        from openpyxl import Workbook
+    except ModuleNotFoundError:  # pragma: no cover
+        return None
+    return Workbook()
+
+
+generate_pdf = _timed_pdf_renderer(_lazy_renderer('weasy_pdf', 'generate_pdf'))
+generate_pdf_bytes = _timed_pdf_renderer(_lazy_renderer('weasy_pdf', 'generate_pdf_bytes'))
+generate_service_pdf_bytes = _timed_pdf_renderer(_lazy_renderer('weasy_pdf', 'generate_service_pdf_bytes'))
+generate_account_statement_pdf = _timed_pdf_renderer(_lazy_renderer('account_pdf', 'generate_account_statement_pdf'))
+generate_account_statement_pdf_bytes = _timed_pdf_renderer(_lazy_renderer('account_pdf', 'generate_account_statement_pdf_bytes'))
 
 
 def _json_log(event_name: str, **fields):
@@ -287,11 +387,25 @@ def block_sensitive_paths():
     return None
 
 
+LOG_REQUEST_START_SAMPLE_RATE = min(max(float(os.getenv('LOG_REQUEST_START_SAMPLE_RATE', '1')), 0.0), 1.0)
+LOG_SKIP_PATHS = frozenset(
+    p.strip() for p in os.getenv('LOG_SKIP_PATHS', '/__health').split(',') if p.strip()
+)
+
+
+def _request_log_skipped() -> bool:
+    return request.endpoint == 'static' or request.path in LOG_SKIP_PATHS
+
+
 @app.before_request
 def attach_request_context_log():
     incoming_rid = (request.headers.get('X-Request-ID') or '').strip()
     g.request_id = incoming_rid[:64] if incoming_rid else uuid.uuid4().hex[:12]
     g.request_started_at = time.time()
+    if _request_log_skipped():
+        return
+    if LOG_REQUEST_START_SAMPLE_RATE < 1 and random.random() >= LOG_REQUEST_START_SAMPLE_RATE:
+        return
     _json_log(
         'request_start',
         request_id=g.request_id,
@@ -315,6 +429,10 @@ def log_response_result(response):
     elif duration_ms >= REQUEST_SLOW_WARN_MS:
         level = 'warning'
 
+    if level == 'info' and _request_log_skipped():
+        _record_request_metrics(response, started)
+        return response
+
     payload = {
         'event': 'request_end',
         'request_id': rid,
@@ -330,9 +448,33 @@ def log_response_result(response):
         app.logger.warning(message)
     else:
         app.logger.info(message)
+    _record_request_metrics(response, started)
     return response
 
 
+def _flush_metrics(force: bool = False) -> None:
+    if METRICS.directory is None:
+        # instance/metrics by default; test runs get a throwaway directory instead of the app tree.
+        METRICS.directory = (
+            tempfile.mkdtemp(prefix='tiendix-metrics-') if app.testing
+            else os.path.join(app.instance_path, 'metrics')
+        )
+    METRICS.flush(force=force)
+
+
+def _record_request_metrics(response, started) -> None:
+    endpoint = request.endpoint or 'unmatched'
+    METRICS.inc('tiendix_http_requests_total', method=request.method, endpoint=endpoint, status=response.status_code)
+    if started:
+        METRICS.observe('tiendix_http_request_duration_seconds', time.time() - started, endpoint=endpoint)
+    pool = db.engine.pool if has_app_context() else None
+    if pool is not None and hasattr(pool, 'checkedout'):
+        METRICS.set_gauge('tiendix_db_pool_checked_out', pool.checkedout())
+        METRICS.set_gauge('tiendix_db_pool_overflow', pool.overflow())
+    METRICS.set_gauge('tiendix_email_memory_queue_depth', _email_queue.qsize())
+    _flush_metrics()
+
+
 @app.errorhandler(Exception)
 def handle_unexpected_error(exc):
     if isinstance(exc, HTTPException):
@@ -344,10 +486,42 @@ def handle_unexpected_error(exc):
 
 if not os.path.exists('logs'):
     os.makedirs('logs')
-file_handler = RotatingFileHandler('logs/app.log', maxBytes=10240, backupCount=10)
+LOG_MAX_BYTES = max(int(os.getenv('LOG_MAX_BYTES', 10 * 1024 * 1024)), 64 * 1024)
+LOG_BACKUP_COUNT = max(int(os.getenv('LOG_BACKUP_COUNT', 10)), 1)
+file_handler = RotatingFileHandler('logs/app.log', maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT)
 file_handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'))
 file_handler.setLevel(logging.INFO)
-app.logger.addHandler(file_handler)
+
+# Requests only enqueue log records; a listener thread does the file/stderr I/O.
+_log_queue = ThreadQueue(-1)
+_log_output_handlers = [file_handler]
+if default_handler in app.logger.handlers:
+    app.logger.removeHandler(default_handler)
+    _log_output_handlers.append(default_handler)
+_log_listener = None
+
+
+_log_queue_handler = QueueHandler(_log_queue)
+
+
+def _start_log_listener(fresh_queue: bool = False) -> None:
+    global _log_listener, _log_queue
+    if fresh_queue:
+        # Records queued by the parent before fork() are the parent's to write.
+        _log_queue = ThreadQueue(-1)
+        _log_queue_handler.queue = _log_queue
+    _log_listener = QueueListener(_log_queue, *_log_output_handlers, respect_handler_level=True)
+    _log_listener.start()
+
+
+def _stop_log_listener() -> None:
+    if _log_listener is not None and _log_listener._thread is not None:
+        _log_listener.stop()
+
+
+_start_log_listener()
+atexit.register(_stop_log_listener)
+app.logger.addHandler(_log_queue_handler)
 app.logger.setLevel(logging.INFO)
 app.logger.info('Tiendix startup')
 if database_url:
@@ -357,6 +531,155 @@ else:
     app.logger.info('Database configuration loaded from default config')
 
 
+SQL_FINGERPRINT_MIN_MS = max(float(os.getenv('SQL_FINGERPRINT_MIN_MS', '5')), 0.0)
+SQL_STATS_FLUSH_SEC = max(int(os.getenv('SQL_STATS_FLUSH_SEC', '60')), 5)
+SQL_STATS_RETENTION_DAYS = max(int(os.getenv('SQL_STATS_RETENTION_DAYS', '7')), 1)
+SQL_STATS_MAX_FINGERPRINTS = 2000
+_SQL_P95_SAMPLE_SIZE = 256
+
+_SQL_STRING_LITERAL_RE = re.compile(r"'(?:[^'\\]|\\.|'')*'")
+_SQL_NUMBER_RE = re.compile(r'(?<![\w.$])-?\d+(?:\.\d+)?(?:e[+-]?\d+)?\b', re.IGNORECASE)
+_SQL_PLACEHOLDER_RE = re.compile(r'%s|%\(\w+\)s|(?<!:):\w+|\?')
+_SQL_IN_LIST_RE = re.compile(r'\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)', re.IGNORECASE)
+_SQL_VALUES_LIST_RE = re.compile(r'(\(\s*\?(?:\s*,\s*\?)*\s*\))(?:\s*,\s*\(\s*\?(?:\s*,\s*\?)*\s*\))+')
+
+_sql_stats: dict[str, dict] = {}
+_sql_stats_lock = threading.Lock()
+_sql_stats_state = {'window_start': None, 'last_flush': time.time()}
+_sql_stats_local = threading.local()
+
+
+@lru_cache(maxsize=2048)
+def sql_fingerprint(statement: str) -> tuple[str, str]:
+    """Normalize ``statement`` so queries differing only in literals share one key.
+
+    String and numeric literals and driver placeholders become ``?``; IN-lists
+    and multi-row VALUES collapse to a single ``(?...)`` entry.
+    Returns ``(hash, normalized_sql)``.
+    """
+    normalized = ' '.join((statement or '').split())
+    normalized = _SQL_STRING_LITERAL_RE.sub('?', normalized)
+    normalized = _SQL_PLACEHOLDER_RE.sub('?', normalized)
+    normalized = _SQL_NUMBER_RE.sub('?', normalized)
+    normalized = _SQL_IN_LIST_RE.sub('IN (?...)', normalized)
+    normalized = _SQL_VALUES_LIST_RE.sub(r'\1, ...', normalized)
+    normalized = normalized[:2000]
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()[:16], normalized
+
+
+def _record_sql_stat(statement: str, duration_ms: float, request_id: str | None) -> None:
+    fingerprint, normalized = sql_fingerprint(statement)
+    with _sql_stats_lock:
+        entry = _sql_stats.get(fingerprint)
+        if entry is None:
+            if len(_sql_stats) >= SQL_STATS_MAX_FINGERPRINTS:
+                return
+            entry = _sql_stats[fingerprint] = {
+                'statement': normalized,
+                'calls': 0,
+                'total_ms': 0.0,
+                'max_ms': 0.0,
+                'samples': deque(maxlen=_SQL_P95_SAMPLE_SIZE),
+                'sample_request_id': None,
+            }
+            if _sql_stats_state['window_start'] is None:
+                _sql_stats_state['window_start'] = dom_now()
+        entry['calls'] += 1
+        entry['total_ms'] += duration_ms
+        entry['samples'].append(duration_ms)
+        if duration_ms >= entry['max_ms']:
+            entry['max_ms'] = duration_ms
+            entry['sample_request_id'] = request_id
+
+
+def _p95(values) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, math.ceil(0.95 * len(ordered)) - 1)]
+
+
+def flush_sql_stats(force: bool = False) -> int:
+    """Write this worker's aggregated fingerprints to ``sql_query_stat``.
+
+    Runs at most every ``SQL_STATS_FLUSH_SEC`` unless ``force``; returns the
+    number of rows written. Statements issued by the flush are not recorded.
+    """
+    now_ts = time.time()
+    if not force and now_ts - _sql_stats_state['last_flush'] < SQL_STATS_FLUSH_SEC:
+        return 0
+    with _sql_stats_lock:
+        _sql_stats_state['last_flush'] = now_ts
+        pending = dict(_sql_stats)
+        window_start = _sql_stats_state['window_start'] or dom_now()
+        _sql_stats.clear()
+        _sql_stats_state['window_start'] = None
+    if not pending:
+        return 0
+    window_end = dom_now()
+    worker = f'{socket.gethostname()}:{os.getpid()}'[:80]
+    rows = [
+        {
+            'fingerprint': fingerprint,
+            'statement': entry['statement'],
+            'calls': entry['calls'],
+            'total_ms': round(entry['total_ms'], 3),
+            'max_ms': round(entry['max_ms'], 3),
+            'p95_ms': round(_p95(entry['samples']), 3),
+            'sample_request_id': entry['sample_request_id'],
+            'worker': worker,
+            'window_start': window_start,
+            'window_end': window_end,
+        }
+        for fingerprint, entry in pending.items()
+    ]
+    _sql_stats_local.flushing = True
+    try:
+        with db.engine.begin() as conn:
+            conn.execute(SqlQueryStat.__table__.insert(), rows)
+            conn.execute(
+                SqlQueryStat.__table__.delete().where(
+                    SqlQueryStat.window_end < window_end - timedelta(days=SQL_STATS_RETENTION_DAYS)
+                )
+            )
+    except Exception as exc:
+        app.logger.warning('SQL stats flush failed: %s', exc)
+        return 0
+    finally:
+        _sql_stats_local.flushing = False
+    return len(rows)
+
+
+_sql_stats_thread = None
+_sql_stats_thread_lock = threading.Lock()
+
+
+def _sql_stats_loop(app_obj) -> None:  # pragma: no cover - background helper
+    while True:
+        time.sleep(SQL_STATS_FLUSH_SEC)
+        try:
+            with app_obj.app_context():
+                flush_sql_stats()
+        except Exception as exc:
+            app_obj.logger.warning('SQL stats flush failed: %s', exc)
+
+
+@app.before_request
+def start_sql_stats_flusher():
+    # Requests only aggregate in memory; this thread owns the periodic write to sql_query_stat.
+    global _sql_stats_thread
+    if app.testing:
+        return
+    if _sql_stats_thread is not None and _sql_stats_thread.is_alive():
+        return
+    with _sql_stats_thread_lock:
+        if _sql_stats_thread is None or not _sql_stats_thread.is_alive():
+            _sql_stats_thread = threading.Thread(
+                target=_sql_stats_loop, args=(current_app._get_current_object(),), daemon=True, name='sql-stats-flush'
+            )
+            _sql_stats_thread.start()
+
+
 def _install_sql_timing_hooks():
     global _SQL_TIMING_INSTALLED
     if _SQL_TIMING_INSTALLED:
@@ -374,15 +697,24 @@ def _install_sql_timing_hooks():
         started = stack.pop() if stack else None
         if started is None:
             return
-        duration_ms = int((time.time() - started) * 1000)
+        elapsed = time.time() - started
+        duration_ms = int(elapsed * 1000)
+        endpoint = (request.endpoint or 'unmatched') if has_request_context() else '-'
+        METRICS.inc('tiendix_sql_queries_total', endpoint=endpoint)
+        METRICS.inc('tiendix_sql_query_seconds_total', elapsed, endpoint=endpoint)
+        if getattr(_sql_stats_local, 'flushing', False):
+            return
+        rid = getattr(g, 'request_id', '-') if has_request_context() else '-'
+        if elapsed * 1000 >= SQL_FINGERPRINT_MIN_MS:
+            _record_sql_stat(statement, elapsed * 1000, rid)
         if duration_ms >= SLOW_QUERY_WARN_MS:
-            rid = getattr(g, 'request_id', '-') if has_request_context() else '-'
-            stmt = ' '.join((statement or '').split())[:500]
+            fingerprint, stmt = sql_fingerprint(statement)
             app.logger.warning(json.dumps({
                 'event': 'slow_query',
                 'request_id': rid,
                 'duration_ms': duration_ms,
-                'statement': stmt,
+                'fingerprint': fingerprint,
+                'statement': stmt[:500],
             }, ensure_ascii=False, default=str))
 
     _SQL_TIMING_INSTALLED = True
@@ -397,10 +729,22 @@ MAIL_RETRY_DELAY_SEC = float(os.getenv('MAIL_RETRY_DELAY_SEC', 1))
 MAIL_CONNECT_TIMEOUT_SEC = float(os.getenv('MAIL_CONNECT_TIMEOUT_SEC', 8))
 LOW_STOCK_SCAN_INTERVAL_SEC = int(os.getenv('LOW_STOCK_SCAN_INTERVAL_SEC', 1800))
 LOW_STOCK_SCAN_MAX_ITEMS = int(os.getenv('LOW_STOCK_SCAN_MAX_ITEMS', 200))
-NOTIFICATION_REFRESH_INTERVAL_SEC = int(os.getenv('NOTIFICATION_REFRESH_INTERVAL_SEC', 120))
-ENABLE_LOW_STOCK_SCAN = str(os.getenv('ENABLE_LOW_STOCK_SCAN', '0')).strip().lower() in {'1','true','yes','on'}
+ENABLE_LOW_STOCK_SCAN = str(os.getenv('ENABLE_LOW_STOCK_SCAN', '1')).strip().lower() in {'1','true','yes','on'}
 ENABLE_NOTIFICATIONS_CONTEXT = str(os.getenv('ENABLE_NOTIFICATIONS_CONTEXT', '0')).strip().lower() in {'1','true','yes','on'}
 ANNOUNCEMENT_REFRESH_INTERVAL_SEC = int(os.getenv('ANNOUNCEMENT_REFRESH_INTERVAL_SEC', 120))
+TENANT_CACHE_TTL_SEC = max(float(os.getenv('TENANT_CACHE_TTL_SEC', 0) or 0), 0.0)
+INVENTORY_IMPORT_CHUNK_SIZE = max(int(os.getenv('INVENTORY_IMPORT_CHUNK_SIZE', 1000)), 1)
+PRODUCT_IMPORT_CHUNK_SIZE = max(int(os.getenv('PRODUCT_IMPORT_CHUNK_SIZE', 1000)), 1)
+PRODUCT_SEARCH_MAX_RESULTS = 50
+PRODUCT_SEARCH_MAX_COMPANIES = max(int(os.getenv('PRODUCT_SEARCH_MAX_COMPANIES', 64)), 1)
+INVENTORY_ROTATION_DAYS = max(int(os.getenv('INVENTORY_ROTATION_DAYS', 90)), 1)
+SLOW_MOVER_DAYS = max(int(os.getenv('SLOW_MOVER_DAYS', 180)), 1)
+SLOW_MOVER_LIMIT = 20
+NCF_BLOCK_SIZE = max(int(os.getenv('NCF_BLOCK_SIZE', 1)), 1)
+REORDER_HISTORY_DAYS = max(int(os.getenv('REORDER_HISTORY_DAYS', 90)), 7)
+REORDER_LEAD_TIME_DAYS = max(float(os.getenv('REORDER_LEAD_TIME_DAYS', 7)), 0.0)
+REORDER_SERVICE_Z = max(float(os.getenv('REORDER_SERVICE_Z', 1.65)), 0.0)
+IMPORT_MAX_REPORTED_ERRORS = max(int(os.getenv('IMPORT_MAX_REPORTED_ERRORS', 200)), 1)
 
 _active_announcement_cache = {'ts': 0, 'obj': None}
 
@@ -431,6 +775,16 @@ def _env_bool(name: str, default: bool = False) -> bool:
 MAIL_USE_SSL = _env_bool('MAIL_USE_SSL', False)
 MAIL_USE_TLS = _env_bool('MAIL_USE_TLS', True)
 MAIL_ENABLED = _env_bool('MAIL_ENABLED', True)
+MAIL_MAX_MESSAGES_PER_CONNECTION = max(int(os.getenv('MAIL_MAX_MESSAGES_PER_CONNECTION', 50)), 1)
+MAIL_CONNECTION_IDLE_SEC = float(os.getenv('MAIL_CONNECTION_IDLE_SEC', 30))
+MAIL_NOOP_AFTER_SEC = float(os.getenv('MAIL_NOOP_AFTER_SEC', 5))
+EMAIL_DISPATCHER_THREADS = max(int(os.getenv('EMAIL_DISPATCHER_THREADS', 2)), 0)
+EMAIL_OUTBOX_BATCH_SIZE = max(int(os.getenv('EMAIL_OUTBOX_BATCH_SIZE', 10)), 1)
+EMAIL_OUTBOX_POLL_SEC = max(float(os.getenv('EMAIL_OUTBOX_POLL_SEC', 2)), 0.1)
+EMAIL_OUTBOX_LEASE_SEC = max(int(os.getenv('EMAIL_OUTBOX_LEASE_SEC', 120)), 10)
+EMAIL_OUTBOX_MAX_ATTEMPTS = max(int(os.getenv('EMAIL_OUTBOX_MAX_ATTEMPTS', 5)), 1)
+EMAIL_OUTBOX_BACKOFF_SEC = max(float(os.getenv('EMAIL_OUTBOX_BACKOFF_SEC', 30)), 1.0)
+EMAIL_OUTBOX_BACKOFF_MAX_SEC = max(float(os.getenv('EMAIL_OUTBOX_BACKOFF_MAX_SEC', 3600)), 1.0)
 
 EMAIL_METRICS = {
     'queued': 0,
@@ -438,20 +792,111 @@ EMAIL_METRICS = {
     'failed': 0,
     'retries': 0,
     'skipped': 0,
+    'connections': 0,
+    'reconnects': 0,
 }
 _email_queue = ThreadQueue()
 
 
-def _deliver_email(to, subject, html, attachments=None, max_retries=None):
-    if not MAIL_ENABLED:
-        EMAIL_METRICS['skipped'] += 1
-        app.logger.warning('Email disabled by MAIL_ENABLED=0; skipping send to %s', to)
-        return
+def _open_smtp():
+    """Connect, negotiate TLS and log in using the configured MAIL_* settings."""
+    import smtplib
 
-    if not MAIL_SERVER or not MAIL_DEFAULT_SENDER:
-        EMAIL_METRICS['skipped'] += 1
-        app.logger.warning('Email settings missing; skipping send to %s', to)
-        return
+    smtp_cls = smtplib.SMTP_SSL if MAIL_USE_SSL else smtplib.SMTP
+    s = smtp_cls(MAIL_SERVER, MAIL_PORT, timeout=MAIL_CONNECT_TIMEOUT_SEC)
+    try:
+        if MAIL_USE_TLS and not MAIL_USE_SSL:
+            s.starttls()
+        if MAIL_USERNAME and MAIL_PASSWORD:
+            s.login(MAIL_USERNAME, MAIL_PASSWORD)
+    except Exception:
+        _close_smtp(s)
+        raise
+    EMAIL_METRICS['connections'] += 1
+    return s
+
+
+def _close_smtp(s) -> None:
+    try:
+        s.quit()
+    except Exception:
+        try:
+            s.close()
+        except Exception:
+            pass
+
+
+class _SMTPConnection:
+    """Long-lived SMTP session reused by the email worker across queued messages.
+
+    The session is health-checked with NOOP after ``MAIL_NOOP_AFTER_SEC`` of
+    inactivity, closed after ``MAIL_CONNECTION_IDLE_SEC`` and recycled after
+    ``MAIL_MAX_MESSAGES_PER_CONNECTION`` messages.
+    """
+
+    def __init__(self):
+        self._smtp = None
+        self._sent = 0
+        self._last_used = 0.0
+
+    @property
+    def is_open(self) -> bool:
+        return self._smtp is not None
+
+    def close(self) -> None:
+        if self._smtp is not None:
+            _close_smtp(self._smtp)
+        self._smtp = None
+        self._sent = 0
+
+    def close_if_idle(self) -> None:
+        if self._smtp is not None and time.time() - self._last_used >= MAIL_CONNECTION_IDLE_SEC:
+            self.close()
+
+    def _ensure_open(self):
+        self.close_if_idle()
+        if self._smtp is not None and self._sent >= MAIL_MAX_MESSAGES_PER_CONNECTION:
+            self.close()
+        if self._smtp is not None and time.time() - self._last_used >= MAIL_NOOP_AFTER_SEC:
+            try:
+                status = self._smtp.noop()[0]
+            except Exception:
+                status = None
+            if status != 250:
+                self.close()
+                EMAIL_METRICS['reconnects'] += 1
+        if self._smtp is None:
+            self._smtp = _open_smtp()
+            self._sent = 0
+        return self._smtp
+
+    def sendmail(self, sender, recipients, message: str) -> None:
+        import smtplib
+
+        smtp = self._ensure_open()
+        try:
+            smtp.sendmail(sender, recipients, message)
+        except smtplib.SMTPServerDisconnected:
+            # The server dropped an idle session; reconnect once and resend transparently.
+            self.close()
+            EMAIL_METRICS['reconnects'] += 1
+            smtp = self._ensure_open()
+            smtp.sendmail(sender, recipients, message)
+        except (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError):
+            # Message-level rejection; the session itself is still usable.
+            self._last_used = time.time()
+            raise
+        except Exception:
+            self.close()
+            raise
+        self._sent += 1
+        self._last_used = time.time()
+
+
+def _build_email_message(to, subject, html, attachments=None) -> str:
+    from email.mime.application import MIMEApplication
+    from email.mime.multipart import MIMEMultipart
+    from email.mime.text import MIMEText
 
     msg = MIMEMultipart()
     msg['Subject'] = subject
@@ -463,17 +908,29 @@ def _deliver_email(to, subject, html, attachments=None, max_retries=None):
         part = MIMEApplication(data, Name=filename)
         part['Content-Disposition'] = f'attachment; filename="{filename}"'
         msg.attach(part)
+    return msg.as_string()
+
+
+def _deliver_email(to, subject, html, attachments=None, max_retries=None, connection=None):
+    if not MAIL_ENABLED:
+        EMAIL_METRICS['skipped'] += 1
+        app.logger.warning('Email disabled by MAIL_ENABLED=0; skipping send to %s', to)
+        return
 
+    if not MAIL_SERVER or not MAIL_DEFAULT_SENDER:
+        EMAIL_METRICS['skipped'] += 1
+        app.logger.warning('Email settings missing; skipping send to %s', to)
+        return
+
+    message = _build_email_message(to, subject, html, attachments)
     retries = MAIL_MAX_RETRIES if max_retries is None else max(1, int(max_retries))
     for attempt in range(1, retries + 1):
         try:
-            smtp_cls = smtplib.SMTP_SSL if MAIL_USE_SSL else smtplib.SMTP
-            with smtp_cls(MAIL_SERVER, MAIL_PORT, timeout=MAIL_CONNECT_TIMEOUT_SEC) as s:
-                if MAIL_USE_TLS and not MAIL_USE_SSL:
-                    s.starttls()
-                if MAIL_USERNAME and MAIL_PASSWORD:
-                    s.login(MAIL_USERNAME, MAIL_PASSWORD)
-                s.sendmail(MAIL_DEFAULT_SENDER, [to], msg.as_string())
+            if connection is not None:
+                connection.sendmail(MAIL_DEFAULT_SENDER, [to], message)
+            else:
+                with _open_smtp() as s:
+                    s.sendmail(MAIL_DEFAULT_SENDER, [to], message)
             EMAIL_METRICS['sent'] += 1
             return
         except Exception as e:  # pragma: no cover
@@ -487,29 +944,393 @@ def _deliver_email(to, subject, html, attachments=None, max_retries=None):
 
 
 def _email_worker():  # pragma: no cover - background helper
+    connection = _SMTPConnection()
     while True:
         try:
             payload = _email_queue.get(timeout=1)
         except Empty:
+            connection.close_if_idle()
             continue
         if payload is None:
+            connection.close()
             break
-        _deliver_email(*payload)
-        _email_queue.task_done()
+        try:
+            _deliver_email(*payload, connection=connection)
+        finally:
+            _email_queue.task_done()
+
+
+_email_worker_thread = None
+_email_dispatcher_threads: list[threading.Thread] = []
+_email_dispatcher_lock = threading.Lock()
+_email_outbox_wakeup = threading.Event()
+
+
+def _start_fallback_email_worker() -> None:
+    """Start the in-memory queue worker used when the outbox table is unavailable."""
+    global _email_worker_thread
+    with _email_dispatcher_lock:
+        if _email_worker_thread is None or not _email_worker_thread.is_alive():
+            _email_worker_thread = threading.Thread(target=_email_worker, daemon=True, name='email-fallback')
+            _email_worker_thread.start()
+
+
+def _add_email_counters(conn, deltas: dict[str, int]) -> None:
+    table = EmailMetricCounter.__table__
+    for name, delta in deltas.items():
+        updated = conn.execute(
+            table.update().where(table.c.name == name).values(value=table.c.value + delta, updated_at=dom_now())
+        ).rowcount
+        if not updated:
+            try:
+                # Savepoint so a concurrent first insert does not abort the caller's transaction.
+                with conn.begin_nested():
+                    conn.execute(table.insert().values(name=name, value=delta, updated_at=dom_now()))
+            except IntegrityError:
+                conn.execute(
+                    table.update().where(table.c.name == name).values(value=table.c.value + delta, updated_at=dom_now())
+                )
+
+
+def _persist_email_counters(**deltas: int) -> None:
+    """Add ``deltas`` to EMAIL_METRICS and to the shared ``email_metric_counter`` rows.
+
+    Runs on its own connection so the caller's session is never committed or rolled back.
+    """
+    deltas = {name: delta for name, delta in deltas.items() if delta}
+    for name, delta in deltas.items():
+        EMAIL_METRICS[name] = EMAIL_METRICS.get(name, 0) + delta
+    last_error = None
+    for _ in range(2):
+        try:
+            with db.engine.begin() as conn:
+                _add_email_counters(conn, deltas)
+            return
+        except Exception as exc:
+            # A concurrent worker may have inserted the same counter first; retry as an UPDATE.
+            last_error = exc
+    app.logger.warning('Email counters could not be persisted: %s', last_error)
+
+
+def email_outbox_stats() -> dict[str, int]:
+    """Persisted email counters plus current outbox depth per status."""
+    counters = {row.name: int(row.value or 0) for row in EmailMetricCounter.query.all()}
+    depth = dict(
+        db.session.query(EmailOutbox.status, func.count(EmailOutbox.id)).group_by(EmailOutbox.status).all()
+    )
+    stats = {name: counters.get(name, 0) for name in ('queued', 'sent', 'retries', 'failed')}
+    for status in ('pending', 'sending'):
+        stats[status] = int(depth.get(status, 0))
+    return stats
+
+
+def _email_outbox_backoff(attempts: int) -> float:
+    delay = EMAIL_OUTBOX_BACKOFF_SEC * (2 ** max(attempts - 1, 0)) * random.uniform(0.8, 1.2)
+    return min(delay, EMAIL_OUTBOX_BACKOFF_MAX_SEC)
+
 
+def _email_worker_id() -> str:
+    return f'{socket.gethostname()}:{os.getpid()}:{threading.current_thread().name}'[:80]
 
-_email_worker_thread = threading.Thread(target=_email_worker, daemon=True)
-_email_worker_thread.start()
+
+@event.listens_for(db.session, 'after_flush')
+def _mark_session_writes(session, flush_context):
+    session.info['has_writes'] = True
+
+
+@event.listens_for(db.session, 'do_orm_execute')
+def _mark_session_dml(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info['has_writes'] = True
+
+
+@event.listens_for(db.session, 'after_commit')
+def _release_committed_outbox_rows(session):
+    session.info.pop('has_writes', None)
+    queued = session.info.pop('email_outbox_queued', 0)
+    if queued:
+        # Own short connection: the shared counter row is never held by a request's transaction.
+        _persist_email_counters(queued=queued)
+        _email_outbox_wakeup.set()
+
+
+@event.listens_for(db.session, 'after_transaction_end')
+def _forget_uncommitted_outbox_rows(session, transaction):
+    # Rollback or close of the outermost transaction; after_commit already ran on commit.
+    if transaction.parent is None:
+        session.info.pop('has_writes', None)
+        session.info.pop('email_outbox_queued', None)
+
+
+def _session_has_pending_writes() -> bool:
+    """True while the request's session holds writes that are not committed yet."""
+    session = db.session
+    return bool(session.new or session.dirty or session.deleted or session.info.get('has_writes'))
+
+
+def _enqueue_email(to, subject, html, attachments=None) -> int:
+    """Store an outbox row and return its id.
+
+    When the caller's session has uncommitted writes, the row is written in
+    that same transaction: it is only sent if the caller commits, and a
+    rollback (a failed order or quotation save) discards it too. Otherwise
+    it is committed on its own connection, so sending mail outside a unit of
+    work neither commits nor discards anything of the caller's.
+    """
+    encoded = None
+    if attachments:
+        encoded = json.dumps([
+            {
+                'filename': filename,
+                'data': base64.b64encode(data.encode('utf-8') if isinstance(data, str) else data).decode('ascii'),
+            }
+            for filename, data in attachments
+        ])
+    insert_row = EmailOutbox.__table__.insert().values(
+        company_id=current_company_id(),
+        to_address=to,
+        subject=(subject or '')[:255],
+        html=html,
+        attachments=encoded,
+        max_attempts=EMAIL_OUTBOX_MAX_ATTEMPTS,
+        next_attempt_at=dom_now(),
+    )
+    if _session_has_pending_writes():
+        row_id = db.session.execute(insert_row).inserted_primary_key[0]
+        # Counted and announced to the dispatchers once the caller commits.
+        db.session.info['email_outbox_queued'] = db.session.info.get('email_outbox_queued', 0) + 1
+        return row_id
+    with db.engine.begin() as conn:
+        row_id = conn.execute(insert_row).inserted_primary_key[0]
+        _add_email_counters(conn, {'queued': 1})
+    EMAIL_METRICS['queued'] = EMAIL_METRICS.get('queued', 0) + 1
+    _email_outbox_wakeup.set()
+    return row_id
+
+
+def _claim_email_outbox(limit: int, worker_id: str) -> list[int]:
+    """Lease up to ``limit`` due rows for ``worker_id``.
+
+    Each row is claimed with a conditional UPDATE so concurrent dispatchers
+    (threads or ``flask email_worker`` processes) never send the same email
+    twice. Rows whose lease expired (worker crashed mid-send) are reclaimed;
+    a batch can outlive a lease behind a slow SMTP server, so
+    :func:`_renew_email_lease` re-checks it before each send.
+    """
+    now = dom_now()
+    claimable = or_(
+        and_(EmailOutbox.status == 'pending', EmailOutbox.next_attempt_at <= now),
+        and_(EmailOutbox.status == 'sending', EmailOutbox.locked_until < now),
+    )
+    candidate_ids = [
+        row_id for (row_id,) in db.session.query(EmailOutbox.id)
+        .filter(claimable)
+        .order_by(EmailOutbox.next_attempt_at, EmailOutbox.id)
+        .limit(limit)
+        .all()
+    ]
+    lease_until = now + timedelta(seconds=EMAIL_OUTBOX_LEASE_SEC)
+    claimed = []
+    for row_id in candidate_ids:
+        updated = EmailOutbox.query.filter(EmailOutbox.id == row_id, claimable).update(
+            {
+                EmailOutbox.status: 'sending',
+                EmailOutbox.locked_by: worker_id,
+                EmailOutbox.locked_until: lease_until,
+                EmailOutbox.attempts: EmailOutbox.attempts + 1,
+            },
+            synchronize_session=False,
+        )
+        if updated:
+            claimed.append(row_id)
+    db.session.commit()
+    return claimed
+
+
+def _renew_email_lease(row_id: int, worker_id: str) -> bool:
+    """Extend ``worker_id``'s lease on ``row_id`` if it still holds an unexpired one.
+
+    Called right before ``sendmail``: a lease that lapsed while earlier rows of
+    the batch were being sent may already be reclaimed elsewhere, so the row
+    is skipped instead of sent a second time.
+    """
+    now = dom_now()
+    renewed = EmailOutbox.query.filter(
+        EmailOutbox.id == row_id,
+        EmailOutbox.status == 'sending',
+        EmailOutbox.locked_by == worker_id,
+        EmailOutbox.locked_until >= now,
+    ).update({EmailOutbox.locked_until: now + timedelta(seconds=EMAIL_OUTBOX_LEASE_SEC)}, synchronize_session=False)
+    db.session.commit()
+    return bool(renewed)
+
+
+def _dispatch_outbox_email(row_id: int, worker_id: str, connection: _SMTPConnection) -> str | None:
+    row = db.session.get(EmailOutbox, row_id)
+    if row is None or row.locked_by != worker_id:
+        return None
+    error = None
+    try:
+        if not MAIL_ENABLED:
+            raise RuntimeError('MAIL_ENABLED=0')
+        if not MAIL_SERVER or not MAIL_DEFAULT_SENDER:
+            raise RuntimeError('Email settings missing')
+        attachments = [
+            (item['filename'], base64.b64decode(item['data']))
+            for item in json.loads(row.attachments or '[]')
+        ]
+        message = _build_email_message(row.to_address, row.subject, row.html, attachments)
+        if not _renew_email_lease(row_id, worker_id):
+            return None
+        connection.sendmail(MAIL_DEFAULT_SENDER, [row.to_address], message)
+    except Exception as exc:
+        error = (str(exc) or exc.__class__.__name__)[:500]
+
+    now = dom_now()
+    values = {EmailOutbox.locked_by: None, EmailOutbox.locked_until: None, EmailOutbox.last_error: error}
+    if error is None:
+        outcome, counter = 'sent', 'sent'
+        values.update({EmailOutbox.status: 'sent', EmailOutbox.sent_at: now})
+    elif row.attempts >= row.max_attempts:
+        outcome, counter = 'failed', 'failed'
+        values[EmailOutbox.status] = 'failed'
+    else:
+        outcome, counter = 'retried', 'retries'
+        values.update({
+            EmailOutbox.status: 'pending',
+            EmailOutbox.next_attempt_at: now + timedelta(seconds=_email_outbox_backoff(row.attempts)),
+        })
+    # Only the current lease holder may finalize the row.
+    updated = EmailOutbox.query.filter_by(id=row_id, locked_by=worker_id).update(values, synchronize_session=False)
+    db.session.commit()
+    if not updated:
+        return None
+    if error is not None:
+        log = app.logger.error if outcome == 'failed' else app.logger.warning
+        log('Email outbox %s to %s failed (attempt %s/%s): %s', row_id, row.to_address, row.attempts, row.max_attempts, error)
+    _persist_email_counters(**{counter: 1})
+    return outcome
+
+
+def process_email_outbox(limit: int | None = None, worker_id: str | None = None, connection=None) -> dict[str, int]:
+    """Claim a batch of due outbox emails and attempt each one once."""
+    worker_id = worker_id or _email_worker_id()
+    owns_connection = connection is None
+    connection = connection or _SMTPConnection()
+    summary = {'claimed': 0, 'sent': 0, 'retried': 0, 'failed': 0}
+    try:
+        claimed = _claim_email_outbox(limit or EMAIL_OUTBOX_BATCH_SIZE, worker_id)
+        summary['claimed'] = len(claimed)
+        for row_id in claimed:
+            outcome = _dispatch_outbox_email(row_id, worker_id, connection)
+            if outcome:
+                summary[outcome] += 1
+    finally:
+        if owns_connection:
+            connection.close()
+    return summary
+
+
+def _email_dispatcher_loop(app_obj) -> None:  # pragma: no cover - background helper
+    worker_id = _email_worker_id()
+    connection = _SMTPConnection()
+    while True:
+        claimed = 0
+        try:
+            with app_obj.app_context():
+                claimed = process_email_outbox(worker_id=worker_id, connection=connection)['claimed']
+        except Exception as exc:
+            app_obj.logger.warning('Email dispatcher iteration failed: %s', exc)
+        if claimed:
+            continue
+        connection.close_if_idle()
+        if _email_outbox_wakeup.wait(EMAIL_OUTBOX_POLL_SEC):
+            _email_outbox_wakeup.clear()
+
+
+def _ensure_email_dispatcher(app_obj=None, threads: int | None = None) -> int:
+    """Start the in-process outbox dispatcher threads if they are not running.
+
+    ``EMAIL_DISPATCHER_THREADS=0`` disables them so a separate
+    ``flask email_worker`` process owns delivery. Tests never start threads.
+    """
+    app_obj = app_obj or current_app._get_current_object()
+    count = EMAIL_DISPATCHER_THREADS if threads is None else threads
+    if app_obj.testing or count <= 0:
+        return 0
+    with _email_dispatcher_lock:
+        alive = [t for t in _email_dispatcher_threads if t.is_alive()]
+        for n in range(len(alive), count):
+            t = threading.Thread(target=_email_dispatcher_loop, args=(app_obj,), daemon=True, name=f'email-dispatch-{n}')
+            t.start()
+            alive.append(t)
+        _email_dispatcher_threads[:] = alive
+        return len(alive)
+
+
+@app.before_request
+def start_email_dispatcher():
+    # Picks up rows left pending by a previous process as soon as traffic arrives.
+    # Threads that died (e.g. an uncaught error) no longer count, so they get replaced.
+    if sum(1 for t in _email_dispatcher_threads if t.is_alive()) < EMAIL_DISPATCHER_THREADS:
+        _ensure_email_dispatcher()
+
+
+@app.cli.command('email_worker')
+@click.option('--threads', default=None, type=int, help='Hilos de envío (default EMAIL_DISPATCHER_THREADS).')
+@click.option('--once', is_flag=True, help='Procesa los correos pendientes y termina (cron/cPanel).')
+@click.option('--limit', default=None, type=int, help='Tamaño de lote por reclamo.')
+def email_worker_command(threads, once, limit):
+    """Despacha los correos pendientes de email_outbox."""
+    if once:
+        totals = {'claimed': 0, 'sent': 0, 'retried': 0, 'failed': 0}
+        connection = _SMTPConnection()
+        try:
+            while True:
+                summary = process_email_outbox(limit=limit, connection=connection)
+                for key, value in summary.items():
+                    totals[key] += value
+                if not summary['claimed']:
+                    break
+        finally:
+            connection.close()
+        click.echo('email outbox processing')
+        for key, value in totals.items():
+            click.echo(f'{key + ":":<12} {value}')
+        click.echo(f'{"pending:":<12} {email_outbox_stats()["pending"]}')
+        return
+    started = _ensure_email_dispatcher(current_app._get_current_object(), threads=max(threads or EMAIL_DISPATCHER_THREADS, 1))
+    click.echo(f'email worker running with {started} thread(s); Ctrl+C to stop')
+    try:
+        while True:
+            time.sleep(EMAIL_OUTBOX_POLL_SEC)
+    except KeyboardInterrupt:  # pragma: no cover - interactive stop
+        pass
 
 
 def send_email(to, subject, html, attachments=None, asynchronous=True, max_retries=None):
+    """Send an email now or hand it to the durable outbox.
+
+    Asynchronous emails are stored in ``email_outbox`` and delivered by the
+    dispatcher threads (or ``flask email_worker``) with exponential backoff,
+    so a restart does not lose them. ``max_retries`` only applies to
+    synchronous sends; outbox rows use ``EMAIL_OUTBOX_MAX_ATTEMPTS``.
+    """
     if not MAIL_ENABLED:
         EMAIL_METRICS['skipped'] += 1
         app.logger.warning('Email disabled by MAIL_ENABLED=0; skipping queue/send to %s', to)
         return
 
     if asynchronous:
+        if has_app_context():
+            try:
+                _enqueue_email(to, subject, html, attachments)
+                _ensure_email_dispatcher()
+                return
+            except Exception as exc:
+                app.logger.warning('Email outbox unavailable (%s); using in-memory queue for %s', exc, to)
         EMAIL_METRICS['queued'] += 1
+        _start_fallback_email_worker()
         _email_queue.put((to, subject, html, attachments, max_retries))
         return
     _deliver_email(to, subject, html, attachments, max_retries)
@@ -647,11 +1468,12 @@ def _maybe_fix_cpanel_access_denied(config: dict):
         # Keep original URI if fallback also fails.
         return
 
-_ensure_mysql_driver_available(app.config)
-_maybe_fix_cpanel_access_denied(app.config)
-db.init_app(app)
-with app.app_context():
-    _install_sql_timing_hooks()
+with _startup_phase('database_init'):
+    _ensure_mysql_driver_available(app.config)
+    _maybe_fix_cpanel_access_denied(app.config)
+    db.init_app(app)
+    with app.app_context():
+        _install_sql_timing_hooks()
 csrf = CSRFProtect(app)
 app.register_blueprint(auth_bp)
 app.register_blueprint(ecf_api_bp)
@@ -758,8 +1580,8 @@ def _export_job(app_obj, company_id, user, start, end, estado, categoria, format
                                 inv.status or '',
                                 f"{inv.total:.2f}",
                             ])
-            elif formato == 'xlsx' and Workbook is not None:
-                wb = Workbook()
+            elif formato == 'xlsx' and _module_available('openpyxl'):
+                wb = _new_workbook()
                 ws = wb.active
                 if tipo == 'resumen':
                     ws.append(['Categoría', 'Cantidad', 'Total'])
@@ -855,6 +1677,14 @@ def _migrate_legacy_schema():
 
     dialect_name = db.engine.dialect.name
 
+    if inspector.has_table('company_info'):
+        try:
+            company_cols = {c['name'] for c in inspector.get_columns('company_info')}
+        except NoSuchTableError:  # pragma: no cover
+            company_cols = set()
+        if 'ncf_epoch' not in company_cols:
+            statements.append("ALTER TABLE company_info ADD COLUMN ncf_epoch INTEGER NOT NULL DEFAULT 0")
+
     if inspector.has_table('user'):
         try:
             user_columns_info = inspector.get_columns('user')
@@ -893,6 +1723,30 @@ def _migrate_legacy_schema():
             statements.append(
                 "ALTER TABLE inventory_movement ADD COLUMN executed_by INTEGER REFERENCES user(id)"
             )
+        if 'delta' not in im_cols:
+            statements.append("ALTER TABLE inventory_movement ADD COLUMN delta INTEGER")
+        if 'ix_inventory_movement_company_wh_ts' not in _index_names('inventory_movement'):
+            statements.append(
+                "CREATE INDEX ix_inventory_movement_company_wh_ts ON inventory_movement (company_id, warehouse_id, timestamp)"
+            )
+
+    if inspector.has_table('inventory_checkpoint'):
+        try:
+            cp_cols = {c['name'] for c in inspector.get_columns('inventory_checkpoint')}
+        except NoSuchTableError:  # pragma: no cover
+            cp_cols = set()
+        if 'last_movement_id' not in cp_cols:
+            statements.append("ALTER TABLE inventory_checkpoint ADD COLUMN last_movement_id INTEGER NOT NULL DEFAULT 0")
+
+    if inspector.has_table('product_stock'):
+        try:
+            ps_cols = {c['name'] for c in inspector.get_columns('product_stock')}
+        except NoSuchTableError:  # pragma: no cover
+            ps_cols = set()
+        if 'low_stock_alert_at' not in ps_cols:
+            statements.append("ALTER TABLE product_stock ADD COLUMN low_stock_alert_at DATETIME")
+        if 'suggested_min_stock' not in ps_cols:
+            statements.append("ALTER TABLE product_stock ADD COLUMN suggested_min_stock INTEGER")
 
     if inspector.has_table('notification'):
         try:
@@ -1007,6 +1861,14 @@ def _migrate_legacy_schema():
             )"""
         )
 
+    if inspector.has_table('product'):
+        product_indexes = _index_names('product')
+        if 'uq_product_company_code' not in product_indexes:
+            statements.append("CREATE UNIQUE INDEX uq_product_company_code ON product (company_id, code)")
+        # SQLite keeps the old inline UNIQUE(code) until the table is rebuilt; MySQL can drop it in place.
+        if dialect_name in {'mysql', 'mariadb'} and 'code' in product_indexes:
+            statements.append("ALTER TABLE product DROP INDEX code")
+
     if inspector.has_table('rnc_registry'):
         rnc_indexes = _index_names('rnc_registry')
         if 'ix_rnc_registry_updated_at' not in rnc_indexes:
@@ -1058,11 +1920,14 @@ def _is_auto_sync_schema_enabled() -> bool:
 
 
 AUTO_SYNC_SCHEMA = _is_auto_sync_schema_enabled()
-if AUTO_SYNC_SCHEMA:
-    ensure_admin()
+if FAST_START:
+    app.logger.info('FAST_START enabled: schema sync deferred to `flask bootstrap`.')
+elif AUTO_SYNC_SCHEMA:
+    with _startup_phase('schema_sync'):
+        ensure_admin()
 else:
     app.logger.info('AUTO_SYNC_SCHEMA disabled: skipping startup schema bootstrap.')
-    with app.app_context():
+    with _startup_phase('schema_migrate'), app.app_context():
         _migrate_legacy_schema()
 
 
@@ -1206,10 +2071,253 @@ def current_company_id():
     return cid
 
 
-def notify(message):
-    if current_company_id():
-        db.session.add(Notification(company_id=current_company_id(), message=message))
-        db.session.commit()
+def notify(message, company_id=None):
+    """Add a notification to the caller's transaction; it is saved by the caller's next commit."""
+    cid = company_id or current_company_id()
+    if cid:
+        db.session.add(Notification(company_id=cid, message=message))
+
+
+def _notification_counter_deltas(session) -> dict[int, int]:
+    deltas: dict[int, int] = {}
+
+    def _add(cid, delta):
+        if cid:
+            deltas[cid] = deltas.get(cid, 0) + delta
+
+    for obj in session.new:
+        if isinstance(obj, Notification) and not obj.is_read:
+            _add(obj.company_id, 1)
+    for obj in session.dirty:
+        if isinstance(obj, Notification):
+            history = inspect(obj).attrs.is_read.history
+            if history.has_changes():
+                was_read = bool(history.deleted[0]) if history.deleted else False
+                if was_read != bool(obj.is_read):
+                    _add(obj.company_id, -1 if obj.is_read else 1)
+    for obj in session.deleted:
+        if isinstance(obj, Notification) and not obj.is_read:
+            _add(obj.company_id, -1)
+    return {cid: delta for cid, delta in deltas.items() if delta}
+
+
+def _unread_notifications_total(conn, company_id: int) -> int:
+    return int(conn.execute(
+        db.select(func.count(Notification.id)).where(
+            Notification.company_id == company_id,
+            or_(Notification.is_read.is_(False), Notification.is_read.is_(None)),
+        )
+    ).scalar() or 0)
+
+
+@event.listens_for(db.session, 'before_flush')
+def _apply_notification_counters(session, flush_context, instances):
+    """Fold notification inserts and reads into one counter UPDATE per company.
+
+    Runs inside the flushing transaction, so the counter commits or rolls back
+    together with the notifications that changed it.
+    """
+    deltas = _notification_counter_deltas(session)
+    if not deltas:
+        return
+    conn = session.connection()
+    counter = NotificationCounter.__table__
+    now = dom_now()
+    for cid, delta in deltas.items():
+        unread = counter.c.unread + delta if delta > 0 else case((counter.c.unread > -delta, counter.c.unread + delta), else_=0)
+        updated = conn.execute(
+            counter.update().where(counter.c.company_id == cid).values(unread=unread, updated_at=now)
+        ).rowcount
+        if not updated:
+            # Companies created before the counter existed start from their current unread total.
+            total = _unread_notifications_total(conn, cid) + delta
+            try:
+                # Savepoint on the connection: rolling back a session savepoint here
+                # would expire the objects this flush is about to write.
+                with conn.begin_nested():
+                    conn.execute(counter.insert().values(company_id=cid, unread=max(total, 0), updated_at=now))
+            except IntegrityError:
+                # A concurrent flush created the row first; apply the delta to it instead.
+                conn.execute(
+                    counter.update().where(counter.c.company_id == cid).values(unread=unread, updated_at=now)
+                )
+
+
+def unread_notification_count(company_id: int) -> int:
+    """Unread notifications for ``company_id`` from its counter row (one primary-key read)."""
+    value = db.session.execute(
+        db.select(NotificationCounter.unread).where(NotificationCounter.company_id == company_id)
+    ).scalar()
+    if value is not None:
+        return int(value)
+    try:
+        with db.engine.begin() as conn:
+            total = _unread_notifications_total(conn, company_id)
+            conn.execute(NotificationCounter.__table__.insert().values(company_id=company_id, unread=total, updated_at=dom_now()))
+    except IntegrityError:
+        # Another request backfilled the row first; its value is just as current.
+        pass
+    return total
+
+
+def _low_stock_condition():
+    # NULLs read as 0 (like sync_low_stock_alert) so the negated form still matches rows to close.
+    min_stock = func.coalesce(ProductStock.min_stock, 0)
+    return and_(min_stock > 0, func.coalesce(ProductStock.stock, 0) <= min_stock)
+
+
+def _low_stock_message(product_name: str | None) -> str:
+    return f"Stock bajo: {product_name or ''}"[:200]
+
+
+def sync_low_stock_alert(ps: ProductStock, product: Product | None = None) -> bool:
+    """Open or close the low-stock alert of ``ps`` after its stock or minimum changed.
+
+    A notification is queued in the caller's transaction the first time the
+    row is at or below ``min_stock``; it is not repeated until stock climbs
+    back above the minimum. Returns ``True`` when a new alert was queued.
+    """
+    is_low = (ps.min_stock or 0) > 0 and (ps.stock or 0) <= ps.min_stock
+    if not is_low:
+        ps.low_stock_alert_at = None
+        return False
+    if ps.low_stock_alert_at is not None:
+        return False
+    ps.low_stock_alert_at = dom_now()
+    product = product or ps.product or db.session.get(Product, ps.product_id)
+    notify(_low_stock_message(product.name if product else None), company_id=ps.company_id)
+    return True
+
+
+def _sync_low_stock_rows(company_id: int, warehouse_ids, product_ids) -> None:
+    """Re-read stock rows changed by :mod:`inventory` and open or close their alerts."""
+    rows = (
+        ProductStock.query
+        .options(joinedload(ProductStock.product))
+        .filter(
+            ProductStock.company_id == company_id,
+            ProductStock.warehouse_id.in_(list(warehouse_ids)),
+            ProductStock.product_id.in_(list(product_ids)),
+        )
+        .populate_existing()
+        .all()
+    )
+    for ps in rows:
+        sync_low_stock_alert(ps, ps.product)
+
+
+def _sync_low_stock_bulk(company_id: int, warehouse_id: int, product_ids) -> int:
+    """Set-based :func:`_sync_low_stock_rows` for imports; returns the alerts opened.
+
+    Rows are never loaded into the session, so the identity map stays small
+    however many chunks an import applies.
+    """
+    scope = (
+        ProductStock.company_id == company_id,
+        ProductStock.warehouse_id == warehouse_id,
+        ProductStock.product_id.in_(list(product_ids)),
+    )
+    ProductStock.query.filter(
+        *scope, ProductStock.low_stock_alert_at.isnot(None), ~_low_stock_condition()
+    ).update({ProductStock.low_stock_alert_at: None}, synchronize_session=False)
+    opened = (
+        db.session.query(ProductStock.id, Product.name)
+        .join(Product, Product.id == ProductStock.product_id)
+        .filter(*scope, ProductStock.low_stock_alert_at.is_(None), _low_stock_condition())
+        .all()
+    )
+    if opened:
+        ProductStock.query.filter(ProductStock.id.in_([row.id for row in opened])).update(
+            {ProductStock.low_stock_alert_at: dom_now()}, synchronize_session=False
+        )
+        for row in opened:
+            notify(_low_stock_message(row.name), company_id=company_id)
+    return len(opened)
+
+
+def reconcile_low_stock_alerts(limit: int | None = None) -> dict[str, int]:
+    """Catch up alerts for stock changes that bypassed :func:`sync_low_stock_alert`.
+
+    Rows are claimed with a conditional UPDATE, so several workers can
+    reconcile at once without duplicating notifications.
+    """
+    limit = limit or LOW_STOCK_SCAN_MAX_ITEMS
+    closed = (
+        ProductStock.query
+        .filter(ProductStock.low_stock_alert_at.isnot(None), ~_low_stock_condition())
+        .update({ProductStock.low_stock_alert_at: None}, synchronize_session=False)
+    )
+    candidates = (
+        db.session.query(ProductStock.id, ProductStock.company_id, Product.name)
+        .join(Product, Product.id == ProductStock.product_id)
+        .filter(ProductStock.low_stock_alert_at.is_(None), _low_stock_condition())
+        .order_by(ProductStock.id)
+        .limit(limit)
+        .all()
+    )
+    opened = 0
+    for stock_id, company_id, product_name in candidates:
+        claimed = (
+            ProductStock.query
+            .filter(ProductStock.id == stock_id, ProductStock.low_stock_alert_at.is_(None))
+            .update({ProductStock.low_stock_alert_at: dom_now()}, synchronize_session=False)
+        )
+        if not claimed:
+            continue
+        message = _low_stock_message(product_name)
+        already_open = (
+            db.session.query(Notification.id)
+            .filter(Notification.company_id == company_id, Notification.message == message, Notification.is_read.is_(False))
+            .first()
+        )
+        if not already_open:
+            notify(message, company_id=company_id)
+            opened += 1
+    db.session.commit()
+    return {'opened': opened, 'closed': int(closed or 0), 'checked': len(candidates)}
+
+
+_low_stock_thread = None
+_low_stock_lock = threading.Lock()
+
+
+def _low_stock_loop(app_obj) -> None:  # pragma: no cover - background helper
+    # Jitter the first pass so workers started together do not reconcile in lockstep.
+    time.sleep(random.uniform(0, min(60, LOW_STOCK_SCAN_INTERVAL_SEC)))
+    while True:
+        try:
+            with app_obj.app_context():
+                summary = reconcile_low_stock_alerts()
+            if summary['opened'] or summary['closed']:
+                _json_log('low_stock_reconcile', **summary)
+        except Exception as exc:
+            app_obj.logger.warning('Low stock reconcile failed: %s', exc)
+        time.sleep(LOW_STOCK_SCAN_INTERVAL_SEC)
+
+
+@app.before_request
+def start_low_stock_reconciler():
+    global _low_stock_thread
+    if not ENABLE_LOW_STOCK_SCAN or app.testing:
+        return
+    if _low_stock_thread is not None and _low_stock_thread.is_alive():
+        return
+    with _low_stock_lock:
+        if _low_stock_thread is None or not _low_stock_thread.is_alive():
+            _low_stock_thread = threading.Thread(
+                target=_low_stock_loop, args=(current_app._get_current_object(),), daemon=True, name='low-stock-reconcile'
+            )
+            _low_stock_thread.start()
+
+
+@app.cli.command('low_stock_reconcile')
+@click.option('--limit', default=None, type=int, help='Máximo de filas con stock bajo a revisar (default LOW_STOCK_SCAN_MAX_ITEMS).')
+def low_stock_reconcile_command(limit):
+    """Registra alertas de stock bajo que no se generaron al mover inventario."""
+    summary = reconcile_low_stock_alerts(limit=limit)
+    click.echo('low stock reconcile')
+    for key in ('checked', 'opened', 'closed'):
+        click.echo(f'{key + ":":<10} {summary[key]}')
 
 
 def log_audit(action, entity, entity_id=None, status='ok', details=''):
@@ -1309,11 +2417,13 @@ def _log_product_price_change(product, old_price, old_cost_price):
         )
     )
 
+def _reference_prefix(name: str | None) -> str:
+    return ''.join(ch for ch in (name or '').upper() if ch.isalnum())[:3] or 'REF'
+
+
 def generate_reference(name: str) -> str:
     """Generate a unique reference based on product name."""
-    prefix = ''.join(ch for ch in (name or '').upper() if ch.isalnum())[:3]
-    if not prefix:
-        prefix = 'REF'
+    prefix = _reference_prefix(name)
     existing = company_query(Product).filter(Product.reference.like(f"{prefix}%")).all()
     numbers = []
     for p in existing:
@@ -1325,6 +2435,33 @@ def generate_reference(name: str) -> str:
     return f"{prefix}{next_no:03d}"
 
 
+def _reference_counters(company_id: int) -> dict[str, int]:
+    """Highest numeric suffix per reference prefix, read once for a bulk import.
+
+    Mirrors :func:`generate_reference`: ``ABC012`` counts for prefix ``ABC``
+    and ``AB012`` for ``AB``.
+    """
+    counters: dict[str, int] = {}
+    references = (
+        db.session.query(Product.reference)
+        .filter(Product.company_id == company_id, Product.reference.isnot(None))
+        .yield_per(1000)
+    )
+    for (reference,) in references:
+        for size in (1, 2, 3):
+            suffix = reference[size:]
+            if suffix.isdigit():
+                prefix = reference[:size]
+                counters[prefix] = max(counters.get(prefix, 0), int(suffix))
+    return counters
+
+
+def _next_reference(counters: dict[str, int], name: str | None) -> str:
+    prefix = _reference_prefix(name)
+    counters[prefix] = counters.get(prefix, 0) + 1
+    return f"{prefix}{counters[prefix]:03d}"
+
+
 def _parse_report_params(fecha_inicio, fecha_fin, estado, categoria, default_days=None):
     """Validate and normalize report filter parameters.
 
@@ -1495,7 +2632,7 @@ def rnc_lookup(rnc):
         if row:
             name = row.name
     if not name:
-        name = RNC_DATA.get(clean, '')
+        name = load_rnc_data().get(clean, '')
     if not name and clean:
         client = Client.query.filter(func.replace(Client.identifier, '-', '') == clean).first()
         name = client.name if client else ''
@@ -1504,8 +2641,25 @@ def rnc_lookup(rnc):
 
 @app.before_request
 def load_company():
+    g.tenant = current_tenant()
+
+
+_ncf_allocator = ncf_sequence.NcfBlockAllocator(NCF_BLOCK_SIZE)
+
+
+def allocate_ncf(company_id: int, prefix: str) -> str:
+    """Next unused NCF of ``prefix`` (``B01``/``B02``) for ``company_id``; see :mod:`ncf_sequence`."""
+    return _ncf_allocator.next(company_id, prefix)
+
+
+def request_company():
+    """ORM row of the current company, fetched at most once per request."""
     cid = current_company_id()
-    g.company = db.session.get(CompanyInfo, cid) if cid else None
+    company = g.get('company')
+    if company is None or company.id != cid:
+        company = db.session.get(CompanyInfo, cid) if cid else None
+        g.company = company
+    return company
 
 
 @app.context_processor
@@ -1517,43 +2671,7 @@ def inject_company():
     try:
         cid = current_company_id()
         if 'user_id' in session and cid and ENABLE_NOTIFICATIONS_CONTEXT:
-            now_ts = int(time.time())
-
-            # Optional background-like scan for low stock; disabled by default to protect worker capacity.
-            if ENABLE_LOW_STOCK_SCAN:
-                last_scan = session.get('low_stock_scan_at', 0)
-                if now_ts - last_scan >= LOW_STOCK_SCAN_INTERVAL_SEC:
-                    low_stock = (
-                        company_query(ProductStock)
-                        .join(Product, Product.id == ProductStock.product_id)
-                        .options(load_only(ProductStock.id, ProductStock.product_id), joinedload(ProductStock.product).load_only(Product.name))
-                        .filter(ProductStock.stock <= ProductStock.min_stock, ProductStock.min_stock > 0)
-                        .limit(LOW_STOCK_SCAN_MAX_ITEMS)
-                        .all()
-                    )
-                    if low_stock:
-                        messages = [f"Stock bajo: {ps.product.name}" for ps in low_stock if ps.product and ps.product.name]
-                        existing_messages = {
-                            row[0]
-                            for row in db.session.query(Notification.message)
-                            .filter(Notification.company_id == cid, Notification.message.in_(messages))
-                            .all()
-                        } if messages else set()
-                        for msg in messages:
-                            if msg not in existing_messages:
-                                db.session.add(Notification(company_id=cid, message=msg))
-                        if len(messages) != len(existing_messages):
-                            db.session.commit()
-                    session['low_stock_scan_at'] = now_ts
-
-            # Throttle notification queries to reduce DB pressure under concurrent load.
-            last_notif_refresh = session.get('notif_refresh_at', 0)
-            if now_ts - last_notif_refresh >= NOTIFICATION_REFRESH_INTERVAL_SEC:
-                notif_count = Notification.query.filter_by(company_id=cid, is_read=False).count()
-                session['notif_refresh_at'] = now_ts
-                session['notif_count_cache'] = int(notif_count)
-            else:
-                notif_count = int(session.get('notif_count_cache', 0) or 0)
+            notif_count = unread_notification_count(cid)
 
             # Load notification lists only on the notifications page.
             if request.path.startswith('/notificaciones'):
@@ -1590,7 +2708,7 @@ def inject_company():
     except Exception as exc:
         app.logger.exception('Failed to compute notifications: %s', exc)
     return {
-        'company': getattr(g, 'company', None),
+        'company': LocalProxy(request_company),
         'notification_count': notif_count,
         'unread_notifications': unread_notifications,
         'archived_notifications': archived_notifications,
@@ -1602,9 +2720,11 @@ def inject_company():
 
 
 def get_company_info():
-    c = db.session.get(CompanyInfo, current_company_id())
-    if not c:
-        return {}
+    tenant = current_tenant()
+    return dict(tenant.info) if tenant else {}
+
+
+def _company_info_dict(c: CompanyInfo) -> dict:
     return {
         'name': c.name,
         'address': f"{c.street}, {c.sector}, {c.province}",
@@ -1625,11 +2745,98 @@ def _company_short_slug(company_name: str | None) -> str:
 
 
 def _company_private_token(company_id: int | None, company_name: str | None) -> str:
-    seed = f"{app.config.get('SECRET_KEY','tiendix')}:{company_id or 0}:{company_name or ''}"
+    return _private_token_for(app.config.get('SECRET_KEY', 'tiendix'), company_id or 0, company_name or '')
+
+
+@lru_cache(maxsize=1024)
+def _private_token_for(secret_key: str, company_id: int, company_name: str) -> str:
+    seed = f"{secret_key}:{company_id}:{company_name}"
     token_number = int(hashlib.sha256(seed.encode('utf-8')).hexdigest(), 16) % 1_000_000
     return f"{token_number:06d}"
 
 
+class TenantContext:
+    """Company data the request needs, resolved once and kept on ``g.tenant``."""
+
+    __slots__ = ('company_id', 'info', 'archive_slug', 'archive_token')
+
+    def __init__(self, company_id: int, info: dict):
+        self.company_id = company_id
+        self.info = info
+        self.archive_slug = _company_short_slug(info.get('name'))
+        self.archive_token = _company_private_token(company_id, info.get('name'))
+
+    @property
+    def name(self) -> str | None:
+        return self.info.get('name')
+
+    @property
+    def logo_path(self) -> str | None:
+        return self.info.get('logo')
+
+
+_tenant_cache: dict[int, tuple[float, dict]] = {}
+_tenant_cache_lock = threading.Lock()
+
+
+def _load_tenant_info(company_id: int) -> dict | None:
+    if TENANT_CACHE_TTL_SEC > 0:
+        with _tenant_cache_lock:
+            cached = _tenant_cache.get(company_id)
+        if cached and time.monotonic() - cached[0] < TENANT_CACHE_TTL_SEC:
+            return cached[1]
+    company = db.session.get(CompanyInfo, company_id)
+    if company is None:
+        return None
+    if has_request_context():
+        g.company = company
+    info = _company_info_dict(company)
+    if TENANT_CACHE_TTL_SEC > 0:
+        with _tenant_cache_lock:
+            _tenant_cache[company_id] = (time.monotonic(), info)
+    return info
+
+
+def invalidate_tenant_cache(company_id: int | None = None) -> None:
+    """Drop cached company data in this process (all companies when ``company_id`` is None)."""
+    with _tenant_cache_lock:
+        if company_id is None:
+            _tenant_cache.clear()
+        else:
+            _tenant_cache.pop(company_id, None)
+    if has_request_context():
+        g.pop('tenant', None)
+        g.pop('company', None)
+
+
+def current_tenant() -> TenantContext | None:
+    """Return the request's :class:`TenantContext`, loading it on first use."""
+    if not has_request_context():
+        return None
+    cid = current_company_id()
+    tenant = g.get('tenant')
+    if tenant is not None and tenant.company_id == cid:
+        return tenant
+    if not cid:
+        return None
+    info = _load_tenant_info(cid)
+    tenant = TenantContext(cid, info) if info is not None else None
+    g.tenant = tenant
+    return tenant
+
+
+def _current_tenant_name() -> str | None:
+    tenant = current_tenant()
+    return tenant.name if tenant else None
+
+
+def _tenant_archive_parts(company_id: int | None, company_name: str | None) -> tuple[str, str]:
+    tenant = current_tenant()
+    if tenant is not None and tenant.company_id == company_id and tenant.name == company_name:
+        return tenant.archive_slug, tenant.archive_token
+    return _company_short_slug(company_name), _company_private_token(company_id, company_name)
+
+
 def _doc_client_slug(doc_type: str, doc_number: int | str, *, company_id: int | None = None) -> str:
     if not str(doc_number).isdigit():
         return 'documento'
@@ -1698,9 +2905,8 @@ def _doc_file_stem(doc_type: str, doc_number: int | str, *, company_name: str |
 
 def _legacy_archived_pdf_path(doc_type: str, doc_number: int | str, *, company_name: str | None = None, company_id: int | None = None) -> Path:
     cid = company_id if company_id is not None else current_company_id()
-    name = company_name or (getattr(g, 'company', None).name if getattr(g, 'company', None) else None)
-    short = _company_short_slug(name)
-    token = _company_private_token(cid, name)
+    name = company_name or _current_tenant_name()
+    short, token = _tenant_archive_parts(cid, name)
     safe_type = secure_filename((doc_type or 'documento').lower()) or 'documento'
     number = f"{int(doc_number):02d}" if str(doc_number).isdigit() else secure_filename(str(doc_number))
     return _archive_root_dir() / short / token / safe_type / f"{number}.pdf"
@@ -1734,9 +2940,8 @@ def _archive_root_dir() -> Path:
 
 def _archived_pdf_path(doc_type: str, doc_number: int | str, *, company_name: str | None = None, company_id: int | None = None) -> Path:
     cid = company_id if company_id is not None else current_company_id()
-    name = company_name or (getattr(g, 'company', None).name if getattr(g, 'company', None) else None)
-    short = _company_short_slug(name)
-    token = _company_private_token(cid, name)
+    name = company_name or _current_tenant_name()
+    short, token = _tenant_archive_parts(cid, name)
     safe_type = secure_filename((doc_type or 'documento').lower()) or 'documento'
     stem = _doc_file_stem(doc_type, doc_number, company_name=name, company_id=cid)
     return _archive_root_dir() / short / token / safe_type / f"{stem}.pdf"
@@ -1781,7 +2986,8 @@ def _release_pdf_lock(lock_path: Path | None) -> None:
         pass
 
 
-def _stored_generated_doc_url(stored_path: str | None, *, company_id: int | None, company_name: str | None) -> str | None:
+def _stored_generated_doc_file(stored_path: str | None, *, company_id: int | None, company_name: str | None) -> Path | None:
+    """Return the archived file behind a stored ``/generated_docs/...`` path, if it is valid for the company."""
     path = (stored_path or '').strip()
     if not path:
         return None
@@ -1791,13 +2997,23 @@ def _stored_generated_doc_url(stored_path: str | None, *, company_id: int | None
         return None
     rel = path[len('/generated_docs/'):]
     safe_rel = rel.lstrip('/')
-    expected_prefix = f"{_company_short_slug(company_name)}/{_company_private_token(company_id, company_name)}/"
+    expected_prefix = '/'.join(_tenant_archive_parts(company_id, company_name)) + '/'
     if safe_rel and not safe_rel.startswith(expected_prefix):
         return None
     full_path = (_archive_root_dir().resolve() / safe_rel).resolve()
     root = _archive_root_dir().resolve()
     if not str(full_path).startswith(str(root)) or not full_path.exists() or not full_path.is_file():
         return None
+    return full_path
+
+
+def _stored_generated_doc_url(stored_path: str | None, *, company_id: int | None, company_name: str | None) -> str | None:
+    full_path = _stored_generated_doc_file(stored_path, company_id=company_id, company_name=company_name)
+    if full_path is None:
+        return None
+    path = (stored_path or '').strip()
+    if not path.startswith('/'):
+        path = f'/{path}'
     return _archived_download_url('documento', 0, full_path=str(full_path)) or path
 
 
@@ -2109,8 +3325,9 @@ def ensure_pdf_archive_environment() -> None:
         app.logger.warning('Could not pre-create PDF archive directories: %s', exc)
 
 
-with app.app_context():
-    ensure_pdf_archive_environment()
+if not FAST_START:
+    with _startup_phase('pdf_archive_dirs'), app.app_context():
+        ensure_pdf_archive_environment()
 
 
 def _archive_pdf_copy(doc_type: str, doc_number: int | str, pdf_data: bytes, company_name: str | None = None, company_id: int | None = None) -> str | None:
@@ -2285,6 +3502,7 @@ def require_login():
         'auth.reset_password',
         'auth.recovery_password',
         'terminos',
+        'prometheus_metrics',
     }
     if request.endpoint not in allowed and 'user_id' not in session:
         return redirect(url_for('auth.login'))
@@ -2637,6 +3855,7 @@ def cpanel_home():
         'cpaneltx.html',
         signup_auto_approve=_is_signup_auto_approve_enabled(),
         social_links=get_login_social_links(),
+        route_profiling=ENABLE_ROUTE_PROFILING,
     )
 
 
@@ -2951,7 +4170,12 @@ def cpanel_company_clear():
 def cpanel_company_delete(cid):
     company = CompanyInfo.query.get_or_404(cid)
     db.session.delete(company)
+    NotificationCounter.query.filter_by(company_id=cid).delete(synchronize_session=False)
+    CatalogVersion.query.filter_by(company_id=cid).delete(synchronize_session=False)
+    InventoryCheckpoint.query.filter_by(company_id=cid).delete(synchronize_session=False)
     db.session.commit()
+    invalidate_tenant_cache(cid)
+    invalidate_catalog_cache(cid)
     flash('Empresa eliminada')
     log_audit('cpanel_company_delete', 'company', cid)
     return redirect(url_for('cpanel_companies'))
@@ -3134,40 +4358,228 @@ def readiness_check():
     }), status
 
 
-@app.get('/__admin/profile/reportes')
-@admin_only
-def profile_reportes():
-    if not ENABLE_ROUTE_PROFILING:
+def _metrics_authorized() -> bool:
+    token = str(current_app.config.get('METRICS_TOKEN') or os.getenv('METRICS_TOKEN') or '')
+    if token:
+        auth = request.headers.get('Authorization', '')
+        # Header only: a query-string token would end up in access and proxy logs.
+        supplied = auth[7:].strip() if auth.startswith('Bearer ') else ''
+        if supplied and hmac.compare_digest(supplied, token):
+            return True
+    return session.get('role') == 'admin'
+
+
+def _scrape_time_gauges() -> list[tuple[str, str, dict, float]]:
+    """Gauges read from the database at scrape time (already shared by all workers)."""
+    from ecf.models import EcfDocument
+    from ecf.tasks import FINAL_STATUSES
+
+    gauges = []
+    try:
+        stats = email_outbox_stats()
+        for status in ('pending', 'sending'):
+            gauges.append(('tiendix_email_outbox_depth', 'Emails waiting in email_outbox by status.', {'status': status}, stats[status]))
+        for result in ('queued', 'sent', 'retries', 'failed'):
+            gauges.append(('tiendix_email_total', 'Email outbox results.', {'result': result}, stats[result]))
+    except Exception as exc:
+        db.session.rollback()
+        app.logger.warning('Metrics: email stats unavailable: %s', exc)
+    try:
+        rows = (
+            db.session.query(EcfDocument.status, func.count(EcfDocument.id))
+            .filter(EcfDocument.status.notin_(sorted(FINAL_STATUSES)))
+            .group_by(EcfDocument.status)
+            .all()
+        )
+        for status, total in rows:
+            gauges.append(('tiendix_ecf_documents_pending', 'e-CF documents not yet in a final status.', {'status': status}, total))
+    except Exception as exc:
+        db.session.rollback()
+        app.logger.warning('Metrics: e-CF stats unavailable: %s', exc)
+    return gauges
+
+
+@app.get('/__metrics')
+def prometheus_metrics():
+    if not _metrics_authorized():
         return ('Not Found', 404)
-    import cProfile
-    import io as _io
-    import pstats
+    _flush_metrics(force=True)
+    body = METRICS.render(_scrape_time_gauges())
+    return Response(body, mimetype='text/plain; version=0.0.4', headers={'Cache-Control': 'no-store'})
+
 
-    fecha_inicio, fecha_fin, estado, categoria, _, _ = _parse_report_params(
-        request.args.get('fecha_inicio'),
-        request.args.get('fecha_fin'),
-        request.args.get('estado'),
-        request.args.get('categoria'),
-        default_days=90,
+@app.get('/cpaneltx/sql')
+@admin_only
+def cpanel_sql_stats():
+    hours = min(max(request.args.get('horas', 24, type=int) or 24, 1), 24 * SQL_STATS_RETENTION_DAYS)
+    flush_sql_stats(force=True)
+    since = dom_now() - timedelta(hours=hours)
+    total_ms = func.sum(SqlQueryStat.total_ms)
+    top = (
+        db.session.query(
+            SqlQueryStat.fingerprint,
+            func.max(SqlQueryStat.statement),
+            func.sum(SqlQueryStat.calls),
+            total_ms,
+            func.max(SqlQueryStat.max_ms),
+            func.max(SqlQueryStat.p95_ms),
+        )
+        .filter(SqlQueryStat.window_end >= since)
+        .group_by(SqlQueryStat.fingerprint)
+        .order_by(total_ms.desc())
+        .limit(50)
+        .all()
     )
+    samples = {}
+    if top:
+        for fingerprint, max_ms, request_id in (
+            db.session.query(SqlQueryStat.fingerprint, SqlQueryStat.max_ms, SqlQueryStat.sample_request_id)
+            .filter(SqlQueryStat.window_end >= since, SqlQueryStat.fingerprint.in_([row[0] for row in top]))
+            .all()
+        ):
+            if fingerprint not in samples or max_ms > samples[fingerprint][0]:
+                samples[fingerprint] = (max_ms, request_id)
+    rows = [
+        {
+            'fingerprint': fingerprint,
+            'statement': statement,
+            'calls': int(calls or 0),
+            'total_ms': float(total or 0),
+            'avg_ms': float(total or 0) / max(int(calls or 0), 1),
+            'max_ms': float(max_ms or 0),
+            # Windows are aggregated per worker; the worst window p95 is an upper bound.
+            'p95_ms': float(p95 or 0),
+            'sample_request_id': samples.get(fingerprint, (0, None))[1],
+        }
+        for fingerprint, statement, calls, total, max_ms, p95 in top
+    ]
+    return render_template('cpanel_sql.html', rows=rows, hours=hours)
+
+
+ROUTE_PROFILING_SAMPLE_RATE = min(max(float(os.getenv('ROUTE_PROFILING_SAMPLE_RATE', '0.01')), 0.0), 1.0)
+ROUTE_PROFILING_MAX_FILES = max(int(os.getenv('ROUTE_PROFILING_MAX_FILES', '200')), 1)
+ROUTE_PROFILING_TOKEN_MAX_AGE_SEC = 3600
+ROUTE_PROFILE_HEADER = 'X-Tiendix-Profile'
+
+
+def _route_profile_dir() -> Path:
+    configured = current_app.config.get('ROUTE_PROFILING_DIR') or os.getenv('ROUTE_PROFILING_DIR')
+    return Path(configured or os.path.join(current_app.instance_path, 'profiles'))
+
+
+def _route_profile_serializer() -> URLSafeTimedSerializer:
+    return URLSafeTimedSerializer(current_app.config['SECRET_KEY'], salt='route-profile')
+
+
+def generate_route_profile_token(user_id) -> str:
+    """Signed value for the profiling header; valid for one hour."""
+    return _route_profile_serializer().dumps({'admin': user_id})
+
+
+def _route_profile_requested() -> bool:
+    token = request.headers.get(ROUTE_PROFILE_HEADER)
+    if token:
+        try:
+            _route_profile_serializer().loads(token, max_age=ROUTE_PROFILING_TOKEN_MAX_AGE_SEC)
+            return True
+        except BadSignature:
+            return False
+    return ROUTE_PROFILING_SAMPLE_RATE > 0 and random.random() < ROUTE_PROFILING_SAMPLE_RATE
+
+
+@app.before_request
+def start_route_profiler():
+    if not ENABLE_ROUTE_PROFILING or request.endpoint in (None, 'static', 'cpanel_profiles'):
+        return None
+    if not _route_profile_requested():
+        return None
+    import cProfile
 
     profiler = cProfile.Profile()
-    t0 = time.time()
-    profiler.enable()
-    rows = _filtered_invoice_query(fecha_inicio, fecha_fin, estado, categoria).limit(300).all()
+    try:
+        profiler.enable()
+    except ValueError:  # another profiler is already active in this thread
+        return None
+    g.route_profiler = profiler
+    return None
+
+
+@app.teardown_request
+def finish_route_profiler(_exc=None):
+    profiler = g.pop('route_profiler', None)
+    if profiler is None:
+        return
     profiler.disable()
-    elapsed_ms = int((time.time() - t0) * 1000)
+    endpoint_dir = _route_profile_dir() / secure_filename(request.endpoint or 'unmatched')
+    try:
+        endpoint_dir.mkdir(parents=True, exist_ok=True)
+        profiler.dump_stats(str(endpoint_dir / f'{time.time():.6f}-{os.getpid()}-{uuid.uuid4().hex[:6]}.prof'))
+        samples = sorted(endpoint_dir.glob('*.prof'))
+        for stale in samples[:-ROUTE_PROFILING_MAX_FILES]:
+            stale.unlink(missing_ok=True)
+    except OSError as exc:
+        app.logger.warning('Route profile could not be stored for %s: %s', request.endpoint, exc)
 
-    stream = _io.StringIO()
-    stats = pstats.Stats(profiler, stream=stream).sort_stats('cumtime')
-    stats.print_stats(40)
 
-    return jsonify({
-        'ok': True,
-        'rows_sampled': len(rows),
-        'elapsed_ms': elapsed_ms,
-        'profile': stream.getvalue(),
-    })
+def _route_profile_summary(endpoint_dir: Path, limit: int = 15) -> dict | None:
+    """Merge every stored sample of one endpoint into its hottest functions."""
+    import pstats
+
+    files = sorted(endpoint_dir.glob('*.prof'))
+    stats = None
+    for path in files:
+        try:
+            if stats is None:
+                stats = pstats.Stats(str(path))
+            else:
+                stats.add(str(path))
+        except Exception:  # truncated or concurrently rotated sample
+            continue
+    if stats is None:
+        return None
+    functions = []
+    for (filename, line, name), (_cc, ncalls, tottime, cumtime, _callers) in stats.stats.items():
+        functions.append({
+            'function': f'{Path(filename).name}:{line}({name})' if line else name,
+            'ncalls': ncalls,
+            'tottime': tottime,
+            'cumtime': cumtime,
+        })
+    functions.sort(key=lambda row: row['tottime'], reverse=True)
+    return {
+        'endpoint': endpoint_dir.name,
+        'samples': len(files),
+        'total_time': stats.total_tt,
+        'avg_ms': stats.total_tt * 1000 / max(len(files), 1),
+        'functions': functions[:limit],
+    }
+
+
+@app.get('/cpaneltx/perfiles')
+@admin_only
+def cpanel_profiles():
+    if not ENABLE_ROUTE_PROFILING:
+        return ('Not Found', 404)
+    selected = request.args.get('ruta', '')
+    root = _route_profile_dir()
+    endpoint_dirs = sorted(p for p in root.iterdir() if p.is_dir()) if root.is_dir() else []
+    summaries = []
+    for endpoint_dir in endpoint_dirs:
+        if selected and endpoint_dir.name != selected:
+            continue
+        summary = _route_profile_summary(endpoint_dir, limit=40 if selected else 10)
+        if summary:
+            summaries.append(summary)
+    summaries.sort(key=lambda row: row['total_time'], reverse=True)
+    return render_template(
+        'cpanel_profiles.html',
+        summaries=summaries,
+        endpoints=[p.name for p in endpoint_dirs],
+        selected=selected,
+        sample_rate=ROUTE_PROFILING_SAMPLE_RATE,
+        header_name=ROUTE_PROFILE_HEADER,
+        profile_token=generate_route_profile_token(session.get('user_id')),
+    )
 
 
 # Clients CRUD
@@ -3204,9 +4616,9 @@ def clients():
             company_id=current_company_id()
         )
         db.session.add(client)
+        notify('Cliente agregado')
         db.session.commit()
         flash('Cliente agregado')
-        notify('Cliente agregado')
         return redirect(url_for('clients'))
     q = request.args.get('q', '').strip()
     page = request.args.get('page', 1, type=int)
@@ -3307,6 +4719,126 @@ def api_create_client():
     return {'id': client.id, 'name': client.name, 'identifier': client.identifier}
 
 
+def _product_search_rows(company_id: int) -> list[dict]:
+    rows = db.session.query(
+        Product.id, Product.code, Product.name, Product.reference, Product.unit, Product.price,
+    ).filter(Product.company_id == company_id)
+    return [row._asdict() for row in rows]
+
+
+# Rebuilt whenever the shared catalog version moves, so no TTL is needed across workers;
+# memory is bounded by keeping only the most recently searched companies.
+_product_search = product_search.ProductSearchRegistry(
+    _product_search_rows, ttl=0, max_companies=PRODUCT_SEARCH_MAX_COMPANIES,
+)
+_CATALOG_COLUMNS = ('id', 'code', 'name', 'unit', 'price', 'has_itbis', 'category')
+_catalog_payloads: dict[int, tuple[int, bytes]] = {}
+# company_id -> (cache key, valuation payload); the key changes with every stock movement or catalog edit.
+_inventory_valuation_cache: dict[int, tuple[tuple, dict]] = {}
+
+
+def invalidate_catalog_cache(company_id: int | None = None) -> None:
+    """Drop this process' search index, catalog payload and inventory valuation for ``company_id`` (all when None)."""
+    _product_search.invalidate(company_id)
+    if company_id is None:
+        _catalog_payloads.clear()
+        _inventory_valuation_cache.clear()
+    else:
+        _catalog_payloads.pop(company_id, None)
+        _inventory_valuation_cache.pop(company_id, None)
+
+
+def catalog_version(company_id: int) -> int:
+    """Current catalog version of ``company_id`` (one primary-key read; 0 before any change)."""
+    value = db.session.execute(
+        db.select(CatalogVersion.version).where(CatalogVersion.company_id == company_id)
+    ).scalar()
+    return int(value or 0)
+
+
+def bump_catalog_version(company_id: int) -> None:
+    """Advance the catalog version in the caller's transaction; call from every product write."""
+    table = CatalogVersion.__table__
+    bumped = db.session.execute(
+        table.update()
+        .where(table.c.company_id == company_id)
+        .values(version=table.c.version + 1, updated_at=dom_now())
+    ).rowcount
+    if bumped:
+        return
+    try:
+        with db.session.begin_nested():
+            db.session.execute(table.insert().values(company_id=company_id, version=1, updated_at=dom_now()))
+    except IntegrityError:
+        # A concurrent write created the row first; bump it instead.
+        db.session.execute(
+            table.update()
+            .where(table.c.company_id == company_id)
+            .values(version=table.c.version + 1, updated_at=dom_now())
+        )
+
+
+def search_products(query: str, limit: int = 20) -> list[dict]:
+    """Ranked products of the current company matching ``query`` (see :mod:`product_search`)."""
+    cid = current_company_id()
+    if not cid:
+        return []
+    index = _product_search.get(cid, version=catalog_version(cid))
+    return index.search(query, limit=max(1, min(limit, PRODUCT_SEARCH_MAX_RESULTS)))
+
+
+def matching_product_ids(query: str) -> list[int]:
+    """Every product id of the current company matching ``query``, for filtering list views."""
+    cid = current_company_id()
+    if not cid:
+        return []
+    return sorted(_product_search.get(cid, version=catalog_version(cid)).matching_ids(query))
+
+
+@app.get('/api/products/search')
+def api_products_search():
+    q = (request.args.get('q') or '').strip()
+    limit = request.args.get('limit', 20, type=int)
+    return jsonify({'products': search_products(q, limit) if q else []})
+
+
+def _catalog_payload(company_id: int, version: int) -> bytes:
+    cached = _catalog_payloads.get(company_id)
+    if cached and cached[0] == version:
+        return cached[1]
+    rows = (
+        db.session.query(*(getattr(Product, column) for column in _CATALOG_COLUMNS))
+        .filter(Product.company_id == company_id)
+        .order_by(Product.name)
+        .all()
+    )
+    columns = {column: [row[pos] for row in rows] for pos, column in enumerate(_CATALOG_COLUMNS)}
+    body = json.dumps(
+        {'version': version, 'count': len(rows), 'products': columns},
+        ensure_ascii=False, separators=(',', ':'),
+    ).encode('utf-8')
+    _catalog_payloads[company_id] = (version, body)
+    return body
+
+
+@app.get('/api/catalog')
+def api_catalog():
+    """Columnar product catalog of the current company, revalidated by ETag."""
+    cid = current_company_id()
+    if not cid:
+        return jsonify({'error': 'no company selected'}), 400
+    version = catalog_version(cid)
+    etag = f'catalog-{cid}-{version}'
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(_catalog_payload(cid, version), mimetype='application/json')
+    response.set_etag(etag)
+    # Browsers keep the copy but must revalidate, so edits show up on the next page view.
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
 @app.get('/api/reference')
 def api_reference():
     name = request.args.get('name', '')
@@ -3341,18 +4873,26 @@ def products():
         db.session.add(product)
         db.session.flush()
         _log_product_price_change(product, None, None)
+        bump_catalog_version(product.company_id)
+        notify('Producto agregado')
         db.session.commit()
         flash('Producto agregado')
         if warning_msg:
             flash(warning_msg)
-        notify('Producto agregado')
         return redirect(url_for('products'))
     cat = request.args.get('cat')
+    q = (request.args.get('q') or '').strip()
+    page = request.args.get('page', 1, type=int)
     query = company_query(Product)
     if cat:
         query = query.filter_by(category=cat)
-    products = query.all()
-    return render_template('productos.html', products=products, units=UNITS, categories=CATEGORIES, current_cat=cat)
+    if q:
+        query = query.filter(Product.id.in_(matching_product_ids(q)))
+    pagination = query.order_by(Product.name).paginate(page=page, per_page=50, error_out=False)
+    return render_template(
+        'productos.html', products=pagination.items, pagination=pagination, q=q,
+        units=UNITS, categories=CATEGORIES, current_cat=cat,
+    )
 
 
 @app.route('/productos/importar', methods=['GET', 'POST'])
@@ -3360,31 +4900,161 @@ def products():
 def products_import():
     if request.method == 'POST':
         file = request.files['file']
-        rows = file.stream.read().decode('utf-8').splitlines()
-        reader = csv.DictReader(rows)
-        for row in reader:
-            code = row.get('code')
-            if not code:
-                continue
-            prod = company_query(Product).filter_by(code=code).first()
-            if not prod:
-                prod = Product(code=code, company_id=current_company_id())
-                db.session.add(prod)
-            prod.name = row.get('name') or prod.name
-            prod.unit = row.get('unit') or prod.unit
-            prod.price = _to_float(row.get('price')) or prod.price
-            cat = row.get('category')
-            if cat in CATEGORIES:
-                prod.category = cat
-            prod.has_itbis = row.get('has_itbis', '').strip().lower() in ('1', 'true', 'si', 'sí', 'yes')
-            if not prod.reference:
-                prod.reference = generate_reference(prod.name)
+        try:
+            summary = import_products_csv(
+                current_company_id(), TextIOWrapper(file.stream, encoding='utf-8', newline=''),
+                changed_by=session.get('user_id'),
+            )
+        except ValueError as exc:
+            db.session.rollback()
+            flash(str(exc))
+            return render_template('productos_importar.html')
+        if summary['created'] or summary['updated']:
+            bump_catalog_version(current_company_id())
         db.session.commit()
-        flash('Productos importados')
+        flash(
+            f"Productos importados: {summary['created']} nuevos, {summary['updated']} actualizados, "
+            f"{summary['unchanged']} sin cambios"
+        )
+        if summary['skipped']:
+            flash(f"{summary['skipped']} filas omitidas")
+            return render_template('productos_importar.html', errors=summary['errors'])
         return redirect(url_for('products'))
     return render_template('productos_importar.html')
 
 
+_PRODUCT_IMPORT_FIELDS = ('name', 'unit', 'price', 'category', 'has_itbis', 'reference')
+
+
+def _apply_product_chunk(company_id: int, chunk, counters: dict[str, int], summary: dict, changed_by) -> None:
+    codes = list(dict.fromkeys(code for _, code, _ in chunk))
+    existing = {
+        row.code: row._asdict()
+        for row in db.session.query(
+            Product.id, Product.code, Product.name, Product.unit, Product.price, Product.cost_price,
+            Product.category, Product.has_itbis, Product.reference,
+        ).filter(Product.company_id == company_id, Product.code.in_(codes))
+    }
+    originals = {code: dict(values) for code, values in existing.items()}
+    created = {}
+    for line, code, row in chunk:
+        state = existing.get(code) or created.get(code)
+        is_new = state is None
+        if is_new:
+            state = {'code': code, 'name': None, 'unit': None, 'price': None, 'category': None,
+                     'has_itbis': True, 'reference': None}
+        name = row.get('name') or state['name']
+        unit = row.get('unit') or state['unit']
+        price = _to_float(row.get('price')) or state['price']
+        if is_new and not (name and unit and price):
+            summary['skipped'] += 1
+            if len(summary['errors']) < IMPORT_MAX_REPORTED_ERRORS:
+                summary['errors'].append((line, f'Producto {code}: nombre, unidad y precio son obligatorios'))
+            continue
+        state.update(name=name, unit=unit, price=price)
+        if row.get('category') in CATEGORIES:
+            state['category'] = row['category']
+        state['has_itbis'] = (row.get('has_itbis') or '').strip().lower() in ('1', 'true', 'si', 'sí', 'yes')
+        if not state['reference']:
+            state['reference'] = _next_reference(counters, state['name'])
+        if is_new:
+            created[code] = state
+
+    table = Product.__table__
+    if created:
+        db.session.execute(table.insert(), [
+            dict(state, company_id=company_id, stock=0, min_stock=0) for state in created.values()
+        ])
+    changed = [
+        state for code, state in existing.items()
+        if any(state[field] != originals[code][field] for field in _PRODUCT_IMPORT_FIELDS)
+    ]
+    if changed:
+        db.session.execute(
+            table.update()
+            .where(table.c.id == bindparam('b_id'))
+            .values({field: bindparam(f'b_{field}') for field in _PRODUCT_IMPORT_FIELDS}),
+            [dict({f'b_{field}': state[field] for field in _PRODUCT_IMPORT_FIELDS}, b_id=state['id'])
+             for state in changed],
+        )
+    price_logs = [
+        {'product_id': state['id'], 'old_price': originals[state['code']]['price'], 'new_price': state['price'],
+         'old_cost_price': state['cost_price'], 'new_cost_price': state['cost_price'],
+         'changed_by': changed_by, 'changed_at': dom_now(), 'company_id': company_id}
+        for state in changed if state['price'] != originals[state['code']]['price']
+    ]
+    if price_logs:
+        db.session.execute(ProductPriceLog.__table__.insert(), price_logs)
+    summary['created'] += len(created)
+    summary['updated'] += len(changed)
+    summary['unchanged'] += len(existing) - len(changed)
+    summary['price_changes'] += len(price_logs)
+
+
+def import_products_csv(company_id: int, lines, *, changed_by: int | None,
+                        chunk_size: int | None = None) -> dict:
+    """Upsert a product catalog CSV for ``company_id`` in chunks.
+
+    Each chunk costs one ``IN`` lookup on ``(company_id, code)`` plus one
+    executemany for inserts, one for updates and one for price-log rows.
+    References come from counters read once per import instead of a query per
+    new product. Returns counts of ``created``, ``updated``, ``unchanged``,
+    ``skipped`` and ``price_changes`` rows, and up to
+    ``IMPORT_MAX_REPORTED_ERRORS`` skipped lines in ``errors``. The caller
+    commits.
+    """
+    chunk_size = chunk_size or PRODUCT_IMPORT_CHUNK_SIZE
+    reader = csv.DictReader(lines)
+    try:
+        fieldnames = reader.fieldnames
+    except UnicodeDecodeError:
+        raise ValueError('El archivo debe estar codificado en UTF-8')
+    if not fieldnames or 'code' not in fieldnames:
+        raise ValueError('Cabeceras inválidas. Se requiere la columna code')
+    summary = {'created': 0, 'updated': 0, 'unchanged': 0, 'skipped': 0, 'price_changes': 0, 'errors': []}
+    counters = _reference_counters(company_id)
+    chunk = []
+    try:
+        for idx, row in enumerate(reader, start=2):
+            code = (row.get('code') or '').strip()
+            if not code:
+                summary['skipped'] += 1
+                continue
+            chunk.append((idx, code, row))
+            if len(chunk) >= chunk_size:
+                _apply_product_chunk(company_id, chunk, counters, summary, changed_by)
+                chunk = []
+    except UnicodeDecodeError:
+        raise ValueError('El archivo debe estar codificado en UTF-8')
+    if chunk:
+        _apply_product_chunk(company_id, chunk, counters, summary, changed_by)
+    return summary
+
+
+@app.cli.command('products_import')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--company-id', required=True, type=int, help='Empresa dueña del catálogo.')
+@click.option('--user-id', default=None, type=int, help='Usuario registrado en el historial de precios.')
+@click.option('--chunk-size', default=None, type=int, help='Filas por lote (default PRODUCT_IMPORT_CHUNK_SIZE).')
+def products_import_command(path, company_id, user_id, chunk_size):
+    """Importa o actualiza un catálogo CSV (code, name, unit, price, category, has_itbis)."""
+    started = time.perf_counter()
+    with open(path, encoding='utf-8', newline='') as fh:
+        try:
+            summary = import_products_csv(company_id, fh, changed_by=user_id, chunk_size=chunk_size)
+        except ValueError as exc:
+            db.session.rollback()
+            raise click.ClickException(str(exc))
+    if summary['created'] or summary['updated']:
+        bump_catalog_version(company_id)
+    db.session.commit()
+    for line, message in summary['errors']:
+        click.echo(f'línea {line}: {message}', err=True)
+    click.echo(f'products import ({time.perf_counter() - started:.1f}s)')
+    for key in ('created', 'updated', 'unchanged', 'skipped', 'price_changes'):
+        click.echo(f'{key + ":":<15} {summary[key]}')
+
+
 @app.route('/productos/export')
 def export_products():
     """Export product catalog as CSV, optionally filtered by category."""
@@ -3426,11 +5096,32 @@ def export_products():
 def delete_product(product_id):
     product = company_get(Product, product_id)
     db.session.delete(product)
+    bump_catalog_version(product.company_id)
     db.session.commit()
     flash('Producto eliminado')
     return redirect(url_for('products'))
 
 
+def _parse_as_of(value):
+    """Turn a ``YYYY-MM-DD`` filter into the last instant of that day, or ``None``."""
+    try:
+        day = datetime.strptime((value or '').strip(), '%Y-%m-%d')
+    except ValueError:
+        return None
+    return day + timedelta(days=1, microseconds=-1)
+
+
+def _stock_valuation(levels: dict[int, int]) -> float:
+    """Value ``{product_id: stock}`` at the products' current ``cost_price``."""
+    total = 0.0
+    product_ids = sorted(levels)
+    for start in range(0, len(product_ids), inventory.BULK_CHUNK_SIZE):
+        chunk = product_ids[start:start + inventory.BULK_CHUNK_SIZE]
+        for pid, cost in db.session.query(Product.id, Product.cost_price).filter(Product.id.in_(chunk)):
+            total += levels[pid] * (cost or 0)
+    return total
+
+
 @app.route('/inventario')
 def inventory_report():
     wid = request.args.get('warehouse_id', type=int)
@@ -3439,13 +5130,21 @@ def inventory_report():
     status = request.args.get('status', '')
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 25, type=int)
+    as_of_raw = request.args.get('as_of', '').strip()
+    as_of = _parse_as_of(as_of_raw)
 
     warehouses = company_query(Warehouse).order_by(Warehouse.name).all()
     stocks = []
     pagination = None
     movements = []
+    historical = None
+    historical_value = None
+    pending_suggestions = 0
     if not wid and warehouses:
         wid = warehouses[0].id
+    warehouse = next((w for w in warehouses if w.id == wid), None)
+    if as_of and warehouse is None:
+        as_of = None
     if wid:
         query = (
             company_query(ProductStock)
@@ -3457,11 +5156,12 @@ def inventory_report():
             query = query.filter(or_(Product.name.ilike(like), Product.code.ilike(like)))
         if category:
             query = query.filter(Product.category == category)
-        if status == 'low':
+        # Status compares today's stock with the minimum, so it does not apply to a past date.
+        if status == 'low' and not as_of:
             query = query.filter(ProductStock.stock > 0, ProductStock.stock <= ProductStock.min_stock)
-        elif status == 'zero':
+        elif status == 'zero' and not as_of:
             query = query.filter(ProductStock.stock == 0)
-        elif status == 'normal':
+        elif status == 'normal' and not as_of:
             query = query.filter(ProductStock.stock > ProductStock.min_stock)
 
         pagination = (
@@ -3469,6 +5169,14 @@ def inventory_report():
             .paginate(page=page, per_page=per_page, error_out=False)
         )
         stocks = pagination.items
+        pending_suggestions = (
+            company_query(ProductStock)
+            .filter(ProductStock.warehouse_id == wid, ProductStock.suggested_min_stock.isnot(None))
+            .count()
+        )
+        if as_of:
+            historical = inventory.stock_as_of(warehouse.company_id, wid, as_of)
+            historical_value = _stock_valuation(historical)
         movements = (
             company_query(InventoryMovement)
             .filter_by(warehouse_id=wid)
@@ -3477,25 +5185,202 @@ def inventory_report():
             .all()
         )
 
-    sales_total = (
-        db.session.query(func.sum(Invoice.total))
-        .filter_by(company_id=current_company_id(), warehouse_id=wid)
-        .scalar()
-        or 0
+    sales_total = (
+        db.session.query(func.sum(Invoice.total))
+        .filter_by(company_id=current_company_id(), warehouse_id=wid)
+        .scalar()
+        or 0
+    )
+    return render_template(
+        'inventario.html',
+        stocks=stocks,
+        warehouses=warehouses,
+        selected=wid,
+        sales_total=sales_total,
+        pagination=pagination,
+        q=q,
+        category=category,
+        status=status,
+        categories=CATEGORIES,
+        per_page=per_page,
+        movements=movements,
+        as_of=as_of_raw if as_of else '',
+        historical=historical,
+        historical_value=historical_value,
+        pending_suggestions=pending_suggestions,
+    )
+
+
+def _stock_movement_version(company_id: int) -> int:
+    """Id of the latest movement of ``company_id``; every stock change logs one."""
+    return int(
+        db.session.query(func.max(InventoryMovement.id))
+        .filter(InventoryMovement.company_id == company_id)
+        .scalar()
+        or 0
+    )
+
+
+def _rotation_query(company_id: int, days: int, warehouse_id: int | None = None):
+    """Per product/warehouse stock, cost, value and outflow over the last ``days`` days.
+
+    Returns ``(query, columns)``; ``columns`` holds the SQL expressions so
+    callers can regroup the same joins. Outflow counts ``salida`` movements
+    (sales and transfers out) in one grouped subquery.
+    """
+    since = dom_now() - timedelta(days=days)
+    outflows = (
+        db.session.query(
+            InventoryMovement.warehouse_id.label('warehouse_id'),
+            InventoryMovement.product_id.label('product_id'),
+            func.sum(InventoryMovement.quantity).label('qty'),
+        )
+        .filter(
+            InventoryMovement.company_id == company_id,
+            InventoryMovement.movement_type == 'salida',
+            InventoryMovement.timestamp >= since,
+        )
+        .group_by(InventoryMovement.warehouse_id, InventoryMovement.product_id)
+        .subquery()
+    )
+    stock = func.coalesce(ProductStock.stock, 0)
+    cost = func.coalesce(Product.cost_price, 0)
+    outflow = func.coalesce(outflows.c.qty, 0)
+    columns = {
+        'stock': stock,
+        'cost': cost,
+        'value': stock * cost,
+        'outflow': outflow,
+        # No outflow, or more stock than SLOW_MOVER_DAYS of outflow at the window's pace.
+        'slow': and_(stock > 0, stock * days > outflow * SLOW_MOVER_DAYS),
+    }
+    query = (
+        db.session.query(ProductStock.warehouse_id, Warehouse.name)
+        .join(Product, Product.id == ProductStock.product_id)
+        .join(Warehouse, Warehouse.id == ProductStock.warehouse_id)
+        .outerjoin(outflows, and_(
+            outflows.c.warehouse_id == ProductStock.warehouse_id,
+            outflows.c.product_id == ProductStock.product_id,
+        ))
+        .filter(ProductStock.company_id == company_id)
+    )
+    if warehouse_id:
+        query = query.filter(ProductStock.warehouse_id == warehouse_id)
+    return query, columns
+
+
+def _days_of_inventory(stock, outflow, days: int):
+    return round(stock * days / outflow, 1) if outflow else None
+
+
+def inventory_valuation(company_id: int, days: int | None = None) -> dict:
+    """Valuation, rotation and slow movers per warehouse of ``company_id``.
+
+    Two grouped queries build the payload; it is cached per company until a
+    stock movement, a catalog edit (cost changes) or the day changes.
+    """
+    days = max(int(days or INVENTORY_ROTATION_DAYS), 1)
+    key = (_stock_movement_version(company_id), catalog_version(company_id), days, dom_now().date())
+    cached = _inventory_valuation_cache.get(company_id)
+    if cached and cached[0] == key:
+        return cached[1]
+    query, col = _rotation_query(company_id, days)
+    warehouses = []
+    for wid, name, units, value, outflow, outflow_value, slow_count, slow_value in (
+        query.with_entities(
+            ProductStock.warehouse_id,
+            Warehouse.name,
+            func.sum(col['stock']),
+            func.sum(col['value']),
+            func.sum(col['outflow']),
+            func.sum(col['outflow'] * col['cost']),
+            func.sum(case((col['slow'], 1), else_=0)),
+            func.sum(case((col['slow'], col['value']), else_=0)),
+        )
+        .group_by(ProductStock.warehouse_id, Warehouse.name)
+        .order_by(Warehouse.name)
+    ):
+        units, outflow = int(units or 0), int(outflow or 0)
+        warehouses.append({
+            'warehouse_id': wid,
+            'warehouse': name,
+            'units': units,
+            'value': float(value or 0),
+            'outflow': outflow,
+            'outflow_value': float(outflow_value or 0),
+            'days_of_inventory': _days_of_inventory(units, outflow, days),
+            'slow_count': int(slow_count or 0),
+            'slow_value': float(slow_value or 0),
+        })
+    slow_movers = [
+        {
+            'warehouse': wh, 'code': code, 'name': name, 'stock': int(stock or 0),
+            'value': float(value or 0), 'outflow': int(outflow or 0),
+            'days_of_inventory': _days_of_inventory(int(stock or 0), int(outflow or 0), days),
+        }
+        for _, wh, code, name, stock, value, outflow in (
+            query.add_columns(Product.code, Product.name, col['stock'], col['value'], col['outflow'])
+            .filter(col['slow'])
+            .order_by(col['value'].desc(), Product.name)
+            .limit(SLOW_MOVER_LIMIT)
+        )
+    ]
+    payload = {
+        'days': days,
+        'slow_days': SLOW_MOVER_DAYS,
+        'warehouses': warehouses,
+        'slow_movers': slow_movers,
+        'total_value': sum(w['value'] for w in warehouses),
+    }
+    _inventory_valuation_cache[company_id] = (key, payload)
+    return payload
+
+
+@app.get('/reportes/inventario/valoracion')
+def inventory_valuation_report():
+    if session.get('role') not in ('admin', 'manager', 'contabilidad'):
+        return '', 403
+    cid = current_company_id()
+    if not cid:
+        flash('Selecciona una empresa para ver la valoración de inventario')
+        return redirect(url_for('reportes'))
+    report = inventory_valuation(cid, request.args.get('days', type=int))
+    return render_template('inventario_valoracion.html', report=report)
+
+
+@app.get('/reportes/inventario/valoracion/export')
+def export_inventory_valuation():
+    if session.get('role') not in ('admin', 'manager', 'contabilidad'):
+        return '', 403
+    cid = current_company_id()
+    days = max(request.args.get('days', INVENTORY_ROTATION_DAYS, type=int) or INVENTORY_ROTATION_DAYS, 1)
+    query, col = _rotation_query(cid, days, request.args.get('warehouse_id', type=int))
+    query = (
+        query.add_columns(Product.code, Product.name, col['stock'], col['cost'], col['value'], col['outflow'], col['slow'])
+        .order_by(Warehouse.name, Product.name)
     )
-    return render_template(
-        'inventario.html',
-        stocks=stocks,
-        warehouses=warehouses,
-        selected=wid,
-        sales_total=sales_total,
-        pagination=pagination,
-        q=q,
-        category=category,
-        status=status,
-        categories=CATEGORIES,
-        per_page=per_page,
-        movements=movements,
+
+    def generate_csv():
+        sio = StringIO()
+        writer = csv.writer(sio)
+        writer.writerow(['Almacén', 'Código', 'Producto', 'Stock', 'Costo', 'Valor',
+                         f'Salidas {days} días', 'Días de inventario', 'Lento'])
+        yield sio.getvalue()
+        sio.seek(0)
+        sio.truncate(0)
+
+        for _, wh, code, name, stock, cost, value, outflow, slow in query.yield_per(500):
+            doi = _days_of_inventory(int(stock or 0), int(outflow or 0), days)
+            writer.writerow([wh or '', code or '', name or '', stock, f'{cost or 0:.2f}', f'{value or 0:.2f}',
+                             outflow, '' if doi is None else doi, 'sí' if slow else 'no'])
+            yield sio.getvalue()
+            sio.seek(0)
+            sio.truncate(0)
+
+    return Response(
+        generate_csv(),
+        mimetype='text/csv',
+        headers={'Content-Disposition': 'attachment; filename=inventario_valoracion.csv'}
     )
 
 
@@ -3508,20 +5393,112 @@ def update_min_stock(stock_id):
     return redirect(url_for('inventory_report', warehouse_id=stock.warehouse_id))
 
 
+def compute_reorder_suggestions(company_id: int, *, days: int | None = None,
+                                lead_time: float | None = None, z: float | None = None) -> int:
+    """Store a suggested ``min_stock`` on every stock row of ``company_id`` with recent sales.
+
+    Outbound history (transfers excluded) is summed per warehouse, product and
+    day in SQL and reduced by :func:`reorder.reorder_points`; previous
+    suggestions are cleared and the new ones written with one executemany.
+    Does not commit. Returns the number of rows with a suggestion.
+    """
+    import reorder  # pulls in numpy; keep it off the cold-start path
+
+    days = max(int(days or REORDER_HISTORY_DAYS), 1)
+    lead_time = REORDER_LEAD_TIME_DAYS if lead_time is None else lead_time
+    z = REORDER_SERVICE_Z if z is None else z
+    since = datetime.combine((dom_now() - timedelta(days=days - 1)).date(), datetime.min.time())
+    rows = db.session.execute(
+        db.select(
+            InventoryMovement.warehouse_id,
+            InventoryMovement.product_id,
+            func.sum(InventoryMovement.quantity),
+        )
+        .where(
+            InventoryMovement.company_id == company_id,
+            InventoryMovement.movement_type == 'salida',
+            InventoryMovement.warehouse_id.isnot(None),
+            InventoryMovement.timestamp >= since,
+            or_(InventoryMovement.reference_type.is_(None), InventoryMovement.reference_type != 'transfer'),
+        )
+        .group_by(InventoryMovement.warehouse_id, InventoryMovement.product_id, func.date(InventoryMovement.timestamp))
+    ).all()
+    points = reorder.reorder_points(rows, days=days, lead_time=lead_time, z=z)
+    table = ProductStock.__table__
+    db.session.execute(
+        table.update()
+        .where(table.c.company_id == company_id, table.c.suggested_min_stock.isnot(None))
+        .values(suggested_min_stock=None)
+    )
+    if not points:
+        return 0
+    result = db.session.execute(
+        table.update()
+        .where(
+            table.c.company_id == company_id,
+            table.c.warehouse_id == bindparam('b_wid'),
+            table.c.product_id == bindparam('b_pid'),
+        )
+        .values(suggested_min_stock=bindparam('b_point')),
+        [{'b_wid': wid, 'b_pid': pid, 'b_point': point} for (wid, pid), point in points.items()],
+    )
+    return result.rowcount if result.rowcount >= 0 else len(points)
+
+
+@app.cli.command('reorder_suggest')
+@click.option('--company-id', default=None, type=int, help='Solo esta empresa (default todas).')
+@click.option('--days', default=None, type=int, help='Días de historial (default REORDER_HISTORY_DAYS).')
+@click.option('--lead-time', default=None, type=float, help='Días de reposición (default REORDER_LEAD_TIME_DAYS).')
+@click.option('--z', 'z', default=None, type=float, help='Factor de nivel de servicio (default REORDER_SERVICE_Z).')
+def reorder_suggest_command(company_id, days, lead_time, z):
+    """Calcula el stock mínimo sugerido por almacén a partir de las salidas recientes."""
+    import reorder
+
+    started = time.perf_counter()
+    company_ids = [company_id] if company_id else [cid for (cid,) in db.session.query(CompanyInfo.id).order_by(CompanyInfo.id)]
+    total = 0
+    for cid in company_ids:
+        total += compute_reorder_suggestions(cid, days=days, lead_time=lead_time, z=z)
+        db.session.commit()
+    engine = 'numpy' if reorder.np is not None else 'python'
+    if reorder.np is None:
+        click.echo('Aviso: numpy no está instalado; se usó el cálculo en Python puro, mucho más lento '
+                   'en catálogos grandes (pip install numpy).', err=True)
+    click.echo(f'Sugerencias calculadas: {total} filas en {time.perf_counter() - started:.1f}s ({engine})')
+
+
+@app.post('/inventario/minimos/aplicar')
+@manager_only
+def apply_reorder_suggestions():
+    """Copy every pending suggestion of a warehouse into ``min_stock`` with one UPDATE."""
+    cid = current_company_id()
+    wid = _to_int(request.form.get('warehouse_id'))
+    company_get(Warehouse, wid)
+    scope = (
+        ProductStock.company_id == cid,
+        ProductStock.warehouse_id == wid,
+        ProductStock.suggested_min_stock.isnot(None),
+    )
+    product_ids = [pid for (pid,) in db.session.query(ProductStock.product_id).filter(*scope)]
+    ProductStock.query.filter(*scope).update(
+        {ProductStock.min_stock: ProductStock.suggested_min_stock, ProductStock.suggested_min_stock: None},
+        synchronize_session=False,
+    )
+    for start in range(0, len(product_ids), INVENTORY_IMPORT_CHUNK_SIZE):
+        _sync_low_stock_bulk(cid, wid, product_ids[start:start + INVENTORY_IMPORT_CHUNK_SIZE])
+    db.session.commit()
+    log_audit('reorder_apply', 'warehouse', wid, details={'rows': len(product_ids)})
+    flash(f'Mínimos actualizados: {len(product_ids)}')
+    return redirect(url_for('inventory_report', warehouse_id=wid))
+
+
 @app.route('/inventario/ajustar', methods=['GET', 'POST'])
 def inventory_adjust():
     product_q = (request.args.get('product_q') or '').strip()
     product_limit = 250
     products_query = company_query(Product)
     if product_q:
-        like = f'%{product_q}%'
-        products_query = products_query.filter(
-            or_(
-                Product.name.ilike(like),
-                Product.code.ilike(like),
-                Product.reference.ilike(like),
-            )
-        )
+        products_query = products_query.filter(Product.id.in_(matching_product_ids(product_q)))
     products = products_query.order_by(Product.name).limit(product_limit).all()
     product_count = products_query.order_by(None).count()
     products_truncated = product_count > len(products)
@@ -3531,40 +5508,25 @@ def inventory_adjust():
         wid = int(request.form['warehouse_id'])
         qty = _to_int(request.form['quantity'])
         mtype = request.form['movement_type']
+        cid = current_company_id()
         product = company_get(Product, pid)
-        stock = company_query(ProductStock).filter_by(product_id=pid, warehouse_id=wid).first()
-        if not stock:
-            stock = ProductStock(product_id=pid, warehouse_id=wid, company_id=current_company_id())
-            db.session.add(stock)
-        # ensure numeric defaults
-        if stock.stock is None:
-            stock.stock = 0
-        if product.stock is None:
-            product.stock = 0
-        if mtype == 'entrada':
-            stock.stock += qty
-            product.stock += qty
-            mov_qty = qty
-        elif mtype == 'salida':
-            if stock.stock < qty:
-                flash('Stock insuficiente')
-                return redirect(url_for('inventory_adjust'))
-            stock.stock -= qty
-            product.stock -= qty
-            mov_qty = qty
-        else:  # ajuste
-            mov_qty = abs(stock.stock - qty)
-            product.stock += qty - stock.stock
-            stock.stock = qty
-        mov = InventoryMovement(
-            product_id=product.id,
-            quantity=mov_qty,
-            movement_type=mtype,
-            warehouse_id=wid,
-            company_id=current_company_id(),
-            executed_by=session.get('user_id'),
-        )
-        db.session.add(mov)
+        company_get(Warehouse, wid)
+        try:
+            if mtype == 'entrada':
+                inventory.receive(cid, wid, [(product.id, qty)], executed_by=session.get('user_id'))
+            elif mtype == 'salida':
+                inventory.withdraw(cid, wid, [(product.id, qty)], executed_by=session.get('user_id'))
+            else:  # ajuste
+                inventory.set_level(cid, wid, product.id, qty, executed_by=session.get('user_id'))
+        except inventory.InsufficientStock:
+            db.session.rollback()
+            flash('Stock insuficiente')
+            return redirect(url_for('inventory_adjust'))
+        except ValueError:
+            db.session.rollback()
+            flash('Cantidad inválida')
+            return redirect(url_for('inventory_adjust'))
+        _sync_low_stock_rows(cid, [wid], [product.id])
         db.session.commit()
         flash('Inventario actualizado')
         return redirect(url_for('inventory_report', warehouse_id=wid))
@@ -3594,72 +5556,150 @@ def inventory_import():
             flash('Debe subir un archivo CSV válido')
             return render_template('inventario_importar.html', warehouses=warehouses)
 
-        stream = StringIO(file.stream.read().decode('utf-8'))
-        reader = csv.DictReader(stream)
-        expected = {'code', 'stock', 'min_stock'}
-        if not reader.fieldnames or not expected.issubset(set(reader.fieldnames)):
-            flash('Cabeceras inválidas. Se requieren: code, stock, min_stock')
+        company_get(Warehouse, wid)
+        try:
+            result = import_stock_csv(
+                current_company_id(), wid, TextIOWrapper(file.stream, encoding='utf-8', newline=''),
+                executed_by=session.get('user_id'),
+            )
+        except ValueError as exc:
+            db.session.rollback()
+            flash(str(exc))
             return render_template('inventario_importar.html', warehouses=warehouses)
+        if result['error_count']:
+            db.session.rollback()
+            flash(f"Importación cancelada. {result['error_count']} filas con errores.")
+            return render_template('inventario_importar.html', warehouses=warehouses, errors=result['errors'])
+
+        db.session.commit()
+        flash(f"Se importaron {result['imported']} productos")
+        return redirect(url_for('inventory_report', warehouse_id=wid))
+
+    return render_template('inventario_importar.html', warehouses=warehouses)
+
+
+def import_stock_csv(company_id: int, warehouse_id: int, lines, *, executed_by: int,
+                     chunk_size: int | None = None) -> dict:
+    """Stream a ``code,stock,min_stock`` CSV into ``warehouse_id``.
+
+    Codes resolve through one preloaded ``code -> id`` map for the tenant and
+    rows are applied in chunks with :func:`inventory.import_counts`, so memory
+    stays flat for any file size. Once a row fails, writing stops but the rest
+    of the file is still validated; the caller must roll back when
+    ``error_count`` is non-zero and commit otherwise. Raises ``ValueError``
+    for missing headers or a file that is not UTF-8.
+    """
+    chunk_size = chunk_size or INVENTORY_IMPORT_CHUNK_SIZE
+    reader = csv.DictReader(lines)
+    try:
+        fieldnames = reader.fieldnames
+    except UnicodeDecodeError:
+        raise ValueError('El archivo debe estar codificado en UTF-8')
+    if not fieldnames or not {'code', 'stock', 'min_stock'}.issubset(set(fieldnames)):
+        raise ValueError('Cabeceras inválidas. Se requieren: code, stock, min_stock')
+    product_ids = dict(db.session.query(Product.code, Product.id).filter(Product.company_id == company_id))
+    errors = []
+    error_count = 0
+    imported = 0
+    chunk = []
+
+    def _apply():
+        touched = inventory.import_counts(company_id, warehouse_id, chunk, executed_by=executed_by)
+        _sync_low_stock_bulk(company_id, warehouse_id, touched)
+        chunk.clear()
+
+    def _error(line, message):
+        nonlocal error_count
+        error_count += 1
+        if len(errors) < IMPORT_MAX_REPORTED_ERRORS:
+            errors.append((line, message))
 
-        errors = []
-        valid_rows = []
+    try:
         for idx, row in enumerate(reader, start=2):
             code = (row.get('code') or '').strip()
             if not code:
-                errors.append((idx, 'Código faltante'))
+                _error(idx, 'Código faltante')
                 continue
-            product = company_query(Product).filter_by(code=code).first()
-            if not product:
-                errors.append((idx, f'Producto {code} no encontrado'))
+            product_id = product_ids.get(code)
+            if product_id is None:
+                _error(idx, f'Producto {code} no encontrado')
                 continue
             try:
                 stock_qty = int(row.get('stock'))
             except (TypeError, ValueError):
-                errors.append((idx, f'Stock inválido para {code}'))
+                _error(idx, f'Stock inválido para {code}')
                 continue
             min_val = row.get('min_stock')
             try:
                 min_stock = int(min_val) if min_val not in (None, '') else None
             except ValueError:
-                errors.append((idx, f'Min stock inválido para {code}'))
+                _error(idx, f'Min stock inválido para {code}')
                 continue
-            valid_rows.append((product, stock_qty, min_stock))
-
-        if errors:
+            imported += 1
+            if error_count:
+                continue
+            chunk.append((product_id, stock_qty, min_stock))
+            if len(chunk) >= chunk_size:
+                _apply()
+    except UnicodeDecodeError:
+        raise ValueError('El archivo debe estar codificado en UTF-8')
+    if chunk and not error_count:
+        _apply()
+    return {'imported': imported, 'errors': errors, 'error_count': error_count}
+
+
+@app.cli.command('inventory_import')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--company-id', required=True, type=int, help='Empresa dueña del inventario.')
+@click.option('--warehouse-id', required=True, type=int, help='Almacén que recibe el conteo.')
+@click.option('--user-id', required=True, type=int, help='Usuario registrado como ejecutor de los movimientos.')
+@click.option('--chunk-size', default=None, type=int, help='Filas por lote (default INVENTORY_IMPORT_CHUNK_SIZE).')
+def inventory_import_command(path, company_id, warehouse_id, user_id, chunk_size):
+    """Importa un conteo de inventario CSV (code, stock, min_stock) sin límite de tamaño."""
+    warehouse = db.session.get(Warehouse, warehouse_id)
+    if warehouse is None or warehouse.company_id != company_id:
+        raise click.ClickException('Almacén no encontrado para la empresa indicada')
+    started = time.perf_counter()
+    with open(path, encoding='utf-8', newline='') as fh:
+        try:
+            result = import_stock_csv(company_id, warehouse_id, fh, executed_by=user_id, chunk_size=chunk_size)
+        except ValueError as exc:
             db.session.rollback()
-            flash(f'Importación cancelada. {len(errors)} filas con errores.')
-            return render_template('inventario_importar.html', warehouses=warehouses, errors=errors)
-
-        for product, stock_qty, min_stock in valid_rows:
-            product.stock = stock_qty
-            ps = (
-                company_query(ProductStock)
-                .filter_by(product_id=product.id, warehouse_id=wid)
-                .first()
-            )
-            if not ps:
-                ps = ProductStock(product_id=product.id, warehouse_id=wid, company_id=current_company_id())
-                db.session.add(ps)
-            ps.stock = stock_qty
-            if min_stock is not None:
-                ps.min_stock = min_stock
-                product.min_stock = min_stock
-            mov = InventoryMovement(
-                product_id=product.id,
-                quantity=stock_qty,
-                movement_type='entrada',
-                reference_type='import',
-                warehouse_id=wid,
-                company_id=current_company_id(),
-                executed_by=session.get('user_id'),
-            )
-            db.session.add(mov)
+            raise click.ClickException(str(exc))
+    if result['error_count']:
+        db.session.rollback()
+        for line, message in result['errors']:
+            click.echo(f'línea {line}: {message}', err=True)
+        raise click.ClickException(f"Importación cancelada. {result['error_count']} filas con errores.")
+    db.session.commit()
+    click.echo(f"Se importaron {result['imported']} filas en {time.perf_counter() - started:.1f}s")
 
-        db.session.commit()
-        flash(f'Se importaron {len(valid_rows)} productos')
-        return redirect(url_for('inventory_report', warehouse_id=wid))
 
-    return render_template('inventario_importar.html', warehouses=warehouses)
+@app.cli.command('inventory_checkpoint')
+@click.option('--company-id', default=None, type=int, help='Solo esta empresa (default todas).')
+@click.option('--warehouse-id', default=None, type=int, help='Solo este almacén.')
+def inventory_checkpoint_command(company_id, warehouse_id):
+    """Guarda el stock actual de cada almacén como punto de control del historial."""
+    rows = inventory.take_checkpoint(company_id, warehouse_id)
+    db.session.commit()
+    click.echo(f'Punto de control guardado: {rows} filas')
+
+
+@app.cli.command('inventory_verify')
+@click.option('--company-id', default=None, type=int, help='Solo esta empresa (default todas).')
+@click.option('--limit', default=50, type=int, help='Diferencias a mostrar.')
+def inventory_verify_command(company_id, limit):
+    """Compara el stock actual con el reconstruido desde puntos de control y movimientos."""
+    mismatches = inventory.verify_ledger(company_id)
+    for item in mismatches[:max(0, limit)]:
+        click.echo(
+            f"empresa {item['company_id']} almacén {item['warehouse_id']} producto {item['product_id']}: "
+            f"historial {item['expected']}, stock {item['actual']}",
+            err=True,
+        )
+    if mismatches:
+        raise click.ClickException(f'{len(mismatches)} diferencias entre el historial y el stock actual')
+    click.echo('Historial de inventario consistente')
 
 
 @app.route('/inventario/transferir', methods=['GET', 'POST'])
@@ -3668,14 +5708,7 @@ def inventory_transfer():
     product_limit = 250
     products_query = company_query(Product)
     if product_q:
-        like = f'%{product_q}%'
-        products_query = products_query.filter(
-            or_(
-                Product.name.ilike(like),
-                Product.code.ilike(like),
-                Product.reference.ilike(like),
-            )
-        )
+        products_query = products_query.filter(Product.id.in_(matching_product_ids(product_q)))
     products = products_query.order_by(Product.name).limit(product_limit).all()
     product_count = products_query.order_by(None).count()
     products_truncated = product_count > len(products)
@@ -3688,45 +5721,16 @@ def inventory_transfer():
         if origin == dest:
             flash('Seleccione almacenes distintos')
             return redirect(url_for('inventory_transfer'))
-        o_stock = (
-            company_query(ProductStock)
-            .filter_by(product_id=pid, warehouse_id=origin)
-            .first()
-        )
-        d_stock = (
-            company_query(ProductStock)
-            .filter_by(product_id=pid, warehouse_id=dest)
-            .first()
-        )
-        if not o_stock or o_stock.stock < qty:
+        cid = current_company_id()
+        company_get(Product, pid)
+        company_get(Warehouse, dest)
+        try:
+            inventory.transfer(cid, pid, origin, dest, qty, executed_by=session.get('user_id'))
+        except (inventory.InsufficientStock, ValueError):
+            db.session.rollback()
             flash('Stock insuficiente')
             return redirect(url_for('inventory_transfer'))
-        if not d_stock:
-            d_stock = ProductStock(product_id=pid, warehouse_id=dest, stock=0, company_id=current_company_id())
-            db.session.add(d_stock)
-        o_stock.stock -= qty
-        d_stock.stock += qty
-        mov_out = InventoryMovement(
-            product_id=pid,
-            quantity=qty,
-            movement_type='salida',
-            warehouse_id=origin,
-            company_id=current_company_id(),
-            reference_type='transfer',
-            reference_id=dest,
-            executed_by=session.get('user_id'),
-        )
-        mov_in = InventoryMovement(
-            product_id=pid,
-            quantity=qty,
-            movement_type='entrada',
-            warehouse_id=dest,
-            company_id=current_company_id(),
-            reference_type='transfer',
-            reference_id=origin,
-            executed_by=session.get('user_id'),
-        )
-        db.session.add_all([mov_out, mov_in])
+        _sync_low_stock_rows(cid, [origin, dest], [pid])
         db.session.commit()
         flash('Transferencia realizada')
         return redirect(url_for('inventory_report', warehouse_id=dest))
@@ -3786,6 +5790,7 @@ def edit_product(product_id):
         product.category = request.form.get('category')
         product.has_itbis = bool(request.form.get('has_itbis'))
         _log_product_price_change(product, old_price, old_cost_price)
+        bump_catalog_version(product.company_id)
         db.session.commit()
         flash('Producto actualizado')
         if warning_msg:
@@ -3906,14 +5911,14 @@ def list_quotations():
         archived = _resolve_archived_pdf_path(
             doc_type,
             q.id,
-            company_name=(getattr(g, 'company', None).name if getattr(g, 'company', None) else None),
+            company_name=_current_tenant_name(),
             company_id=current_company_id(),
         )
         if archived.exists():
             url = _archived_download_url(
                 doc_type,
                 q.id,
-                company_name=(getattr(g, 'company', None).name if getattr(g, 'company', None) else None),
+                company_name=_current_tenant_name(),
                 company_id=current_company_id(),
                 full_path=str(archived),
             )
@@ -3976,9 +5981,9 @@ def new_quotation():
         for it in items:
             q_item = QuotationItem(quotation_id=quotation.id, **it)
             db.session.add(q_item)
+        notify('Cotización guardada')
         db.session.commit()
         flash('Cotización guardada')
-        notify('Cotización guardada')
         log_audit('quotation_create', 'quotation', quotation.id, details=f'client={client.id};total={total:.2f}')
 
         company_name = (db.session.get(CompanyInfo, quotation.company_id).name if quotation.company_id else None)
@@ -3987,12 +5992,9 @@ def new_quotation():
     clients = company_query(Client).options(
         load_only(Client.id, Client.name, Client.identifier)
     ).all()
-    products = company_query(Product).options(
-        load_only(Product.id, Product.code, Product.name, Product.unit, Product.price)
-    ).all()
     warehouses = company_query(Warehouse).order_by(Warehouse.name).all()
     sellers = company_query(User).options(load_only(User.id, User.first_name, User.last_name)).all()
-    return render_template('cotizacion.html', clients=clients, products=products, warehouses=warehouses, sellers=sellers, validity_options=QUOTATION_VALIDITY_OPTIONS)
+    return render_template('cotizacion.html', clients=clients, warehouses=warehouses, sellers=sellers, validity_options=QUOTATION_VALIDITY_OPTIONS)
 
 
 @app.route('/cotizaciones/nuevo-servicio', methods=['GET', 'POST'])
@@ -4097,20 +6099,11 @@ def new_service_quotation():
             for it in items:
                 db.session.add(OrderItem(order_id=service_order.id, **it))
 
-            company_obj = db.session.get(CompanyInfo, current_company_id())
             if client.is_final_consumer:
-                prefix, counter = 'B02', 'ncf_final'
-                invoice_type = 'Consumidor Final'
+                prefix, invoice_type = 'B02', 'Consumidor Final'
             else:
-                prefix, counter = 'B01', 'ncf_fiscal'
-                invoice_type = 'Crédito Fiscal'
-            while True:
-                seq = getattr(company_obj, counter)
-                ncf = f"{prefix}{seq:08d}"
-                if not Invoice.query.filter_by(ncf=ncf).first():
-                    setattr(company_obj, counter, seq + 1)
-                    break
-                setattr(company_obj, counter, seq + 1)
+                prefix, invoice_type = 'B01', 'Crédito Fiscal'
+            ncf = allocate_ncf(current_company_id(), prefix)
 
             invoice = Invoice(
                 client_id=client.id,
@@ -4135,12 +6128,12 @@ def new_service_quotation():
                 db.session.add(InvoiceItem(invoice_id=invoice.id, **it))
             invoice_created = True
 
+        notify('Servicio guardado')
         db.session.commit()
 
         flash('Servicio guardado')
         if invoice_created:
             flash('Factura creada desde servicio')
-        notify('Servicio guardado')
         log_audit('service_create', 'quotation', quotation.id, details=f'client={client.id};total={total:.2f}')
 
         company_name = (db.session.get(CompanyInfo, quotation.company_id).name if quotation.company_id else None)
@@ -4286,9 +6279,11 @@ def edit_quotation(quotation_id):
         flash('Cotización actualizada')
         log_audit('quotation_update', 'quotation', quotation.id, details=f'total={total:.2f}')
         return redirect(url_for('list_quotations'))
+    # Only the quotation's own products are rendered; the form fills the rest from /api/catalog.
+    names = {it.product_name for it in quotation.items}
     products = company_query(Product).options(
         load_only(Product.id, Product.code, Product.name, Product.unit, Product.price)
-    ).all()
+    ).filter(Product.name.in_(names)).all() if names else []
     product_map = {p.name: p.id for p in products}
     items = []
     for it in quotation.items:
@@ -4321,7 +6316,7 @@ def settings():
 @app.route('/ajustes/empresa', methods=['GET', 'POST'])
 @manager_only
 def settings_company():
-    company = db.session.get(CompanyInfo, current_company_id())
+    company = request_company()
     if not company:
         flash('Seleccione una empresa')
         return redirect(url_for('admin_companies'))
@@ -4388,7 +6383,9 @@ def settings_company():
             company.ncf_final = new_final
         if new_fiscal is not None:
             company.ncf_fiscal = new_fiscal
-        if old_final != company.ncf_final or old_fiscal != company.ncf_fiscal:
+        ncf_changed = old_final != company.ncf_final or old_fiscal != company.ncf_fiscal
+        if ncf_changed:
+            ncf_sequence.bump_epoch(company)
             log = NcfLog(
                 company_id=company.id,
                 old_final=old_final,
@@ -4399,6 +6396,7 @@ def settings_company():
             )
             db.session.add(log)
         db.session.commit()
+        invalidate_tenant_cache(company.id)
         flash('Ajustes guardados')
         return redirect(url_for('settings_company'))
     owner_user = (
@@ -4616,20 +6614,11 @@ def generate_service_invoice_from_quotation(quotation_id):
             company_id=current_company_id(),
         ))
 
-    company_obj = db.session.get(CompanyInfo, current_company_id())
     if client.is_final_consumer:
-        prefix, counter = 'B02', 'ncf_final'
-        invoice_type = 'Consumidor Final'
+        prefix, invoice_type = 'B02', 'Consumidor Final'
     else:
-        prefix, counter = 'B01', 'ncf_fiscal'
-        invoice_type = 'Crédito Fiscal'
-    while True:
-        seq = getattr(company_obj, counter)
-        ncf = f"{prefix}{seq:08d}"
-        if not Invoice.query.filter_by(ncf=ncf).first():
-            setattr(company_obj, counter, seq + 1)
-            break
-        setattr(company_obj, counter, seq + 1)
+        prefix, invoice_type = 'B01', 'Crédito Fiscal'
+    ncf = allocate_ncf(current_company_id(), prefix)
 
     invoice = Invoice(
         client_id=client.id,
@@ -4693,16 +6682,22 @@ def quotation_to_order(quotation_id):
     if dom_now() > quotation.valid_until:
         flash('La cotización ha expirado')
         return redirect(url_for('list_quotations'))
-    for item in quotation.items:
-        product = company_query(Product).filter_by(code=item.code).first()
-        stock = (
-            company_query(ProductStock)
-            .filter_by(product_id=product.id, warehouse_id=wid)
-            .first()
-        )
-        if not stock or stock.stock < item.quantity:
+    items = list(quotation.items)
+    codes = {item.code for item in items}
+    products_by_code = {
+        product.code: product.id
+        for product in company_query(Product).options(load_only(Product.id, Product.code)).filter(Product.code.in_(codes))
+    } if codes else {}
+    lines = []
+    line_names = {}
+    for item in items:
+        product_id = products_by_code.get(item.code)
+        if product_id is None:
             flash('Stock insuficiente para ' + item.product_name)
             return redirect(url_for('list_quotations'))
+        if item.quantity > 0:
+            lines.append((product_id, item.quantity))
+            line_names.setdefault(product_id, item.product_name)
     order = Order(
         client_id=quotation.client_id,
         quotation_id=quotation.id,
@@ -4720,47 +6715,40 @@ def quotation_to_order(quotation_id):
     db.session.add(order)
     quotation.status = 'convertida'
     db.session.flush()
-    for item in quotation.items:
-        o_item = OrderItem(
-            order_id=order.id,
-            code=item.code,
-            reference=item.reference,
-            product_name=item.product_name,
-            unit=item.unit,
-            unit_price=item.unit_price,
-            quantity=item.quantity,
-            discount=item.discount,
-            category=item.category,
-            has_itbis=item.has_itbis,
-            company_id=current_company_id(),
-        )
-        db.session.add(o_item)
-        product = company_query(Product).filter_by(code=item.code).first()
-        if product:
-            ps = (
-                company_query(ProductStock)
-                .filter_by(product_id=product.id, warehouse_id=wid)
-                .first()
-            )
-            if ps:
-                ps.stock -= item.quantity
-            product.stock -= item.quantity
-            mov = InventoryMovement(
-                product_id=product.id,
+    if items:
+        # One executemany for all lines; the ORM would flush an INSERT per OrderItem.
+        db.session.execute(OrderItem.__table__.insert(), [
+            dict(
+                order_id=order.id,
+                code=item.code,
+                reference=item.reference,
+                product_name=item.product_name,
+                unit=item.unit,
+                unit_price=item.unit_price,
                 quantity=item.quantity,
-                movement_type='salida',
-                reference_type='Order',
-                reference_id=order.id,
-                warehouse_id=wid,
+                discount=item.discount,
+                category=item.category,
+                has_itbis=item.has_itbis,
                 company_id=current_company_id(),
-                executed_by=session.get('user_id'),
             )
-            db.session.add(mov)
+            for item in items
+        ])
+    try:
+        # Validates every line against one locked read, then decrements all rows in a single UPDATE.
+        inventory.withdraw(
+            current_company_id(), wid, lines,
+            executed_by=session.get('user_id'), reference_type='Order', reference_id=order.id,
+        )
+    except inventory.InsufficientStock as exc:
+        db.session.rollback()
+        flash('Stock insuficiente para ' + line_names.get(exc.product_id, str(exc.product_id)))
+        return redirect(url_for('list_quotations'))
+    _sync_low_stock_rows(current_company_id(), [wid], line_names)
+    notify('Pedido creado')
     db.session.commit()
-    company_name = (db.session.get(CompanyInfo, order.company_id).name if order.company_id else None)
+    company_name = _current_tenant_name()
     _schedule_document_pdf_generation('pedido', order.id, order.company_id, company_name)
     flash('Pedido creado')
-    notify('Pedido creado')
     return redirect(url_for('list_orders'))
 
 # Orders
@@ -4774,7 +6762,7 @@ def list_orders():
     pagination = query.options(joinedload(Order.client)).order_by(Order.date.desc()).paginate(page=page, per_page=20, error_out=False)
     orders = pagination.items
     archived_order_urls = {}
-    company_name = (getattr(g, 'company', None).name if getattr(g, 'company', None) else None)
+    company_name = _current_tenant_name()
     for o in orders:
         if o.generated_doc_path:
             archived_order_urls[o.id] = o.generated_doc_path
@@ -4827,20 +6815,8 @@ def send_order_email(order_id):
 @app.route('/pedidos/<int:order_id>/facturar')
 def order_to_invoice(order_id):
     order = company_get(Order, order_id)
-    company = db.session.get(CompanyInfo, current_company_id())
-    if order.client.is_final_consumer:
-        prefix, counter = "B02", "ncf_final"
-    else:
-        prefix, counter = "B01", "ncf_fiscal"
-
-    # ensure NCF is unique; advance company counter until unused
-    while True:
-        seq = getattr(company, counter)
-        ncf = f"{prefix}{seq:08d}"
-        if not Invoice.query.filter_by(ncf=ncf).first():
-            setattr(company, counter, seq + 1)
-            break
-        setattr(company, counter, seq + 1)
+    prefix = "B02" if order.client.is_final_consumer else "B01"
+    ncf = allocate_ncf(current_company_id(), prefix)
     invoice = Invoice(
         client_id=order.client_id,
         order_id=order.id,
@@ -4877,11 +6853,11 @@ def order_to_invoice(order_id):
         )
         db.session.add(i_item)
     order.status = 'Entregado'
+    notify('Factura generada')
     db.session.commit()
-    company_name = (db.session.get(CompanyInfo, invoice.company_id).name if invoice.company_id else None)
+    company_name = _current_tenant_name()
     _schedule_document_pdf_generation(_invoice_doc_type(invoice), invoice.id, invoice.company_id, company_name)
     flash('Factura generada')
-    notify('Factura generada')
     log_audit('invoice_create', 'invoice', invoice.id, details=f'from_order={order.id};total={invoice.total:.2f}')
     return redirect(url_for('list_invoices'))
 
@@ -4925,28 +6901,6 @@ def _order_generated_docs_url(order: Order, company_name: str | None = None) ->
     raise RuntimeError(f'No se pudo resolver URL pública para pedido {order.id}')
 
 
-@app.route('/pedidos/<int:order_id>/archivo')
-def order_archived_link(order_id):
-    return ('Not Found', 404)
-
-
-@app.route('/pedidos/<int:order_id>/archivo')
-def order_archived_link(order_id):
-    return ('Not Found', 404)
-
-
-@app.route('/pedidos/<int:order_id>/archivo', endpoint='order_archived_link_404')
-def order_archived_link_404(order_id):
-    return ('Not Found', 404)
-
-
-app.add_url_rule(
-    '/pedidos/<int:order_id>/archivo',
-    endpoint='order_archived_link_404',
-    view_func=_archivo_legacy_not_found,
-)
-
-
 # Invoices
 @app.route('/facturas')
 def list_invoices():
@@ -4958,7 +6912,7 @@ def list_invoices():
     pagination = query.options(joinedload(Invoice.client)).order_by(Invoice.date.desc()).paginate(page=page, per_page=20, error_out=False)
     invoices = pagination.items
     archived_invoice_urls = {}
-    company_name = (getattr(g, 'company', None).name if getattr(g, 'company', None) else None)
+    company_name = _current_tenant_name()
     for f in invoices:
         if f.generated_doc_path:
             archived_invoice_urls[f.id] = f.generated_doc_path
@@ -4979,6 +6933,153 @@ def list_invoices():
     return render_template('factura.html', invoices=invoices, q=q, archived_invoice_urls=archived_invoice_urls, pagination=pagination)
 
 
+def _zip_render_workers() -> int:
+    raw = str(current_app.config.get('ZIP_RENDER_WORKERS', os.getenv('ZIP_RENDER_WORKERS', '2'))).strip()
+    try:
+        return max(1, min(int(raw), 8))
+    except (TypeError, ValueError):
+        return 2
+
+
+def _zip_max_documents() -> int:
+    raw = str(current_app.config.get('ZIP_MAX_DOCUMENTS', os.getenv('ZIP_MAX_DOCUMENTS', '1000'))).strip()
+    try:
+        return max(1, int(raw))
+    except (TypeError, ValueError):
+        return 1000
+
+
+class _ZipStreamBuffer:
+    """Write-only sink for ``zipfile`` that hands finished chunks to a generator.
+
+    ``zipfile`` falls back to data descriptors when the target is not seekable,
+    so the archive can be emitted incrementally without holding it in memory.
+    """
+
+    def __init__(self):
+        self._chunks: list[bytes] = []
+        self._offset = 0
+
+    def write(self, data) -> int:
+        if data:
+            self._chunks.append(bytes(data))
+            self._offset += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._offset
+
+    def flush(self) -> None:
+        return None
+
+    def drain(self) -> bytes:
+        payload = b''.join(self._chunks)
+        self._chunks.clear()
+        return payload
+
+
+ZIP_READ_CHUNK_BYTES = 64 * 1024
+
+
+def _invoice_archive_file(invoice: Invoice, *, company_name: str | None, company_id: int | None) -> Path | None:
+    stored = _stored_generated_doc_file(invoice.generated_doc_path, company_id=company_id, company_name=company_name)
+    if stored is not None:
+        return stored
+    archived = _resolve_archived_pdf_path(_invoice_doc_type(invoice), invoice.id, company_name=company_name, company_id=company_id)
+    return archived if archived.exists() else None
+
+
+def _render_invoice_archive_file(invoice_id: int, company_id: int, company_name: str | None) -> Path | None:
+    invoice = db.session.get(Invoice, invoice_id)
+    if not invoice or invoice.company_id != company_id:
+        return None
+    _invoice_generated_docs_url(invoice, company_name=company_name)
+    archived = _resolve_archived_pdf_path(_invoice_doc_type(invoice), invoice.id, company_name=company_name, company_id=company_id)
+    return archived if archived.exists() else None
+
+
+def _invoice_zip_entry_name(invoice: Invoice) -> str:
+    suffix = f"-{secure_filename(invoice.ncf)}" if invoice.ncf else ''
+    return f"{_invoice_doc_type(invoice)}-{invoice.id:05d}{suffix}.pdf"
+
+
+@app.route('/facturas/zip')
+def download_invoices_zip():
+    desde = request.args.get('desde')
+    hasta = request.args.get('hasta')
+    start, end, _, _, _ = _parse_report_params(desde, hasta, None, None)
+    if not start and not end:
+        now = dom_now()
+        start = datetime(now.year, now.month, 1)
+    query = company_query(Invoice)
+    if start:
+        query = query.filter(Invoice.date >= start)
+    if end:
+        query = query.filter(Invoice.date < end + timedelta(days=1))
+    max_docs = _zip_max_documents()
+    if _count_up_to_limit(query, max_docs + 1) > max_docs:
+        flash(f'El rango seleccionado supera el límite de {max_docs} facturas por archivo ZIP')
+        return redirect(url_for('list_invoices'))
+
+    cid = current_company_id()
+    company_name = _current_tenant_name()
+    workers = _zip_render_workers()
+    batch_size = workers * 4
+    invoice_ids = [row[0] for row in query.with_entities(Invoice.id).order_by(Invoice.date, Invoice.id)]
+
+    def generate_zip():
+        sink = _ZipStreamBuffer()
+        failed: list[str] = []
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='zip-pdf') as pool:
+            with zipfile.ZipFile(sink, mode='w', compression=zipfile.ZIP_STORED) as zf:
+                for offset in range(0, len(invoice_ids), batch_size):
+                    batch = (
+                        company_query(Invoice)
+                        .options(joinedload(Invoice.items), joinedload(Invoice.order))
+                        .filter(Invoice.id.in_(invoice_ids[offset:offset + batch_size]))
+                        .order_by(Invoice.date, Invoice.id)
+                        .all()
+                    )
+                    pending = []
+                    for invoice in batch:
+                        archived = _invoice_archive_file(invoice, company_name=company_name, company_id=cid)
+                        if archived is None:
+                            # Each task gets its own request-context copy so worker threads use their own DB session.
+                            archived = pool.submit(copy_current_request_context(_render_invoice_archive_file), invoice.id, cid, company_name)
+                        pending.append((invoice, archived))
+                    for invoice, source in pending:
+                        entry_name = _invoice_zip_entry_name(invoice)
+                        try:
+                            path = source if isinstance(source, Path) else source.result()
+                        except Exception as exc:
+                            app.logger.warning('ZIP render failed for invoice %s: %s', invoice.id, exc)
+                            path = None
+                        if path is None:
+                            failed.append(entry_name)
+                            continue
+                        with path.open('rb') as src, zf.open(entry_name, mode='w', force_zip64=True) as dest:
+                            while True:
+                                chunk = src.read(ZIP_READ_CHUNK_BYTES)
+                                if not chunk:
+                                    break
+                                dest.write(chunk)
+                                yield sink.drain()
+                        yield sink.drain()
+                    db.session.expunge_all()
+                if failed:
+                    zf.writestr('errores.txt', 'No se pudieron generar:\n' + '\n'.join(failed) + '\n')
+            yield sink.drain()
+
+    label_start = start.strftime('%Y%m%d') if start else 'inicio'
+    label_end = end.strftime('%Y%m%d') if end else dom_now().strftime('%Y%m%d')
+    log_audit('invoice_zip_download', 'invoice', details={'desde': desde or '', 'hasta': hasta or '', 'count': len(invoice_ids)})
+    return Response(
+        stream_with_context(generate_zip()),
+        mimetype='application/zip',
+        headers={'Content-Disposition': f'attachment; filename=facturas-{label_start}-{label_end}.zip'},
+    )
+
+
 @app.route('/facturas/<int:invoice_id>/enviar', methods=['POST'])
 def send_invoice_email(invoice_id):
     invoice = company_get(Invoice, invoice_id)
@@ -5112,28 +7213,6 @@ def _invoice_generated_docs_url(invoice: Invoice, company_name: str | None = Non
     raise RuntimeError(f'No se pudo resolver URL pública para factura {invoice.id}')
 
 
-@app.route('/facturas/<int:invoice_id>/archivo')
-def invoice_archived_link(invoice_id):
-    return ('Not Found', 404)
-
-
-@app.route('/facturas/<int:invoice_id>/archivo')
-def invoice_archived_link(invoice_id):
-    return ('Not Found', 404)
-
-
-@app.route('/facturas/<int:invoice_id>/archivo', endpoint='invoice_archived_link_404')
-def invoice_archived_link_404(invoice_id):
-    return ('Not Found', 404)
-
-
-app.add_url_rule(
-    '/facturas/<int:invoice_id>/archivo',
-    endpoint='invoice_archived_link_404',
-    view_func=_archivo_legacy_not_found,
-)
-
-
 @app.route('/generated-docs/<path:filename>')
 @app.route('/generated_docs/<path:filename>')
 def download_generated_doc(filename):
@@ -5640,12 +7719,13 @@ def account_statement_detail(client_id):
             aging['121+'] += balance
     overdue = sum(r['balance'] for r in rows if datetime.strptime(r['due'], '%d/%m/%Y') < now)
     overdue_pct = (overdue / totals * 100) if totals else 0
+    company_row = request_company()
     company = {
-        'name': g.company.name,
-        'street': g.company.street,
-        'phone': g.company.phone,
-        'rnc': g.company.rnc,
-        'logo': g.company.logo,
+        'name': company_row.name,
+        'street': company_row.street,
+        'phone': company_row.phone,
+        'rnc': company_row.rnc,
+        'logo': company_row.logo,
     }
     full_name = " ".join(part for part in [(client.name or '').strip(), (client.last_name or '').strip()] if part).strip()
     client_dict = {
@@ -5874,12 +7954,12 @@ def export_reportes():
     ).all()
 
     if formato == 'xlsx':
-        if Workbook is None:
+        wb = _new_workbook()
+        if wb is None:
             mem = BytesIO()
             mem.write(b'')
             mem.seek(0)
             return send_file(mem, mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', as_attachment=True, download_name='reportes.xlsx')
-        wb = Workbook()
         ws = wb.active
         row = 1
         for h in header:
@@ -5985,6 +8065,8 @@ def export_inventory():
     if role not in ('admin', 'manager', 'contabilidad'):
         return '', 403
     company_id = current_company_id()
+    as_of_raw = request.args.get('as_of', '').strip()
+    as_of = _parse_as_of(as_of_raw)
     query = (
         db.session.query(
             Product.code,
@@ -5992,31 +8074,47 @@ def export_inventory():
             Warehouse.name,
             ProductStock.stock,
             ProductStock.min_stock,
+            ProductStock.warehouse_id,
+            Product.id,
+            Product.cost_price,
         )
         .join(ProductStock, Product.id == ProductStock.product_id)
         .join(Warehouse, ProductStock.warehouse_id == Warehouse.id)
         .filter(ProductStock.company_id == company_id)
         .order_by(Product.name)
     )
+    # Past levels are replayed once per warehouse (checkpoint + movements), not per row.
+    historical = {}
+    if as_of:
+        warehouse_ids = [w.id for w in Warehouse.query.filter_by(company_id=company_id).with_entities(Warehouse.id)]
+        historical = {w: inventory.stock_as_of(company_id, w, as_of) for w in warehouse_ids}
 
     def generate_csv():
         sio = StringIO()
         writer = csv.writer(sio)
-        writer.writerow(['Código', 'Producto', 'Almacén', 'Stock', 'Mínimo'])
+        header = ['Código', 'Producto', 'Almacén', 'Stock', 'Mínimo']
+        if as_of:
+            header += [f'Stock al {as_of_raw}', 'Costo', 'Valor']
+        writer.writerow(header)
         yield sio.getvalue()
         sio.seek(0)
         sio.truncate(0)
 
-        for code, name, wh, stock, min_stock in query.yield_per(500):
-            writer.writerow([code or '', name or '', wh or '', stock, min_stock])
+        for code, name, wh, stock, min_stock, wid, pid, cost in query.yield_per(500):
+            row = [code or '', name or '', wh or '', stock, min_stock]
+            if as_of:
+                level = historical.get(wid, {}).get(pid, 0)
+                row += [level, f'{cost or 0:.2f}', f'{level * (cost or 0):.2f}']
+            writer.writerow(row)
             yield sio.getvalue()
             sio.seek(0)
             sio.truncate(0)
 
+    filename = f'inventario_{as_of_raw}.csv' if as_of else 'inventario.csv'
     return Response(
         generate_csv(),
         mimetype='text/csv',
-        headers={'Content-Disposition': 'attachment; filename=inventario.csv'}
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
     )
 
 
@@ -6098,6 +8196,83 @@ def api_recommendations():
     """Return top product recommendations based on past orders."""
     return jsonify({'products': recommend_products(current_company_id())})
 
+@app.cli.command('bootstrap')
+@click.option('--skip-schema', is_flag=True, help='No sincroniza el esquema de base de datos.')
+@click.option('--skip-archive', is_flag=True, help='No crea las carpetas del archivo PDF.')
+def bootstrap_command(skip_schema, skip_archive):
+    """Tareas de arranque diferidas por FAST_START (ejecutar una vez por despliegue)."""
+    phases = []
+
+    def _run(name, fn):
+        started = time.perf_counter()
+        fn()
+        phases.append((name, (time.perf_counter() - started) * 1000))
+
+    if not skip_schema:
+        _run('schema_sync', ensure_admin)
+    if not skip_archive:
+        _run('pdf_archive_dirs', ensure_pdf_archive_environment)
+    click.echo('bootstrap complete')
+    for name, elapsed_ms in phases:
+        click.echo(f'{name + ":":<18} {elapsed_ms:.1f} ms')
+
+
+# --- Fork safety (gunicorn --preload / Passenger smart spawning) ---
+_worker_process = {'pid': os.getpid()}
+
+
+def init_worker_process() -> bool:
+    """Reset per-process state after fork(); safe to call more than once.
+
+    Pooled DB connections inherited from the parent are dropped without
+    closing them (the parent still owns the sockets), inherited queues and
+    locks are replaced, and the log listener is restarted. Email dispatcher
+    threads start lazily on the first request of the new worker.
+    Returns ``False`` when this process was already initialized.
+    """
+    global _email_queue, _email_worker_thread, _email_dispatcher_lock, _email_outbox_wakeup
+    global _sql_stats_lock, _sql_stats_thread, _sql_stats_thread_lock
+    global _rnc_data_lock, _tenant_cache_lock, _low_stock_thread, _low_stock_lock
+    if _worker_process['pid'] == os.getpid():
+        return False
+    _worker_process['pid'] = os.getpid()
+    _start_log_listener(fresh_queue=True)
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+    _email_queue = ThreadQueue()
+    _email_worker_thread = None
+    _email_dispatcher_threads.clear()
+    _email_dispatcher_lock = threading.Lock()
+    _email_outbox_wakeup = threading.Event()
+    _sql_stats_lock = threading.Lock()
+    _sql_stats.clear()
+    _sql_stats_state.update({'window_start': None, 'last_flush': time.time()})
+    _sql_stats_thread = None
+    _sql_stats_thread_lock = threading.Lock()
+    _rnc_data_lock = threading.Lock()
+    _tenant_cache_lock = threading.Lock()
+    _low_stock_thread = None
+    _low_stock_lock = threading.Lock()
+    return True
+
+
+def _release_preload_resources() -> None:
+    # Bootstrap queries leave pooled connections behind; a preloading master should not hold them.
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=init_worker_process)
+_release_preload_resources()
+
+
+STARTUP_PHASES.append(('module_init_total', round((time.perf_counter() - _IMPORT_STARTED_AT) * 1000, 1)))
+_json_log('startup_timing', fast_start=FAST_START, pid=os.getpid(), phases=dict(STARTUP_PHASES))
+
+
 if __name__ == '__main__':
     debug = os.environ.get('FLASK_DEBUG', '').strip().lower() in {'1', 'true', 'yes', 'on'}
     host = os.environ.get('HOST', '127.0.0.1')
@@ -18,6 +18,9 @@ class BaseConfig:
     PUBLIC_DOCS_BASE_URL = os.environ.get("PUBLIC_DOCS_BASE_URL")
     PDF_LOG_DIR = os.environ.get("PDF_LOG_DIR")
     PDF_LOCK_WAIT_SECONDS = os.environ.get("PDF_LOCK_WAIT_SECONDS", "30")
+    ZIP_RENDER_WORKERS = os.environ.get("ZIP_RENDER_WORKERS", "2")
+    ZIP_MAX_DOCUMENTS = os.environ.get("ZIP_MAX_DOCUMENTS", "1000")
+    METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
 
 
 class DevelopmentConfig(BaseConfig):
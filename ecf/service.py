@@ -30,7 +30,6 @@ from ecf.repository import (
 from ecf.signer import sign_xml
 from ecf.xml_builder import build_ecf_xml
 from models import CompanyInfo, Invoice, InvoiceItem, db
-from weasy_pdf import generate_pdf_bytes
 
 logger = logging.getLogger(__name__)
 
@@ -225,6 +224,8 @@ def _generate_pdf_from_invoice(doc: EcfDocument) -> bytes | None:
         "email": getattr(invoice.client, "email", ""),
     }
 
+    from weasy_pdf import generate_pdf_bytes  # fpdf is only needed once a PDF is rendered
+
     return generate_pdf_bytes(
         "Factura",
         company,
@@ -0,0 +1,430 @@
+"""Stock mutations applied as conditional UPDATE statements.
+
+Every change is a single ``UPDATE ... SET stock = stock +/- :qty`` evaluated
+by the database, so concurrent sales never overwrite each other's decrements,
+and withdrawals add ``AND stock >= :qty`` so they cannot oversell. Rows are
+always updated in ``(warehouse_id, product_id)`` order, which keeps lock
+acquisition consistent between transactions touching the same products and
+avoids deadlocks on multi-item orders.
+
+Every movement also stores its signed ``delta``, so stock at any past moment
+is the latest :class:`InventoryCheckpoint` before it plus the deltas logged
+since (see :func:`stock_as_of`).
+
+Nothing here commits: the caller owns the transaction, writes its own rows in
+it, and rolls back when :class:`InsufficientStock` is raised.
+"""
+from __future__ import annotations
+
+from sqlalchemy import and_, bindparam, case, func, insert, literal, select, update
+from sqlalchemy.exc import IntegrityError
+
+from models import InventoryCheckpoint, InventoryMovement, Product, ProductStock, db, dom_now
+
+_stock = ProductStock.__table__
+_product = Product.__table__
+_movement = InventoryMovement.__table__
+_checkpoint = InventoryCheckpoint.__table__
+# Products per bulk statement; keeps IN lists and CASE maps under driver bind-parameter limits.
+BULK_CHUNK_SIZE = 200
+
+
+class InsufficientStock(Exception):
+    """Raised when a withdrawal would leave a warehouse below zero."""
+
+    def __init__(self, product_id: int, warehouse_id: int, requested: int):
+        super().__init__(f'Stock insuficiente: producto {product_id}, almacén {warehouse_id}, solicitado {requested}')
+        self.product_id = product_id
+        self.warehouse_id = warehouse_id
+        self.requested = requested
+
+
+def _merge_lines(lines) -> list[tuple[int, int]]:
+    """Sum quantities per product and return them in lock order."""
+    merged: dict[int, int] = {}
+    for product_id, qty in lines:
+        qty = int(qty)
+        if qty <= 0:
+            raise ValueError(f'Cantidad inválida para producto {product_id}: {qty}')
+        merged[int(product_id)] = merged.get(int(product_id), 0) + qty
+    return sorted(merged.items())
+
+
+def _take(company_id: int, warehouse_id: int, product_id: int, qty: int) -> None:
+    result = db.session.execute(
+        update(_stock)
+        .where(
+            _stock.c.company_id == company_id,
+            _stock.c.warehouse_id == warehouse_id,
+            _stock.c.product_id == product_id,
+            _stock.c.stock >= qty,
+        )
+        .values(stock=_stock.c.stock - qty)
+    )
+    if result.rowcount != 1:
+        raise InsufficientStock(product_id, warehouse_id, qty)
+
+
+def _put(company_id: int, warehouse_id: int, product_id: int, qty: int) -> None:
+    stmt = (
+        update(_stock)
+        .where(
+            _stock.c.company_id == company_id,
+            _stock.c.warehouse_id == warehouse_id,
+            _stock.c.product_id == product_id,
+        )
+        .values(stock=func.coalesce(_stock.c.stock, 0) + qty)
+    )
+    if db.session.execute(stmt).rowcount:
+        return
+    try:
+        with db.session.begin_nested():
+            db.session.execute(insert(_stock).values(
+                company_id=company_id, warehouse_id=warehouse_id, product_id=product_id, stock=qty, min_stock=0,
+            ))
+    except IntegrityError:
+        # A concurrent transaction created the row first (uix_product_wh); add to it instead.
+        db.session.execute(stmt)
+
+
+def _add_product_total(company_id: int, product_id: int, delta: int) -> None:
+    if delta:
+        db.session.execute(
+            update(_product)
+            .where(_product.c.id == product_id, _product.c.company_id == company_id)
+            .values(stock=func.coalesce(_product.c.stock, 0) + delta)
+        )
+
+
+def _record_movements(rows: list[dict]) -> None:
+    if rows:
+        now = dom_now()
+        db.session.execute(insert(InventoryMovement), [dict(row, timestamp=now) for row in rows])
+
+
+def _chunks(items: list, size: int = BULK_CHUNK_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _take_many(company_id: int, warehouse_id: int, chunk: list[tuple[int, int]]) -> None:
+    product_ids = [product_id for product_id, _ in chunk]
+    requested = dict(chunk)
+    where = (
+        _stock.c.company_id == company_id,
+        _stock.c.warehouse_id == warehouse_id,
+        _stock.c.product_id.in_(product_ids),
+    )
+    available = dict(db.session.execute(
+        select(_stock.c.product_id, _stock.c.stock).where(*where).order_by(_stock.c.product_id).with_for_update()
+    ).all())
+    for product_id, qty in chunk:
+        if (available.get(product_id) or 0) < qty:
+            raise InsufficientStock(product_id, warehouse_id, qty)
+    wanted = case(requested, value=_stock.c.product_id)
+    result = db.session.execute(
+        update(_stock).where(*where, _stock.c.stock >= wanted).values(stock=_stock.c.stock - wanted)
+    )
+    if result.rowcount != len(chunk):
+        # Another transaction took stock between the read and the UPDATE; rows left untouched are the short ones.
+        after = dict(db.session.execute(select(_stock.c.product_id, _stock.c.stock).where(*where)).all())
+        short = next((pid for pid, _ in chunk if after.get(pid) == available.get(pid)), product_ids[0])
+        raise InsufficientStock(short, warehouse_id, requested[short])
+    db.session.execute(
+        update(_product)
+        .where(_product.c.id.in_(product_ids), _product.c.company_id == company_id)
+        .values(stock=func.coalesce(_product.c.stock, 0) - case(requested, value=_product.c.id))
+    )
+
+
+def withdraw(company_id: int, warehouse_id: int, lines, *, executed_by: int,
+             reference_type: str | None = None, reference_id: int | None = None) -> list[tuple[int, int]]:
+    """Take ``(product_id, qty)`` lines out of ``warehouse_id`` and log ``salida`` movements.
+
+    Stock for all lines is read with one locking ``IN`` query, validated in
+    memory and decremented by one conditional ``UPDATE`` per chunk, so the
+    number of round trips does not grow with the number of lines. Raises
+    :class:`InsufficientStock` for the first line the warehouse cannot cover;
+    the caller's rollback undoes anything already applied.
+    """
+    merged = _merge_lines(lines)
+    for chunk in _chunks(merged):
+        _take_many(company_id, warehouse_id, chunk)
+    _record_movements([
+        {'product_id': product_id, 'quantity': qty, 'delta': -qty, 'movement_type': 'salida',
+         'warehouse_id': warehouse_id, 'company_id': company_id, 'reference_type': reference_type,
+         'reference_id': reference_id, 'executed_by': executed_by}
+        for product_id, qty in merged
+    ])
+    return merged
+
+
+def receive(company_id: int, warehouse_id: int, lines, *, executed_by: int,
+            reference_type: str | None = None, reference_id: int | None = None) -> list[tuple[int, int]]:
+    """Add ``(product_id, qty)`` lines to ``warehouse_id`` and log ``entrada`` movements."""
+    merged = _merge_lines(lines)
+    for product_id, qty in merged:
+        _put(company_id, warehouse_id, product_id, qty)
+        _add_product_total(company_id, product_id, qty)
+    _record_movements([
+        {'product_id': product_id, 'quantity': qty, 'delta': qty, 'movement_type': 'entrada',
+         'warehouse_id': warehouse_id, 'company_id': company_id, 'reference_type': reference_type,
+         'reference_id': reference_id, 'executed_by': executed_by}
+        for product_id, qty in merged
+    ])
+    return merged
+
+
+def set_level(company_id: int, warehouse_id: int, product_id: int, qty: int, *, executed_by: int) -> int:
+    """Set the counted stock of one product in ``warehouse_id`` and log an ``ajuste`` movement.
+
+    The row is read with ``SELECT ... FOR UPDATE`` so the difference applied
+    to ``Product.stock`` matches the value being replaced. Returns the delta.
+    """
+    qty = int(qty)
+    current = db.session.execute(
+        select(_stock.c.id, _stock.c.stock)
+        .where(
+            _stock.c.company_id == company_id,
+            _stock.c.warehouse_id == warehouse_id,
+            _stock.c.product_id == product_id,
+        )
+        .with_for_update()
+    ).first()
+    if current is None:
+        previous = 0
+        _put(company_id, warehouse_id, product_id, qty)
+    else:
+        previous = int(current.stock or 0)
+        db.session.execute(update(_stock).where(_stock.c.id == current.id).values(stock=qty))
+    delta = qty - previous
+    _add_product_total(company_id, product_id, delta)
+    _record_movements([{
+        'product_id': product_id, 'quantity': abs(delta), 'delta': delta, 'movement_type': 'ajuste',
+        'warehouse_id': warehouse_id, 'company_id': company_id, 'reference_type': None, 'reference_id': None,
+        'executed_by': executed_by,
+    }])
+    return delta
+
+
+def import_counts(company_id: int, warehouse_id: int, rows, *, executed_by: int) -> list[int]:
+    """Apply a chunk of counted ``(product_id, stock, min_stock)`` rows to ``warehouse_id``.
+
+    Stock rows are updated or inserted with one executemany each, the matching
+    ``Product`` totals and minimums follow the imported values, and every row
+    is logged as an ``entrada`` movement of type ``import``. When a product
+    appears twice, the last row wins. ``min_stock`` of ``None`` keeps the
+    current minimum. Returns the product ids touched.
+    """
+    rows = list(rows)
+    latest: dict[int, tuple[int, int | None]] = {}
+    for product_id, stock, min_stock in rows:
+        latest[int(product_id)] = (int(stock), min_stock)
+    if not latest:
+        return []
+    product_ids = sorted(latest)
+    existing = {}
+    previous: dict[int, int] = {}
+    for row in db.session.execute(
+        select(_stock.c.product_id, _stock.c.id, _stock.c.stock).where(
+            _stock.c.company_id == company_id,
+            _stock.c.warehouse_id == warehouse_id,
+            _stock.c.product_id.in_(product_ids),
+        ).with_for_update()
+    ):
+        existing[row.product_id] = row.id
+        previous[row.product_id] = int(row.stock or 0)
+    updates = [
+        {'b_id': existing[pid], 'b_stock': latest[pid][0], 'b_min': latest[pid][1]}
+        for pid in product_ids if pid in existing
+    ]
+    if updates:
+        db.session.execute(
+            update(_stock)
+            .where(_stock.c.id == bindparam('b_id'))
+            .values(stock=bindparam('b_stock'), min_stock=func.coalesce(bindparam('b_min'), _stock.c.min_stock)),
+            updates,
+        )
+    inserts = [
+        {'company_id': company_id, 'warehouse_id': warehouse_id, 'product_id': pid,
+         'stock': latest[pid][0], 'min_stock': latest[pid][1] or 0}
+        for pid in product_ids if pid not in existing
+    ]
+    if inserts:
+        db.session.execute(insert(_stock), inserts)
+    db.session.execute(
+        update(_product)
+        .where(_product.c.id == bindparam('b_id'), _product.c.company_id == company_id)
+        .values(stock=bindparam('b_stock'), min_stock=func.coalesce(bindparam('b_min'), _product.c.min_stock)),
+        [{'b_id': pid, 'b_stock': latest[pid][0], 'b_min': latest[pid][1]} for pid in product_ids],
+    )
+    movements = []
+    for product_id, stock, _ in rows:
+        product_id, stock = int(product_id), int(stock)
+        movements.append({
+            'product_id': product_id, 'quantity': stock, 'delta': stock - previous.get(product_id, 0),
+            'movement_type': 'entrada', 'warehouse_id': warehouse_id, 'company_id': company_id,
+            'reference_type': 'import', 'reference_id': None, 'executed_by': executed_by,
+        })
+        previous[product_id] = stock
+    _record_movements(movements)
+    return product_ids
+
+
+def transfer(company_id: int, product_id: int, origin_id: int, dest_id: int, qty: int, *, executed_by: int) -> None:
+    """Move ``qty`` units between warehouses; ``Product.stock`` is unchanged."""
+    qty = int(qty)
+    if qty <= 0:
+        raise ValueError(f'Cantidad inválida para producto {product_id}: {qty}')
+    # Lock the lower warehouse id first, whichever direction the transfer goes.
+    for warehouse_id in sorted((origin_id, dest_id)):
+        if warehouse_id == origin_id:
+            _take(company_id, origin_id, product_id, qty)
+        else:
+            _put(company_id, dest_id, product_id, qty)
+    _record_movements([
+        {'product_id': product_id, 'quantity': qty, 'delta': -qty, 'movement_type': 'salida',
+         'warehouse_id': origin_id, 'company_id': company_id, 'reference_type': 'transfer',
+         'reference_id': dest_id, 'executed_by': executed_by},
+        {'product_id': product_id, 'quantity': qty, 'delta': qty, 'movement_type': 'entrada',
+         'warehouse_id': dest_id, 'company_id': company_id, 'reference_type': 'transfer',
+         'reference_id': origin_id, 'executed_by': executed_by},
+    ])
+
+
+def movement_delta():
+    """Signed stock change of a movement row as a SQL expression.
+
+    Rows logged before ``delta`` existed fall back to ``+quantity`` for
+    ``entrada`` and ``-quantity`` for ``salida``; their ``ajuste`` rows did not
+    record a direction and count as zero.
+    """
+    return func.coalesce(_movement.c.delta, case(
+        (_movement.c.movement_type == 'entrada', _movement.c.quantity),
+        (_movement.c.movement_type == 'salida', -_movement.c.quantity),
+        else_=0,
+    ))
+
+
+def take_checkpoint(company_id: int | None = None, warehouse_id: int | None = None, *, taken_at=None) -> int:
+    """Copy current ``ProductStock`` rows into checkpoints with one ``INSERT ... SELECT``.
+
+    The stock rows in scope are locked first (``SELECT ... FOR UPDATE``, in
+    the same order the mutations use). Every writer updates those rows before
+    it logs its movement, so once the locks are held each movement of the
+    scope is either committed and reflected in the copied levels or not
+    numbered yet. Each row then records the highest movement id of its own
+    warehouse, and replays continue from that id instead of from
+    ``taken_at``. Limited to ``company_id``/``warehouse_id`` when given.
+    Returns the number of rows written.
+    """
+    taken_at = taken_at or dom_now()
+    stock_scope, movement_scope = [], []
+    if company_id is not None:
+        stock_scope.append(_stock.c.company_id == company_id)
+        movement_scope.append(_movement.c.company_id == company_id)
+    if warehouse_id is not None:
+        stock_scope.append(_stock.c.warehouse_id == warehouse_id)
+        movement_scope.append(_movement.c.warehouse_id == warehouse_id)
+    db.session.execute(
+        select(_stock.c.id).where(*stock_scope)
+        .order_by(_stock.c.company_id, _stock.c.warehouse_id, _stock.c.product_id)
+        .with_for_update()
+    ).all()
+    watermark = (
+        select(_movement.c.company_id, _movement.c.warehouse_id, func.max(_movement.c.id).label('last_id'))
+        .where(*movement_scope)
+        .group_by(_movement.c.company_id, _movement.c.warehouse_id)
+        .subquery()
+    )
+    source = (
+        select(
+            _stock.c.company_id, _stock.c.warehouse_id, _stock.c.product_id,
+            func.coalesce(_stock.c.stock, 0), literal(taken_at, _checkpoint.c.taken_at.type),
+            func.coalesce(watermark.c.last_id, 0),
+        )
+        .select_from(_stock.outerjoin(watermark, and_(
+            watermark.c.company_id == _stock.c.company_id,
+            watermark.c.warehouse_id == _stock.c.warehouse_id,
+        )))
+        .where(*stock_scope)
+    )
+    result = db.session.execute(insert(_checkpoint).from_select(
+        ['company_id', 'warehouse_id', 'product_id', 'stock', 'taken_at', 'last_movement_id'], source,
+    ))
+    return result.rowcount
+
+
+def stock_as_of(company_id: int, warehouse_id: int, as_of, product_ids=None) -> dict[int, int]:
+    """Return ``{product_id: stock}`` for ``warehouse_id`` at ``as_of``.
+
+    Starts from the latest checkpoint taken at or before ``as_of`` and adds
+    the deltas of the movements it did not include (``id`` above its
+    ``last_movement_id``) up to ``as_of`` inclusive; timestamps alone would
+    drop movements logged in the checkpoint's second or committed after it.
+    Without a checkpoint the whole ledger is replayed from zero. Products
+    with no stock row at that moment are omitted.
+    """
+    base_at, last_movement_id = db.session.execute(
+        select(_checkpoint.c.taken_at, _checkpoint.c.last_movement_id)
+        .where(
+            _checkpoint.c.company_id == company_id,
+            _checkpoint.c.warehouse_id == warehouse_id,
+            _checkpoint.c.taken_at <= as_of,
+        )
+        .order_by(_checkpoint.c.taken_at.desc(), _checkpoint.c.last_movement_id.desc())
+        .limit(1)
+    ).first() or (None, None)
+    if product_ids is not None:
+        product_ids = sorted({int(pid) for pid in product_ids})
+    levels: dict[int, int] = {}
+    if base_at is not None:
+        base = select(_checkpoint.c.product_id, _checkpoint.c.stock).where(
+            _checkpoint.c.company_id == company_id,
+            _checkpoint.c.warehouse_id == warehouse_id,
+            _checkpoint.c.taken_at == base_at,
+            _checkpoint.c.last_movement_id == last_movement_id,
+        )
+        if product_ids is not None:
+            base = base.where(_checkpoint.c.product_id.in_(product_ids))
+        levels.update((pid, int(stock or 0)) for pid, stock in db.session.execute(base))
+    deltas = (
+        select(_movement.c.product_id, func.sum(movement_delta()))
+        .where(
+            _movement.c.company_id == company_id,
+            _movement.c.warehouse_id == warehouse_id,
+            _movement.c.timestamp <= as_of,
+        )
+        .group_by(_movement.c.product_id)
+    )
+    if base_at is not None:
+        deltas = deltas.where(_movement.c.id > last_movement_id)
+    if product_ids is not None:
+        deltas = deltas.where(_movement.c.product_id.in_(product_ids))
+    for pid, delta in db.session.execute(deltas):
+        levels[pid] = levels.get(pid, 0) + int(delta or 0)
+    return levels
+
+
+def verify_ledger(company_id: int | None = None) -> list[dict]:
+    """Compare ``ProductStock`` with the stock replayed from checkpoints and movements.
+
+    Returns one ``{company_id, warehouse_id, product_id, expected, actual}``
+    dict per mismatch, where ``expected`` is the replayed value.
+    """
+    query = select(_stock.c.company_id, _stock.c.warehouse_id, _stock.c.product_id, _stock.c.stock)
+    if company_id is not None:
+        query = query.where(_stock.c.company_id == company_id)
+    current: dict[tuple[int, int], dict[int, int]] = {}
+    for cid, wid, pid, stock in db.session.execute(query):
+        current.setdefault((cid, wid), {})[pid] = int(stock or 0)
+    now = dom_now()
+    mismatches = []
+    for (cid, wid), actual in sorted(current.items()):
+        replayed = stock_as_of(cid, wid, now)
+        for pid in sorted(set(actual) | set(replayed)):
+            expected, found = replayed.get(pid, 0), actual.get(pid, 0)
+            if expected != found:
+                mismatches.append({'company_id': cid, 'warehouse_id': wid, 'product_id': pid,
+                                   'expected': expected, 'actual': found})
+    return mismatches
@@ -0,0 +1,287 @@
+"""Minimal Prometheus text-format metrics shared across worker processes.
+
+Each process keeps its counters and histograms in memory and periodically
+writes a JSON snapshot to ``<directory>/metrics-<pid>.json``. A scrape merges
+every snapshot in the directory, so totals stay correct behind Passenger or
+gunicorn with several workers without extra dependencies.
+
+Snapshots of workers that are no longer running are folded into a single
+``metrics-retired.json`` (counters and histograms only), so exported counters
+never go backwards when a worker exits or its pid is reused.
+"""
+from __future__ import annotations
+
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _labels_key(labels: dict) -> tuple:
+    return tuple(sorted((str(k), str(v)) for k, v in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labels, extra: tuple = ()) -> str:
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True  # exists but belongs to another user
+    return True
+
+
+def _accumulate(counters: dict, histograms: dict, snap: dict) -> None:
+    for name, labels, value in snap.get('counters', []):
+        key = (name, tuple(map(tuple, labels)))
+        counters[key] = counters.get(key, 0.0) + value
+    for name, labels, state in snap.get('histograms', []):
+        key = (name, tuple(map(tuple, labels)))
+        merged = histograms.get(key)
+        if merged is None or len(merged) != len(state):
+            histograms[key] = list(state)
+        else:
+            histograms[key] = [a + b for a, b in zip(merged, state)]
+
+
+def _read_json(path: Path) -> dict:
+    try:
+        return json.loads(path.read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_json(path: Path, data: dict) -> None:
+    tmp = path.with_suffix(f'.{os.getpid()}.{threading.get_ident()}.tmp')
+    tmp.write_text(json.dumps(data), encoding='utf-8')
+    os.replace(tmp, path)
+
+
+@contextmanager
+def _dir_lock(directory: Path):
+    if fcntl is None:
+        yield
+        return
+    with open(directory / 'metrics-retired.lock', 'a') as handle:
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class MetricsRegistry:
+    RETIRED = 'metrics-retired.json'
+
+    def __init__(self, directory: str | None = None, flush_interval: float = 5.0):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._meta: dict[str, tuple[str, str, tuple]] = {}
+        self._reset()
+
+    def _reset(self) -> None:
+        self._pid = os.getpid()
+        self._counters: dict[tuple, float] = {}
+        self._histograms: dict[tuple, list[float]] = {}
+        self._gauges: dict[tuple, float] = {}
+        self._last_flush = 0.0
+        self._owns_file = False
+
+    def _check_fork(self) -> None:
+        # A forked worker must not re-publish the parent's samples under its own pid.
+        if os.getpid() != self._pid:
+            self._reset()
+
+    def describe(self, name: str, kind: str, help_text: str, buckets: tuple = DEFAULT_BUCKETS) -> None:
+        self._meta[name] = (kind, help_text, tuple(buckets))
+
+    def inc(self, name: str, value: float = 1.0, **labels) -> None:
+        key = (name, _labels_key(labels))
+        with self._lock:
+            self._check_fork()
+            self._counters[key] = self._counters.get(key, 0.0) + value
+
+    def set_gauge(self, name: str, value: float, **labels) -> None:
+        """Record a per-process gauge; scrapes label it with the owning ``pid``."""
+        key = (name, _labels_key(labels))
+        with self._lock:
+            self._check_fork()
+            self._gauges[key] = float(value)
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        buckets = self._meta.get(name, ('histogram', '', DEFAULT_BUCKETS))[2]
+        key = (name, _labels_key(labels))
+        with self._lock:
+            self._check_fork()
+            state = self._histograms.get(key)
+            if state is None:
+                state = self._histograms[key] = [0.0] * (len(buckets) + 2)
+            for idx, bound in enumerate(buckets):
+                if value <= bound:
+                    state[idx] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            self._check_fork()
+            return {
+                'counters': [[name, list(map(list, labels)), value] for (name, labels), value in self._counters.items()],
+                'histograms': [[name, list(map(list, labels)), list(state)] for (name, labels), state in self._histograms.items()],
+                'gauges': [[name, list(map(list, labels)), value] for (name, labels), value in self._gauges.items()],
+            }
+
+    def _path(self) -> Path | None:
+        if not self.directory:
+            return None
+        return Path(self.directory) / f'metrics-{os.getpid()}.json'
+
+    def flush(self, force: bool = False) -> None:
+        path = self._path()
+        now = time.time()
+        if path is None or (not force and now - self._last_flush < self.flush_interval):
+            return
+        self._last_flush = now
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            if not self._owns_file:
+                # A file under our pid before our first flush was left by a dead
+                # process with the same pid; overwriting it would drop its totals.
+                if path.exists():
+                    with _dir_lock(path.parent):
+                        self._retire(path)
+                self._owns_file = True
+            _write_json(path, self.snapshot())
+        except OSError:
+            pass
+
+    def _retire(self, path: Path) -> None:
+        """Fold a dead worker's counters and histograms into the retired snapshot.
+
+        Callers hold ``_dir_lock``, so scrapes never see a snapshot both in the
+        retired totals and in its own file.
+        """
+        counters: dict[tuple, float] = {}
+        histograms: dict[tuple, list[float]] = {}
+        retired = path.parent / self.RETIRED
+        _accumulate(counters, histograms, _read_json(retired))
+        _accumulate(counters, histograms, _read_json(path))
+        _write_json(retired, {
+            'counters': [[name, list(map(list, labels)), value] for (name, labels), value in counters.items()],
+            'histograms': [[name, list(map(list, labels)), state] for (name, labels), state in histograms.items()],
+        })
+        path.unlink()
+
+    def collect(self) -> dict:
+        """Merge this process' live samples with every other worker's snapshot.
+
+        Snapshots of pids that are no longer alive are retired on the way.
+        """
+        snapshots = [(self.snapshot(), str(os.getpid()), True)]
+        own = self._path()
+        # Gauges of workers that stopped flushing (hung or stopped) are dropped.
+        gauge_max_age = max(60.0, self.flush_interval * 12)
+        if own is not None and own.parent.is_dir():
+            now = time.time()
+            with _dir_lock(own.parent):
+                for path in own.parent.glob('metrics-*.json'):
+                    if path.name == self.RETIRED:
+                        continue
+                    if path == own:
+                        if not self._owns_file:
+                            self._retire(path)
+                        continue
+                    pid = path.stem.split('-', 1)[-1]
+                    try:
+                        if pid.isdigit() and not _pid_alive(int(pid)):
+                            self._retire(path)
+                            continue
+                        fresh = now - path.stat().st_mtime <= gauge_max_age
+                        snapshots.append((json.loads(path.read_text(encoding='utf-8')), pid, fresh))
+                    except (OSError, ValueError):
+                        continue
+                snapshots.append((_read_json(own.parent / self.RETIRED), 'retired', False))
+        counters: dict[tuple, float] = {}
+        histograms: dict[tuple, list[float]] = {}
+        gauges: dict[tuple, float] = {}
+        for snap, pid, fresh in snapshots:
+            if fresh:
+                pid_label = ('pid', pid)
+                for name, labels, value in snap.get('gauges', []):
+                    gauges[(name, tuple(sorted(list(map(tuple, labels)) + [pid_label])))] = value
+            _accumulate(counters, histograms, snap)
+        return {'counters': counters, 'histograms': histograms, 'gauges': gauges}
+
+    def render(self, gauges: list[tuple[str, str, dict, float]] | None = None) -> str:
+        """Return the Prometheus exposition text for collected metrics plus ``gauges``.
+
+        ``gauges`` are ``(name, help, labels, value)`` tuples computed at scrape time.
+        """
+        data = self.collect()
+        lines: list[str] = []
+        by_name: dict[str, list] = {}
+        for (name, labels), value in sorted(data['counters'].items()):
+            by_name.setdefault(name, []).append((labels, value))
+        for name, samples in by_name.items():
+            kind, help_text, _ = self._meta.get(name, ('counter', '', ()))
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, value in samples:
+                lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+
+        by_name = {}
+        for (name, labels), state in sorted(data['histograms'].items()):
+            by_name.setdefault(name, []).append((labels, state))
+        for name, samples in by_name.items():
+            _, help_text, buckets = self._meta.get(name, ('histogram', '', DEFAULT_BUCKETS))
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} histogram')
+            for labels, state in samples:
+                for bound, count in zip(tuple(buckets) + (math.inf,), state[:len(buckets)] + [state[-1]]):
+                    lines.append(f'{name}_bucket{_format_labels(labels, (("le", _format_value(bound)),))} {_format_value(count)}')
+                lines.append(f'{name}_sum{_format_labels(labels)} {_format_value(state[-2])}')
+                lines.append(f'{name}_count{_format_labels(labels)} {_format_value(state[-1])}')
+
+        process_gauges = [
+            (name, self._meta.get(name, ('gauge', '', ()))[1], dict(labels), value)
+            for (name, labels), value in sorted(data['gauges'].items())
+        ]
+        seen = set()
+        for name, help_text, labels, value in process_gauges + list(gauges or []):
+            if name not in seen:
+                kind = 'counter' if name.endswith('_total') else 'gauge'
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} {kind}')
+                seen.add(name)
+            lines.append(f'{name}{_format_labels(_labels_key(labels))} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
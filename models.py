@@ -1,5 +1,6 @@
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.dialects import mysql
 from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
 
@@ -30,8 +31,12 @@ class Client(db.Model):
     company_id = db.Column(db.Integer, db.ForeignKey('company_info.id'), nullable=False)
 
 class Product(db.Model):
+    __table_args__ = (
+        db.Index('uq_product_company_code', 'company_id', 'code', unique=True),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
-    code = db.Column(db.String(50), unique=True, nullable=False)
+    code = db.Column(db.String(50), nullable=False)
     reference = db.Column(db.String(50))
     name = db.Column(db.String(120), nullable=False)
     unit = db.Column(db.String(20), nullable=False)
@@ -209,9 +214,31 @@ class InventoryMovement(db.Model):
     warehouse_id = db.Column(db.Integer, db.ForeignKey('warehouse.id'))
     company_id = db.Column(db.Integer, db.ForeignKey('company_info.id'), nullable=False)
     executed_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    # Signed change applied to the warehouse stock; NULL on rows logged before it existed.
+    delta = db.Column(db.Integer)
     product = db.relationship('Product')
     warehouse = db.relationship('Warehouse')
     user = db.relationship('User')
+    __table_args__ = (
+        db.Index('ix_inventory_movement_company_wh_ts', 'company_id', 'warehouse_id', 'timestamp'),
+    )
+
+
+class InventoryCheckpoint(db.Model):
+    """Stock of every product in a warehouse at ``taken_at``; history replays movements from here.
+
+    ``last_movement_id`` is the highest movement already reflected in ``stock``.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    company_id = db.Column(db.Integer, db.ForeignKey('company_info.id'), nullable=False)
+    warehouse_id = db.Column(db.Integer, db.ForeignKey('warehouse.id'), nullable=False)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
+    stock = db.Column(db.Integer, nullable=False, default=0)
+    taken_at = db.Column(db.DateTime, nullable=False, default=dom_now)
+    last_movement_id = db.Column(db.Integer, nullable=False, default=0)
+    __table_args__ = (
+        db.Index('ix_inventory_checkpoint_company_wh_taken', 'company_id', 'warehouse_id', 'taken_at'),
+    )
 
 
 class Warehouse(db.Model):
@@ -229,6 +256,10 @@ class ProductStock(db.Model):
     stock = db.Column(db.Integer, default=0)
     min_stock = db.Column(db.Integer, default=0)
     company_id = db.Column(db.Integer, db.ForeignKey('company_info.id'), nullable=False)
+    # Set while a low-stock alert is open for this row; cleared once stock is back above min_stock.
+    low_stock_alert_at = db.Column(db.DateTime)
+    # Reorder point proposed by ``flask reorder_suggest``; copied into min_stock when a manager applies it.
+    suggested_min_stock = db.Column(db.Integer)
     __table_args__ = (db.UniqueConstraint('product_id', 'warehouse_id', name='uix_product_wh'),)
     product = db.relationship('Product')
 
@@ -245,6 +276,8 @@ class CompanyInfo(db.Model):
     logo = db.Column(db.String(120))
     ncf_final = db.Column(db.Integer, default=1)
     ncf_fiscal = db.Column(db.Integer, default=1)
+    # Bumped when the counters are set by hand so reserved NCF blocks are dropped.
+    ncf_epoch = db.Column(db.Integer, nullable=False, default=0)
 
 
 class User(db.Model):
@@ -317,6 +350,22 @@ class Notification(db.Model):
     read_at = db.Column(db.DateTime)
 
 
+class NotificationCounter(db.Model):
+    """Unread notifications per company, kept in step with ``Notification`` writes."""
+
+    company_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    unread = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=dom_now, onupdate=dom_now, nullable=False)
+
+
+class CatalogVersion(db.Model):
+    """Per-company counter bumped whenever products change; drives catalog ETags and search indexes."""
+
+    company_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=dom_now, onupdate=dom_now, nullable=False)
+
+
 class ErrorReport(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     created_at = db.Column(db.DateTime, default=dom_now, nullable=False)
@@ -387,3 +436,53 @@ class AuditLog(db.Model):
     details = db.Column(db.Text)
     ip = db.Column(db.String(45))
     user_agent = db.Column(db.String(255))
+
+
+class EmailOutbox(db.Model):
+    """Durable queue of outgoing emails processed by the email dispatcher."""
+
+    __table_args__ = (
+        db.Index('ix_email_outbox_status_next_attempt', 'status', 'next_attempt_at'),
+        db.Index('ix_email_outbox_created_at', 'created_at'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    company_id = db.Column(db.Integer)
+    to_address = db.Column(db.String(255), nullable=False)
+    subject = db.Column(db.String(255), nullable=False)
+    html = db.Column(db.Text().with_variant(mysql.MEDIUMTEXT(), 'mysql'), nullable=False)
+    attachments = db.Column(db.Text().with_variant(mysql.LONGTEXT(), 'mysql'))  # JSON [{filename, data(base64)}]
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, sending, sent, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=dom_now)
+    locked_by = db.Column(db.String(80))
+    locked_until = db.Column(db.DateTime)
+    last_error = db.Column(db.String(500))
+    created_at = db.Column(db.DateTime, nullable=False, default=dom_now)
+    sent_at = db.Column(db.DateTime)
+
+
+class EmailMetricCounter(db.Model):
+    name = db.Column(db.String(40), primary_key=True)
+    value = db.Column(db.BigInteger, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=dom_now, onupdate=dom_now, nullable=False)
+
+
+class SqlQueryStat(db.Model):
+    """Per-worker aggregate of one SQL fingerprint over a flush window."""
+
+    __table_args__ = (
+        db.Index('ix_sql_query_stat_window_end', 'window_end'),
+        db.Index('ix_sql_query_stat_fingerprint_window_end', 'fingerprint', 'window_end'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    fingerprint = db.Column(db.String(16), nullable=False)
+    statement = db.Column(db.Text, nullable=False)
+    calls = db.Column(db.Integer, nullable=False, default=0)
+    total_ms = db.Column(db.Float, nullable=False, default=0)
+    max_ms = db.Column(db.Float, nullable=False, default=0)
+    p95_ms = db.Column(db.Float, nullable=False, default=0)
+    sample_request_id = db.Column(db.String(64))
+    worker = db.Column(db.String(80))
+    window_start = db.Column(db.DateTime, nullable=False)
+    window_end = db.Column(db.DateTime, nullable=False, default=dom_now)
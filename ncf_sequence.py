@@ -0,0 +1,151 @@
+"""NCF (comprobante fiscal) number allocation.
+
+Counters live in ``company_info.ncf_fiscal`` (B01) and ``ncf_final`` (B02)
+and always hold the next number to hand out. Numbers are claimed by advancing
+the counter with one ``UPDATE ... SET n = n + :size`` and reading it back in
+the same transaction: the row lock taken by the UPDATE serializes concurrent
+invoices, so two of them can never see the same value.
+
+``Invoice.ncf`` is unique and counters can be moved forward by hand, so a
+claimed number may already be in use. Used numbers are read with one range
+query over the unique index, and when a whole claim is taken the counter
+jumps to the next gap with a compare-and-set UPDATE instead of probing one
+number per query.
+
+:class:`NcfBlockAllocator` can also reserve ``block_size`` numbers per worker
+in a short transaction of its own and hand them out from memory, so busy
+tenants do not serialize on the company row for every invoice. Numbers left
+in a block when the worker stops, or taken by a request that rolls back, are
+never issued. A block remembers ``company_info.ncf_epoch`` from when it was
+reserved; :func:`bump_epoch` advances it when the counters are changed by
+hand, and every worker drops its stale blocks on its next invoice.
+"""
+from __future__ import annotations
+
+import os
+import threading
+from collections import deque
+
+from sqlalchemy import func, select, update
+
+from models import CompanyInfo, Invoice, db
+
+PREFIX_COUNTERS = {'B01': 'ncf_fiscal', 'B02': 'ncf_final'}
+# Numbers checked per range query while looking for the next unused one.
+SCAN_WINDOW = 500
+
+_company = CompanyInfo.__table__
+_invoice = Invoice.__table__
+
+
+def format_ncf(prefix: str, number: int) -> str:
+    return f'{prefix}{number:08d}'
+
+
+def _claim(conn, company_id: int, column: str, size: int) -> int:
+    """Advance ``column`` by ``size`` and return the first claimed number."""
+    counter = _company.c[column]
+    result = conn.execute(
+        update(_company).where(_company.c.id == company_id).values({column: func.coalesce(counter, 1) + size})
+    )
+    if result.rowcount != 1:
+        raise LookupError(f'Empresa {company_id} no encontrada')
+    return int(conn.execute(select(counter).where(_company.c.id == company_id)).scalar_one()) - size
+
+
+def _epoch(conn, company_id: int) -> int:
+    return int(conn.execute(select(_company.c.ncf_epoch).where(_company.c.id == company_id)).scalar() or 0)
+
+
+def _used(conn, prefix: str, start: int, stop: int) -> set[int]:
+    """Numbers in ``[start, stop)`` already stored on an invoice."""
+    rows = conn.execute(
+        select(_invoice.c.ncf).where(
+            _invoice.c.ncf >= format_ncf(prefix, start),
+            _invoice.c.ncf < format_ncf(prefix, stop),
+        )
+    )
+    return {int(ncf[len(prefix):]) for (ncf,) in rows if ncf[len(prefix):].isdigit()}
+
+
+def _first_free(conn, prefix: str, start: int) -> int:
+    while True:
+        used = _used(conn, prefix, start, start + SCAN_WINDOW)
+        for number in range(start, start + SCAN_WINDOW):
+            if number not in used:
+                return number
+        start += SCAN_WINDOW
+
+
+def allocate(conn, company_id: int, prefix: str, size: int = 1) -> list[int]:
+    """Claim up to ``size`` unused numbers of ``prefix`` for ``company_id`` on ``conn``.
+
+    Returns at least one number, in ascending order; numbers already used by
+    an invoice are left out. Nothing is committed.
+    """
+    column = PREFIX_COUNTERS[prefix]
+    counter = _company.c[column]
+    while True:
+        start = _claim(conn, company_id, column, size)
+        used = _used(conn, prefix, start, start + size)
+        free = [number for number in range(start, start + size) if number not in used]
+        if free:
+            return free
+        gap = _first_free(conn, prefix, start + size)
+        # Nobody holds ``gap`` while the counter has not passed it; otherwise claim again.
+        jumped = conn.execute(
+            update(_company).where(_company.c.id == company_id, counter <= gap).values({column: gap + size})
+        ).rowcount
+        if jumped:
+            used = _used(conn, prefix, gap, gap + size)
+            return [number for number in range(gap, gap + size) if number not in used]
+
+
+def next_ncf(company_id: int, prefix: str) -> str:
+    """Allocate one NCF in the caller's transaction; a rollback returns it to the sequence."""
+    return format_ncf(prefix, allocate(db.session, company_id, prefix)[0])
+
+
+def bump_epoch(company: CompanyInfo) -> None:
+    """Mark ``company``'s counters as set by hand; reserved blocks are dropped by every worker."""
+    company.ncf_epoch = CompanyInfo.ncf_epoch + 1
+
+
+class NcfBlockAllocator:
+    """Hands out NCFs from per-worker blocks of ``block_size`` numbers.
+
+    With ``block_size`` of 1 every call goes through :func:`next_ncf` in the
+    caller's transaction. Larger blocks are reserved and committed on a
+    separate connection, so they need a server database; SQLite would wait on
+    the request's own write lock. Before a number is served from memory the
+    company's ``ncf_epoch`` is read in the caller's transaction, so a counter
+    changed in Ajustes takes effect on every worker.
+    """
+
+    def __init__(self, block_size: int = 1):
+        self.block_size = max(int(block_size), 1)
+        self._reset()
+
+    def _reset(self) -> None:
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._blocks: dict[tuple[int, str], tuple[int, deque[int]]] = {}
+
+    def _check_fork(self) -> None:
+        # A forked worker must not hand out numbers reserved by its parent.
+        if os.getpid() != self._pid:
+            self._reset()
+
+    def next(self, company_id: int, prefix: str) -> str:
+        if self.block_size <= 1:
+            return next_ncf(company_id, prefix)
+        self._check_fork()
+        with self._lock:
+            key = (company_id, prefix)
+            epoch = _epoch(db.session, company_id)
+            block = self._blocks.get(key)
+            if block is None or block[0] != epoch or not block[1]:
+                with db.engine.begin() as conn:
+                    numbers = allocate(conn, company_id, prefix, self.block_size)
+                    block = self._blocks[key] = (_epoch(conn, company_id), deque(numbers))
+            return format_ncf(prefix, block[1].popleft())
@@ -0,0 +1,161 @@
+"""Per-company in-memory product search for autocomplete.
+
+Names, codes and references are accent-folded and split into word tokens.
+Each company gets a sorted token list plus postings, so a query term is a
+``bisect`` range over tokens (prefix match) instead of a ``LIKE '%q%'`` scan,
+and several terms intersect their postings. Indexes are built lazily from a
+loader, kept per process and rebuilt when the caller passes a newer catalog
+``version`` (shared by all workers), after
+:meth:`ProductSearchRegistry.invalidate`, or once ``ttl`` seconds have passed.
+Only the ``max_companies`` most recently searched companies stay in memory,
+and each company builds under its own lock so a slow rebuild never blocks
+other tenants' searches.
+"""
+from __future__ import annotations
+
+import bisect
+import heapq
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+_TOKEN_SPLIT = re.compile(r'[^0-9a-z]+')
+
+
+def fold(value) -> str:
+    """Lower-case ``value`` and strip accents (``Ñandú`` -> ``nandu``)."""
+    text = unicodedata.normalize('NFKD', '' if value is None else str(value))
+    return ''.join(ch for ch in text if not unicodedata.combining(ch)).casefold()
+
+
+def _tokens(folded: str) -> list[str]:
+    return [token for token in _TOKEN_SPLIT.split(folded) if token]
+
+
+class ProductSearchIndex:
+    """Immutable token index over one company's products."""
+
+    __slots__ = ('built_at', 'version', 'size', '_docs', '_tokens', '_postings')
+
+    def __init__(self, rows, version=None):
+        self.built_at = time.monotonic()
+        self.version = version
+        self._docs: dict[int, tuple[str, str, str, dict]] = {}
+        postings: dict[str, set[int]] = {}
+        for row in rows:
+            product_id = row['id']
+            code, name, reference = fold(row.get('code')), fold(row.get('name')), fold(row.get('reference'))
+            self._docs[product_id] = (code, name, reference, row)
+            for token in {code, reference, *_tokens(code), *_tokens(name), *_tokens(reference)}:
+                if token:
+                    postings.setdefault(token, set()).add(product_id)
+        self.size = len(self._docs)
+        self._tokens = sorted(postings)
+        self._postings = {token: tuple(ids) for token, ids in postings.items()}
+
+    def _matching(self, term: str) -> set[int]:
+        start = bisect.bisect_left(self._tokens, term)
+        end = bisect.bisect_left(self._tokens, term + '\uffff', start)
+        ids: set[int] = set()
+        for token in self._tokens[start:end]:
+            ids.update(self._postings[token])
+        return ids
+
+    def matching_ids(self, query: str) -> set[int]:
+        """Ids of every product whose words start with all terms of ``query``, unranked and uncapped."""
+        terms = sorted(set(_tokens(fold(query).strip())), key=len, reverse=True)
+        if not terms:
+            return set()
+        candidates = self._matching(terms[0])
+        for term in terms[1:]:
+            if not candidates:
+                break
+            candidates &= self._matching(term)
+        return candidates
+
+    def search(self, query: str, limit: int = 20) -> list[dict]:
+        """Return up to ``limit`` rows whose words start with every query term.
+
+        Exact code or reference matches rank first, then code prefixes, then
+        names starting with the query; ties are ordered by name.
+        """
+        if limit <= 0:
+            return []
+        needle = fold(query).strip()
+        candidates = self.matching_ids(query)
+
+        def rank(product_id):
+            code, name, reference, _ = self._docs[product_id]
+            if needle in (code, reference):
+                score = 0
+            elif code.startswith(needle):
+                score = 1
+            elif name.startswith(needle):
+                score = 2
+            else:
+                score = 3
+            return score, name, product_id
+
+        return [self._docs[product_id][3] for product_id in heapq.nsmallest(limit, candidates, key=rank)]
+
+
+class ProductSearchRegistry:
+    """Lazily built :class:`ProductSearchIndex` per company for this process, LRU-bounded."""
+
+    def __init__(self, loader, ttl: float = 300.0, max_companies: int = 64):
+        self.loader = loader
+        self.ttl = ttl
+        self.max_companies = max(int(max_companies), 1)
+        self._reset()
+
+    def _reset(self) -> None:
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._indexes: OrderedDict[int, ProductSearchIndex] = OrderedDict()
+        self._build_locks: dict[int, threading.Lock] = {}
+
+    def _check_fork(self) -> None:
+        # A forked worker must not share the parent's locks or serve its snapshot forever.
+        if os.getpid() != self._pid:
+            self._reset()
+
+    def _fresh(self, index: ProductSearchIndex | None, version) -> bool:
+        if index is None or index.version != version:
+            return False
+        return self.ttl <= 0 or time.monotonic() - index.built_at < self.ttl
+
+    def get(self, company_id: int, version=None) -> ProductSearchIndex:
+        self._check_fork()
+        with self._lock:
+            index = self._indexes.get(company_id)
+            if self._fresh(index, version):
+                self._indexes.move_to_end(company_id)
+                return index
+            build_lock = self._build_locks.setdefault(company_id, threading.Lock())
+        with build_lock:
+            # Another thread may have built it while we waited.
+            with self._lock:
+                index = self._indexes.get(company_id)
+            if not self._fresh(index, version):
+                index = ProductSearchIndex(self.loader(company_id), version=version)
+            with self._lock:
+                self._indexes[company_id] = index
+                self._indexes.move_to_end(company_id)
+                while len(self._indexes) > self.max_companies:
+                    evicted, _ = self._indexes.popitem(last=False)
+                    lock = self._build_locks.get(evicted)
+                    if lock is not None and not lock.locked():
+                        del self._build_locks[evicted]
+        return index
+
+    def invalidate(self, company_id: int | None = None) -> None:
+        """Drop the index of ``company_id`` (every company when ``None``)."""
+        self._check_fork()
+        with self._lock:
+            if company_id is None:
+                self._indexes.clear()
+            else:
+                self._indexes.pop(company_id, None)
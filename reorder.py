@@ -0,0 +1,78 @@
+"""Reorder-point suggestions from outbound movement history.
+
+The caller aggregates ``salida`` movements into daily totals per
+``(warehouse_id, product_id)``; days without movements count as zero demand.
+For each pair, the mean daily demand ``d`` and its standard deviation ``s``
+over the window give the reorder point
+
+    ceil(d * L + z * s * sqrt(L))
+
+for a lead time of ``L`` days and a service factor ``z`` (1.65 covers about
+95% of lead-time demand). With NumPy installed the whole catalog is reduced
+with a couple of ``bincount`` passes; without it the same formulas run in
+plain Python, which is fine for small tenants.
+"""
+from __future__ import annotations
+
+import math
+
+try:
+    import numpy as np
+except ModuleNotFoundError:  # pragma: no cover - optional dependency
+    np = None
+
+# Absorbs float noise so an exact 4.0 does not round up to 5.
+_EPSILON = 1e-9
+
+
+def reorder_points(rows, *, days: int, lead_time: float, z: float, use_numpy: bool | None = None) -> dict[tuple[int, int], int]:
+    """Return ``{(warehouse_id, product_id): reorder_point}``.
+
+    ``rows`` are ``(warehouse_id, product_id, qty)`` daily totals inside a
+    window of ``days`` days. ``use_numpy`` forces one implementation; by
+    default NumPy is used when available.
+    """
+    rows = list(rows)
+    if not rows:
+        return {}
+    days = max(int(days), 1)
+    if use_numpy is None:
+        use_numpy = np is not None
+    if use_numpy:
+        return _reorder_points_numpy(rows, days, float(lead_time), float(z))
+    return _reorder_points_python(rows, days, float(lead_time), float(z))
+
+
+def _reorder_points_numpy(rows, days: int, lead_time: float, z: float) -> dict[tuple[int, int], int]:
+    data = np.asarray(rows, dtype=np.int64)
+    # One int64 key per pair sorts faster than a 2-column unique.
+    keys = (data[:, 0] << 32) | data[:, 1]
+    pairs, inverse = np.unique(keys, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    qty = data[:, 2].astype(np.float64)
+    total = np.bincount(inverse, weights=qty, minlength=len(pairs))
+    total_sq = np.bincount(inverse, weights=qty * qty, minlength=len(pairs))
+    mean = total / days
+    variance = np.maximum(total_sq / days - mean * mean, 0.0) * days / max(days - 1, 1)
+    points = np.ceil(mean * lead_time + z * np.sqrt(variance) * math.sqrt(lead_time) - _EPSILON)
+    points = np.maximum(points, 0).astype(np.int64)
+    return {
+        (int(key >> 32), int(key & 0xFFFFFFFF)): int(point)
+        for key, point in zip(pairs.tolist(), points.tolist())
+    }
+
+
+def _reorder_points_python(rows, days: int, lead_time: float, z: float) -> dict[tuple[int, int], int]:
+    sums: dict[tuple[int, int], list[float]] = {}
+    for warehouse_id, product_id, qty in rows:
+        acc = sums.setdefault((int(warehouse_id), int(product_id)), [0.0, 0.0])
+        qty = float(qty)
+        acc[0] += qty
+        acc[1] += qty * qty
+    points = {}
+    for key, (total, total_sq) in sums.items():
+        mean = total / days
+        variance = max(total_sq / days - mean * mean, 0.0) * days / max(days - 1, 1)
+        point = math.ceil(mean * lead_time + z * math.sqrt(variance) * math.sqrt(lead_time) - _EPSILON)
+        points[key] = max(point, 0)
+    return points
@@ -0,0 +1,77 @@
+import os
+import sys
+import pytest
+
+try:  # Skip entire module if plugin unavailable
+    import pytest_benchmark  # noqa: F401
+except Exception:  # pragma: no cover
+    pytest.skip("pytest-benchmark not installed", allow_module_level=True)
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from fpdf import FPDF
+
+import weasy_pdf
+
+COMPANY = {'name': 'Bench SRL', 'address': 'Calle 1, Centro, Santo Domingo', 'phone': '809-555-0000'}
+CLIENT = {'name': 'Cliente Benchmark', 'identifier': '001-0000000-1'}
+
+
+def _items(count):
+    return [
+        {
+            'code': f'COD-{n:06d}-LARGO',
+            'reference': f'REF-{n:06d}',
+            'product_name': f'Producto de prueba con un nombre bastante largo y descriptivo número {n} ' * 3,
+            'unit': 'Kilogramo',
+            'unit_price': 125.5 + n,
+            'quantity': n % 7 + 1,
+            'discount': 0.0,
+        }
+        for n in range(count)
+    ]
+
+
+def _linear_fit_cell_text(pdf, value, max_width, ellipsis='...'):
+    """Previous one-character-at-a-time implementation, kept as reference."""
+    text = weasy_pdf._safe_text(value)
+    if not text or pdf.get_string_width(text) <= max_width:
+        return text
+    trimmed = text
+    while trimmed and pdf.get_string_width(trimmed + ellipsis) > max_width:
+        trimmed = trimmed[:-1]
+    return (trimmed + ellipsis) if trimmed else ''
+
+
+class _CountingPdf(FPDF):
+    def __init__(self):
+        super().__init__()
+        self.width_calls = 0
+
+    def get_string_width(self, s, *args, **kwargs):
+        self.width_calls += 1
+        return super().get_string_width(s, *args, **kwargs)
+
+
+def test_fit_cell_text_matches_linear_trim_with_fewer_width_calls():
+    weasy_pdf._width_cache.clear()
+    fast_pdf, slow_pdf = _CountingPdf(), _CountingPdf()
+    for pdf in (fast_pdf, slow_pdf):
+        pdf.add_page()
+        pdf.set_font('Helvetica', '', 8)
+    names = [item['product_name'] for item in _items(50)] + ['Ñandú acentuado', 'x', '']
+    for name in names:
+        for width in (1, 10, 50.5):
+            assert weasy_pdf._fit_cell_text(fast_pdf, name, width) == _linear_fit_cell_text(slow_pdf, name, width)
+    assert fast_pdf.width_calls * 10 < slow_pdf.width_calls
+
+
+@pytest.mark.parametrize('lines,threshold', [(1, 0.5), (50, 1.0), (500, 5.0)])
+def test_generate_pdf_bytes_benchmark(benchmark, lines, threshold):
+    items = _items(lines)
+    payload = benchmark(
+        weasy_pdf.generate_pdf_bytes,
+        'Factura', COMPANY, CLIENT, items,
+        subtotal=1000.0, itbis=180.0, total=1180.0,
+    )
+    assert payload.startswith(b'%PDF')
+    assert benchmark.stats['mean'] < threshold
@@ -0,0 +1,27 @@
+import os
+import sys
+import pytest
+
+try:  # Skip entire module if plugin unavailable
+    import pytest_benchmark  # noqa: F401
+except Exception:  # pragma: no cover
+    pytest.skip("pytest-benchmark not installed", allow_module_level=True)
+
+np = pytest.importorskip('numpy')
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+import reorder
+
+
+@pytest.fixture(scope='module')
+def rows():
+    # 600k daily movements over 30k product/warehouse pairs.
+    return np.column_stack([
+        np.full(600_000, 1), np.arange(600_000) % 30_000, np.arange(600_000) % 17 + 1,
+    ])
+
+
+def test_reorder_points_benchmark(rows, benchmark):
+    points = benchmark(reorder.reorder_points, rows, days=90, lead_time=7, z=1.65, use_numpy=True)
+    assert len(points) == 30_000
+    assert benchmark.stats['mean'] < 3
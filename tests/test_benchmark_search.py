@@ -0,0 +1,28 @@
+import os
+import sys
+import pytest
+
+try:  # Skip entire module if plugin unavailable
+    import pytest_benchmark  # noqa: F401
+except Exception:  # pragma: no cover
+    pytest.skip("pytest-benchmark not installed", allow_module_level=True)
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+import product_search
+
+WORDS = ['arroz', 'frijol', 'aceite', 'azucar', 'harina', 'leche', 'queso', 'jamon', 'pan', 'cafe']
+
+
+@pytest.fixture(scope='module')
+def index():
+    return product_search.ProductSearchIndex(
+        {'id': n, 'code': f'P{n:06d}', 'name': f'{WORDS[n % 10]} {WORDS[(n // 10) % 10]} marca {n % 97}',
+         'reference': '', 'unit': 'u', 'price': 1.0}
+        for n in range(20000)
+    )
+
+
+@pytest.mark.parametrize('query,threshold', [('arr', 0.01), ('leche queso', 0.01), ('P0123', 0.01), ('marca 5', 0.01)])
+def test_product_search_benchmark(index, benchmark, query, threshold):
+    assert benchmark(index.search, query)
+    assert benchmark.stats['mean'] < threshold
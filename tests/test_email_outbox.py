@@ -0,0 +1,217 @@
+import os
+import smtplib
+import sys
+from datetime import timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+import app as app_module
+from app import app, db
+from models import CompanyInfo, EmailOutbox, EmailMetricCounter, dom_now
+
+
+class OutboxSMTP:
+    sent = []
+    fail = False
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def starttls(self):
+        return None
+
+    def login(self, *_):
+        return None
+
+    def noop(self):
+        return (250, b'OK')
+
+    def sendmail(self, _sender, recipients, message):
+        if OutboxSMTP.fail:
+            raise OSError('smtp down')
+        OutboxSMTP.sent.append((recipients[0], message))
+
+    def quit(self):
+        return None
+
+
+def _setup(tmp_path, monkeypatch):
+    app.config.from_object('config.TestingConfig')
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'outbox.sqlite'}"
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+    OutboxSMTP.sent = []
+    OutboxSMTP.fail = False
+    monkeypatch.setattr(app_module, 'MAIL_ENABLED', True)
+    monkeypatch.setattr(app_module, 'MAIL_SERVER', 'smtp.example.com')
+    monkeypatch.setattr(app_module, 'MAIL_DEFAULT_SENDER', 'no-reply@example.com')
+    monkeypatch.setattr(app_module, 'MAIL_USE_SSL', False)
+    monkeypatch.setattr(smtplib, 'SMTP', OutboxSMTP)
+
+
+def _counters():
+    return {row.name: row.value for row in EmailMetricCounter.query.all()}
+
+
+def test_async_email_is_persisted_and_delivered_by_dispatcher(tmp_path, monkeypatch):
+    _setup(tmp_path, monkeypatch)
+    with app.app_context():
+        app_module.send_email('cliente@example.com', 'Factura', '<b>hola</b>', attachments=[('f.pdf', b'%PDF-1')])
+        row = EmailOutbox.query.one()
+        assert row.status == 'pending'
+        assert not OutboxSMTP.sent
+
+        summary = app_module.process_email_outbox(worker_id='w1')
+
+        assert summary == {'claimed': 1, 'sent': 1, 'retried': 0, 'failed': 0}
+        row = db.session.get(EmailOutbox, row.id)
+        assert row.status == 'sent' and row.sent_at is not None and row.locked_by is None
+        assert OutboxSMTP.sent[0][0] == 'cliente@example.com'
+        assert 'filename="f.pdf"' in OutboxSMTP.sent[0][1]
+        assert _counters() == {'queued': 1, 'sent': 1}
+        assert app_module.process_email_outbox(worker_id='w1')['claimed'] == 0
+
+
+def test_outbox_row_commits_or_rolls_back_with_the_callers_work(tmp_path, monkeypatch):
+    _setup(tmp_path, monkeypatch)
+    with app.app_context():
+        app_module._email_outbox_wakeup.clear()
+        pending = CompanyInfo(name='Pendiente', street='', sector='', province='', phone='', rnc='')
+        db.session.add(pending)
+        app_module.send_email('cliente@example.com', 'Factura', '<b>hola</b>')
+        assert not app_module._email_outbox_wakeup.is_set()
+        db.session.rollback()
+        # The failed save takes its email with it.
+        assert EmailOutbox.query.count() == 0
+        assert CompanyInfo.query.count() == 0
+        assert _counters() == {}
+
+        db.session.add(CompanyInfo(name='Guardada', street='', sector='', province='', phone='', rnc=''))
+        db.session.flush()
+        app_module.send_email('cliente@example.com', 'Factura', '<b>hola</b>')
+        db.session.commit()
+        assert app_module._email_outbox_wakeup.is_set()
+        assert EmailOutbox.query.count() == 1
+        assert _counters() == {'queued': 1}
+
+
+def test_enqueue_outside_a_unit_of_work_commits_on_its_own(tmp_path, monkeypatch):
+    _setup(tmp_path, monkeypatch)
+    with app.app_context():
+        db.session.add(CompanyInfo(name='Previa', street='', sector='', province='', phone='', rnc=''))
+        db.session.commit()
+        app_module.send_email('cliente@example.com', 'Factura', '<b>hola</b>')
+        db.session.rollback()
+        assert EmailOutbox.query.count() == 1
+        assert _counters() == {'queued': 1}
+
+        def broken(*_args, **_kwargs):
+            raise RuntimeError('outbox down')
+
+        monkeypatch.setattr(app_module, '_enqueue_email', broken)
+        pending = CompanyInfo(name='Pendiente', street='', sector='', province='', phone='', rnc='')
+        db.session.add(pending)
+        app_module.send_email('cliente@example.com', 'Factura', '<b>hola</b>')
+        assert pending in db.session.new
+        db.session.commit()
+        assert CompanyInfo.query.count() == 2
+
+
+def test_dead_dispatcher_threads_are_restarted(monkeypatch):
+    class Dead:
+        def is_alive(self):
+            return False
+
+    started = []
+    monkeypatch.setattr(app_module, 'EMAIL_DISPATCHER_THREADS', 1)
+    monkeypatch.setattr(app_module, '_email_dispatcher_threads', [Dead()])
+    monkeypatch.setattr(app_module, '_ensure_email_dispatcher', lambda *a, **k: started.append(1))
+    app_module.start_email_dispatcher()
+    assert started == [1]
+
+
+def test_failed_delivery_backs_off_then_gives_up(tmp_path, monkeypatch):
+    _setup(tmp_path, monkeypatch)
+    monkeypatch.setattr(app_module, 'EMAIL_OUTBOX_MAX_ATTEMPTS', 2)
+    OutboxSMTP.fail = True
+    with app.app_context():
+        app_module.send_email('cliente@example.com', 'Pedido', '<b>hola</b>')
+
+        assert app_module.process_email_outbox(worker_id='w1')['retried'] == 1
+        row = EmailOutbox.query.one()
+        assert row.status == 'pending' and row.attempts == 1
+        assert row.next_attempt_at > dom_now() + timedelta(seconds=10)
+        assert 'smtp down' in row.last_error
+        assert app_module.process_email_outbox(worker_id='w1')['claimed'] == 0
+
+        row.next_attempt_at = dom_now() - timedelta(seconds=1)
+        db.session.commit()
+        assert app_module.process_email_outbox(worker_id='w1')['failed'] == 1
+        row = EmailOutbox.query.one()
+        assert row.status == 'failed' and row.attempts == 2
+        assert _counters() == {'queued': 1, 'retries': 1, 'failed': 1}
+
+
+def test_leased_rows_are_not_claimed_twice_until_lease_expires(tmp_path, monkeypatch):
+    _setup(tmp_path, monkeypatch)
+    with app.app_context():
+        app_module.send_email('a@example.com', 'A', '<b>a</b>')
+        app_module.send_email('b@example.com', 'B', '<b>b</b>')
+
+        first = app_module._claim_email_outbox(1, 'w1')
+        second = app_module._claim_email_outbox(5, 'w2')
+        assert len(first) == 1 and len(second) == 1 and first != second
+        assert app_module._claim_email_outbox(5, 'w3') == []
+
+        EmailOutbox.query.filter_by(id=first[0]).update({EmailOutbox.locked_until: dom_now() - timedelta(seconds=1)})
+        db.session.commit()
+        assert app_module._claim_email_outbox(5, 'w3') == first
+        # The crashed worker can no longer finalize a row it lost.
+        assert app_module._dispatch_outbox_email(first[0], 'w1', app_module._SMTPConnection()) is None
+        assert db.session.get(EmailOutbox, first[0]).attempts == 2
+
+
+def test_row_whose_lease_expired_mid_batch_is_not_sent_twice(tmp_path, monkeypatch):
+    _setup(tmp_path, monkeypatch)
+    with app.app_context():
+        app_module.send_email('a@example.com', 'A', '<b>a</b>')
+        app_module.send_email('b@example.com', 'B', '<b>b</b>')
+        first_id, second_id = [row.id for row in EmailOutbox.query.order_by(EmailOutbox.id)]
+        build = app_module._build_email_message
+
+        def slow_build(to, *args):
+            if to == 'b@example.com':
+                # Sending the first row outlived the batch lease; another worker reclaims the second.
+                EmailOutbox.query.filter_by(id=second_id).update(
+                    {EmailOutbox.locked_until: dom_now() - timedelta(seconds=1)}
+                )
+                db.session.commit()
+                assert app_module._claim_email_outbox(5, 'w2') == [second_id]
+            return build(to, *args)
+
+        monkeypatch.setattr(app_module, '_build_email_message', slow_build)
+        summary = app_module.process_email_outbox(worker_id='w1')
+
+        assert [to for to, _ in OutboxSMTP.sent] == ['a@example.com']
+        assert summary == {'claimed': 2, 'sent': 1, 'retried': 0, 'failed': 0}
+        row = db.session.get(EmailOutbox, second_id)
+        assert row.status == 'sending' and row.locked_by == 'w2'
+        monkeypatch.setattr(app_module, '_build_email_message', build)
+        assert app_module._dispatch_outbox_email(second_id, 'w2', app_module._SMTPConnection()) == 'sent'
+        assert [to for to, _ in OutboxSMTP.sent] == ['a@example.com', 'b@example.com']
+        assert db.session.get(EmailOutbox, first_id).status == 'sent'
+
+
+def test_email_worker_cli_drains_outbox(tmp_path, monkeypatch):
+    _setup(tmp_path, monkeypatch)
+    with app.app_context():
+        for n in range(3):
+            app_module.send_email(f'c{n}@example.com', 'Aviso', '<b>ok</b>')
+
+    result = app.test_cli_runner().invoke(args=['email_worker', '--once', '--limit', '2'])
+
+    assert result.exit_code == 0, result.output
+    assert 'sent:        3' in result.output
+    assert 'pending:     0' in result.output
+    assert len(OutboxSMTP.sent) == 3
@@ -0,0 +1,57 @@
+import json
+import os
+import subprocess
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+import app as app_module
+from app import app, db
+from models import CompanyInfo
+
+ROOT = os.path.dirname(os.path.dirname(__file__))
+
+
+def test_fast_start_skips_bootstrap_phases_on_import(tmp_path):
+    script = (
+        'import json, app; '
+        'print(json.dumps({"phases": dict(app.STARTUP_PHASES), "rnc": app._rnc_data_state["loaded"]}))'
+    )
+    env = {**os.environ, 'FAST_START': '1', 'PDF_ARCHIVE_ROOT': str(tmp_path / 'docs')}
+    out = subprocess.run([sys.executable, '-c', script], cwd=ROOT, env=env, capture_output=True, text=True, timeout=120)
+    assert out.returncode == 0, out.stderr
+    report = json.loads(out.stdout.strip().splitlines()[-1])
+    assert 'schema_sync' not in report['phases']
+    assert 'pdf_archive_dirs' not in report['phases']
+    assert 'module_init_total' in report['phases']
+    assert report['rnc'] is False
+
+
+def test_rnc_data_loads_lazily_and_keeps_imported_names(tmp_path, monkeypatch):
+    data = tmp_path / 'rnc.txt'
+    data.write_text('101-00000-1|EMPRESA ARCHIVO\n202000002|OTRA SRL\n', encoding='utf-8')
+    monkeypatch.setattr(app_module, 'DATA_PATH', str(data))
+    monkeypatch.setattr(app_module, 'RNC_DATA', {'202000002': 'NOMBRE IMPORTADO'})
+    monkeypatch.setattr(app_module, '_rnc_data_state', {'loaded': False})
+
+    loaded = app_module.load_rnc_data()
+
+    assert loaded['101000001'] == 'EMPRESA ARCHIVO'
+    assert loaded['202000002'] == 'NOMBRE IMPORTADO'
+    assert app_module.load_rnc_data() is loaded
+
+
+def test_bootstrap_command_creates_schema_and_archive_dirs(tmp_path):
+    app.config.from_object('config.TestingConfig')
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'boot.sqlite'}"
+    app.config['PDF_ARCHIVE_ROOT'] = str(tmp_path / 'generated_docs')
+    with app.app_context():
+        db.drop_all()
+
+    result = app.test_cli_runner().invoke(args=['bootstrap'])
+
+    assert result.exit_code == 0, result.output
+    assert 'schema_sync:' in result.output and 'pdf_archive_dirs:' in result.output
+    with app.app_context():
+        assert CompanyInfo.query.count() == 0
+    assert (tmp_path / 'generated_docs').is_dir()
@@ -0,0 +1,73 @@
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+import app as app_module
+from app import app, db
+
+
+def _setup(tmp_path):
+    app.config.from_object('config.TestingConfig')
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{tmp_path / "fork.sqlite"}'
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+
+
+def test_init_worker_process_resets_inherited_state(tmp_path, monkeypatch):
+    _setup(tmp_path)
+    disposed = []
+    with app.app_context():
+        engine = db.engine
+        db.session.execute(db.text('SELECT 1'))
+        db.session.remove()
+    monkeypatch.setattr(type(engine), 'dispose', lambda self, close=True: disposed.append(close))
+    old_queue = app_module._email_queue
+    old_log_queue = app_module._log_queue
+    app_module._email_dispatcher_threads.append(threading.Thread(target=lambda: None))
+    app_module._sql_stats['deadbeef'] = {'calls': 1}
+
+    assert app_module.init_worker_process() is False
+    monkeypatch.setitem(app_module._worker_process, 'pid', -1)
+    assert app_module.init_worker_process() is True
+
+    assert disposed and disposed[0] is False
+    assert app_module._email_queue is not old_queue
+    assert app_module._email_dispatcher_threads == []
+    assert app_module._sql_stats == {}
+    assert app_module._log_queue is not old_log_queue
+    assert app_module._log_queue_handler.queue is app_module._log_queue
+    assert app_module._log_listener._thread is not None
+    assert app_module.init_worker_process() is False
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='requiere os.fork')
+def test_forked_child_gets_fresh_pool_and_queues(tmp_path):
+    _setup(tmp_path)
+    with app.app_context():
+        db.session.execute(db.text('SELECT 1'))
+        db.session.remove()
+    parent_queue = app_module._email_queue
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:  # pragma: no cover - runs in the child
+        os.close(read_fd)
+        ok = (
+            app_module._worker_process['pid'] == os.getpid()
+            and app_module._email_queue is not parent_queue
+            and app_module._email_dispatcher_threads == []
+        )
+        with app.app_context():
+            ok = ok and db.session.execute(db.text('SELECT 1')).scalar() == 1
+        os.write(write_fd, b'1' if ok else b'0')
+        os._exit(0)
+    os.close(write_fd)
+    _, status = os.waitpid(pid, 0)
+    result = os.read(read_fd, 1)
+    os.close(read_fd)
+    assert status == 0
+    assert result == b'1'
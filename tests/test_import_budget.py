@@ -0,0 +1,34 @@
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LAZY_MODULES = ('fpdf', 'fontTools', 'openpyxl', 'weasy_pdf', 'account_pdf', 'email.mime', 'smtplib', 'numpy')
+
+
+def _import_times():
+    env = dict(os.environ, FAST_START='1', PYTHONDONTWRITEBYTECODE='1')
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import app'],
+        cwd=ROOT, env=env, capture_output=True, text=True, timeout=120,
+    )
+    assert proc.returncode == 0, proc.stderr[-2000:]
+    times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, name = line.split('|')
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative) / 1000.0
+    return times
+
+
+def test_app_import_defers_heavy_dependencies_and_meets_budget():
+    times = _import_times()
+    eager = sorted(
+        name for name in times
+        if any(name == lazy or name.startswith(lazy + '.') for lazy in LAZY_MODULES)
+    )
+    assert eager == []
+    budget_ms = float(os.getenv('IMPORT_TIME_BUDGET_MS', '3000'))
+    assert times['app'] < budget_ms
@@ -123,12 +123,56 @@ def test_inventory_import_invalid_row(client):
         assert InventoryMovement.query.count() == 0
 
 
+def test_inventory_import_applies_chunks_in_bulk(client, monkeypatch, tmp_path):
+    import app as app_module
+    monkeypatch.setattr(app_module, 'INVENTORY_IMPORT_CHUNK_SIZE', 2)
+    with app.app_context():
+        comp_id = db.session.get(Product, 1).company_id
+        db.session.add_all([
+            Product(code=f'B{n}', name=f'Bulk {n}', unit='u', price=1, stock=0, company_id=comp_id)
+            for n in range(5)
+        ])
+        db.session.commit()
+    rows = ['code,stock,min_stock', 'P1,2,3'] + [f'B{n},{n + 10},' for n in range(5)] + ['P1,1,']
+    resp = client.post('/inventario/importar', data={
+        'file': (BytesIO('\n'.join(rows).encode('utf-8')), 's.csv'),
+        'warehouse_id': '2'
+    }, follow_redirects=True)
+    assert 'Se importaron 7 productos' in resp.get_data(as_text=True)
+    with app.app_context():
+        p1 = ProductStock.query.filter_by(product_id=1, warehouse_id=2).first()
+        assert p1.stock == 1 and p1.min_stock == 3
+        assert p1.low_stock_alert_at is not None
+        assert ProductStock.query.filter_by(warehouse_id=2).count() == 6
+        assert db.session.get(Product, 2).stock == 10
+        assert InventoryMovement.query.filter_by(reference_type='import').count() == 7
+        assert Notification.query.filter(Notification.message.like('Stock bajo%')).count() == 1
+
+
+def test_inventory_import_cli_rolls_back_on_errors(client, tmp_path):
+    path = tmp_path / 'conteo.csv'
+    path.write_text('code,stock,min_stock\nP1,40,\nNOPE,1,\n', encoding='utf-8')
+    runner = app.test_cli_runner()
+    result = runner.invoke(args=['inventory_import', str(path), '--company-id', '1', '--warehouse-id', '1', '--user-id', '1'])
+    assert result.exit_code != 0
+    assert 'NOPE no encontrado' in result.output
+    with app.app_context():
+        assert ProductStock.query.filter_by(product_id=1, warehouse_id=1).first().stock == 5
+    path.write_text('code,stock,min_stock\nP1,40,\n', encoding='utf-8')
+    result = runner.invoke(args=['inventory_import', str(path), '--company-id', '1', '--warehouse-id', '1', '--user-id', '1'])
+    assert result.exit_code == 0, result.output
+    with app.app_context():
+        assert ProductStock.query.filter_by(product_id=1, warehouse_id=1).first().stock == 40
+        assert InventoryMovement.query.count() == 1
+
+
 def test_low_stock_alert(client):
     with app.app_context():
         ps = ProductStock.query.filter_by(product_id=1, warehouse_id=1).first()
         ps.stock = 2
         db.session.commit()
         notify(f'Stock bajo: {ps.product.name}')
+        db.session.commit()
     resp = client.get('/notificaciones')
     assert b'Stock bajo' in resp.data
 
@@ -171,6 +215,46 @@ def test_product_import_csv(manager_client):
         assert p.has_itbis is True
 
 
+def test_product_import_upserts_in_chunks_and_logs_prices(manager_client, monkeypatch):
+    import app as app_module
+    monkeypatch.setattr(app_module, 'PRODUCT_IMPORT_CHUNK_SIZE', 2)
+    with app.app_context():
+        other = CompanyInfo(name='Otra', street='', sector='', province='', phone='', rnc='')
+        db.session.add(other)
+        db.session.flush()
+        comp_id = User.query.filter_by(username='mgr').first().company_id
+        db.session.add_all([
+            Product(code='P2', name='Ajeno', unit='u', price=1, company_id=other.id),
+            Product(code='E1', name='Existente', unit='Unidad', price=10, reference='PRO004', company_id=comp_id),
+            Product(code='E2', name='Igual', unit='Unidad', price=3, reference='IGU001', has_itbis=True, company_id=comp_id),
+        ])
+        db.session.commit()
+        other_id = other.id
+    rows = [
+        'code,name,unit,price,category,has_itbis',
+        'P2,Prod2,Unidad,12.5,,1',
+        'E1,Existente,Unidad,15,,1',
+        'E2,Igual,Unidad,3,,1',
+        ',Sin codigo,Unidad,1,,1',
+        'P3,,Unidad,1,,1',
+        'P4,Prod4,Unidad,2,,0',
+    ]
+    resp = manager_client.post('/productos/importar', data={
+        'file': (BytesIO('\n'.join(rows).encode('utf-8')), 'p.csv')
+    }, follow_redirects=True)
+    body = resp.get_data(as_text=True)
+    assert '2 nuevos, 1 actualizados, 1 sin cambios' in body
+    assert 'Línea 6: Producto P3' in body
+    with app.app_context():
+        assert Product.query.filter_by(code='P2', company_id=other_id).one().name == 'Ajeno'
+        assert Product.query.filter_by(code='P2', company_id=comp_id).one().reference == 'PRO005'
+        assert Product.query.filter_by(code='P4').one().reference == 'PRO006'
+        assert Product.query.filter_by(code='P3').first() is None
+        log = ProductPriceLog.query.one()
+        assert (log.old_price, log.new_price) == (10, 15)
+        assert log.product.code == 'E1'
+
+
 def test_products_export_csv(client):
     resp = client.get('/productos/export')
     body = resp.get_data(as_text=True)
@@ -0,0 +1,162 @@
+import os
+import sys
+import threading
+from datetime import datetime
+
+import pytest
+from click.testing import CliRunner
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+import inventory
+from app import app, db
+from models import CompanyInfo, User, Product, Warehouse, ProductStock, InventoryMovement, InventoryCheckpoint
+
+DAY1 = datetime(2024, 3, 1, 9, 0)
+DAY2 = datetime(2024, 3, 2, 9, 0)
+DAY3 = datetime(2024, 3, 3, 9, 0)
+
+
+@pytest.fixture
+def ids(tmp_path):
+    app.config.from_object('config.TestingConfig')
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{tmp_path / "hist.sqlite"}'
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        comp = CompanyInfo(name='Hist', street='', sector='', province='', phone='', rnc='')
+        db.session.add(comp)
+        db.session.flush()
+        user = User(username='hist', first_name='H', last_name='S', role='manager', company_id=comp.id)
+        user.set_password('pass')
+        p1 = Product(code='H1', name='Uno', unit='u', price=10, cost_price=4, stock=5, company_id=comp.id)
+        p2 = Product(code='H2', name='Dos', unit='u', price=10, cost_price=2.5, stock=2, company_id=comp.id)
+        w1 = Warehouse(name='W1', company_id=comp.id)
+        w2 = Warehouse(name='W2', company_id=comp.id)
+        db.session.add_all([user, p1, p2, w1, w2])
+        db.session.flush()
+        db.session.add_all([
+            ProductStock(product_id=p1.id, warehouse_id=w1.id, stock=5, company_id=comp.id),
+            ProductStock(product_id=p2.id, warehouse_id=w1.id, stock=2, company_id=comp.id),
+        ])
+        db.session.commit()
+        return {'company': comp.id, 'user': user.id, 'p1': p1.id, 'p2': p2.id, 'w1': w1.id, 'w2': w2.id}
+
+
+def _history(ids, monkeypatch):
+    """Checkpoint on day 1, then a sale and transfer on day 2 and a count on day 3."""
+    inventory.take_checkpoint(ids['company'], taken_at=DAY1)
+    monkeypatch.setattr(inventory, 'dom_now', lambda: DAY2)
+    inventory.withdraw(ids['company'], ids['w1'], [(ids['p1'], 2)], executed_by=ids['user'])
+    inventory.transfer(ids['company'], ids['p2'], ids['w1'], ids['w2'], 1, executed_by=ids['user'])
+    monkeypatch.setattr(inventory, 'dom_now', lambda: DAY3)
+    inventory.set_level(ids['company'], ids['w1'], ids['p1'], 1, executed_by=ids['user'])
+    inventory.import_counts(ids['company'], ids['w2'], [(ids['p2'], 6, None)], executed_by=ids['user'])
+    db.session.commit()
+
+
+def test_stock_as_of_replays_checkpoint_and_signed_deltas(ids, monkeypatch):
+    with app.app_context():
+        _history(ids, monkeypatch)
+        assert inventory.stock_as_of(ids['company'], ids['w1'], DAY1) == {ids['p1']: 5, ids['p2']: 2}
+        assert inventory.stock_as_of(ids['company'], ids['w1'], DAY2) == {ids['p1']: 3, ids['p2']: 1}
+        assert inventory.stock_as_of(ids['company'], ids['w2'], DAY2) == {ids['p2']: 1}
+        assert inventory.stock_as_of(ids['company'], ids['w1'], DAY3, product_ids=[ids['p1']]) == {ids['p1']: 1}
+        assert inventory.stock_as_of(ids['company'], ids['w2'], DAY3) == {ids['p2']: 6}
+        deltas = [m.delta for m in InventoryMovement.query.order_by(InventoryMovement.id)]
+        assert deltas == [-2, -1, 1, -2, 5]
+        assert inventory.verify_ledger(ids['company']) == []
+
+        # A checkpoint after the movements gives the same answer without replaying them.
+        inventory.take_checkpoint(ids['company'], taken_at=DAY3)
+        db.session.commit()
+        assert inventory.stock_as_of(ids['company'], ids['w2'], DAY3) == {ids['p2']: 6}
+
+
+def test_replay_resumes_after_last_checkpointed_movement(ids, monkeypatch):
+    with app.app_context():
+        inventory.take_checkpoint(ids['company'], taken_at=DAY2)
+        db.session.commit()
+        # Logged in the checkpoint's own second, then one stamped before it but committed later.
+        monkeypatch.setattr(inventory, 'dom_now', lambda: DAY2)
+        inventory.withdraw(ids['company'], ids['w1'], [(ids['p1'], 2)], executed_by=ids['user'])
+        monkeypatch.setattr(inventory, 'dom_now', lambda: DAY1)
+        inventory.withdraw(ids['company'], ids['w1'], [(ids['p2'], 1)], executed_by=ids['user'])
+        db.session.commit()
+        assert inventory.stock_as_of(ids['company'], ids['w1'], DAY2) == {ids['p1']: 3, ids['p2']: 1}
+        monkeypatch.setattr(inventory, 'dom_now', lambda: DAY3)
+        assert inventory.verify_ledger(ids['company']) == []
+
+        inventory.take_checkpoint(ids['company'], taken_at=DAY3)
+        db.session.commit()
+        last = {cp.last_movement_id for cp in InventoryCheckpoint.query.filter_by(taken_at=DAY3)}
+        assert last == {InventoryMovement.query.count()}
+        assert inventory.stock_as_of(ids['company'], ids['w1'], DAY3) == {ids['p1']: 3, ids['p2']: 1}
+
+
+def test_checkpoint_waits_for_a_movement_committed_while_it_runs(ids, monkeypatch):
+    monkeypatch.setattr(inventory, 'dom_now', lambda: DAY2)
+    with app.app_context():
+        inventory.transfer(ids['company'], ids['p2'], ids['w1'], ids['w2'], 1, executed_by=ids['user'])
+        db.session.commit()
+    written, release = threading.Event(), threading.Event()
+
+    def sale():
+        with app.app_context():
+            inventory.withdraw(ids['company'], ids['w1'], [(ids['p1'], 2)], executed_by=ids['user'])
+            written.set()
+            release.wait(5)
+            db.session.commit()
+
+    writer = threading.Thread(target=sale)
+    writer.start()
+    assert written.wait(5)
+    with app.app_context():
+        # The sale holds its write lock when the checkpoint starts and commits mid-way.
+        threading.Timer(0.3, release.set).start()
+        inventory.take_checkpoint(ids['company'], taken_at=DAY2)
+        db.session.commit()
+        writer.join(5)
+        checkpoint = {
+            (cp.warehouse_id, cp.product_id): (cp.stock, cp.last_movement_id)
+            for cp in InventoryCheckpoint.query.filter_by(taken_at=DAY2)
+        }
+        sale_id = InventoryMovement.query.filter_by(warehouse_id=ids['w1']).order_by(InventoryMovement.id.desc()).first().id
+        transfer_in_id = InventoryMovement.query.filter_by(warehouse_id=ids['w2']).one().id
+        assert checkpoint[(ids['w1'], ids['p1'])] == (3, sale_id)
+        assert checkpoint[(ids['w2'], ids['p2'])] == (1, transfer_in_id)
+        assert inventory.stock_as_of(ids['company'], ids['w1'], DAY3) == {ids['p1']: 3, ids['p2']: 1}
+        monkeypatch.setattr(inventory, 'dom_now', lambda: DAY3)
+        assert inventory.verify_ledger(ids['company']) == []
+
+
+def test_verify_cli_reports_stock_changed_outside_the_ledger(ids, monkeypatch):
+    runner = CliRunner()
+    with app.app_context():
+        _history(ids, monkeypatch)
+        ProductStock.query.filter_by(product_id=ids['p2'], warehouse_id=ids['w1']).update({'stock': 9})
+        db.session.commit()
+        result = runner.invoke(app.cli, ['inventory_verify'], obj=app.cli)
+        assert result.exit_code != 0
+        assert 'historial 1, stock 9' in result.output
+
+        result = runner.invoke(app.cli, ['inventory_checkpoint', '--company-id', str(ids['company'])])
+        assert result.exit_code == 0, result.output
+        monkeypatch.setattr(inventory, 'dom_now', lambda: datetime(2030, 1, 1))
+        assert runner.invoke(app.cli, ['inventory_verify']).exit_code == 0
+
+
+def test_inventory_page_and_export_as_of(ids, monkeypatch):
+    with app.app_context():
+        _history(ids, monkeypatch)
+    with app.test_client() as c:
+        c.post('/login', data={'username': 'hist', 'password': 'pass'})
+        page = c.get(f"/inventario?warehouse_id={ids['w1']}&as_of=2024-03-02").get_data(as_text=True)
+        assert 'Stock al 2024-03-02' in page
+        assert '14.50' in page  # 3 x 4.00 + 1 x 2.50
+
+        csv_text = c.get('/reportes/inventario/export?as_of=2024-03-02').get_data(as_text=True)
+        lines = csv_text.splitlines()
+        assert lines[0].endswith('Stock al 2024-03-02,Costo,Valor')
+        assert 'H1,Uno,W1,1,0,3,4.00,12.00' in lines
+        assert 'H2,Dos,W2,6,0,1,2.50,2.50' in lines
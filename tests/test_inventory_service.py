@@ -0,0 +1,170 @@
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+import inventory
+from app import app, db
+from models import CompanyInfo, User, Product, Warehouse, ProductStock, InventoryMovement
+
+
+@pytest.fixture
+def ids(tmp_path):
+    app.config.from_object('config.TestingConfig')
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{tmp_path / "inv.sqlite"}'
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        comp = CompanyInfo(name='Inv', street='', sector='', province='', phone='', rnc='')
+        db.session.add(comp)
+        db.session.flush()
+        user = User(username='inv', first_name='I', last_name='S', role='company', company_id=comp.id)
+        user.set_password('pass')
+        p1 = Product(code='A1', name='Uno', unit='u', price=1, stock=5, company_id=comp.id)
+        p2 = Product(code='A2', name='Dos', unit='u', price=1, stock=2, company_id=comp.id)
+        w1 = Warehouse(name='W1', company_id=comp.id)
+        w2 = Warehouse(name='W2', company_id=comp.id)
+        db.session.add_all([user, p1, p2, w1, w2])
+        db.session.flush()
+        db.session.add_all([
+            ProductStock(product_id=p1.id, warehouse_id=w1.id, stock=5, company_id=comp.id),
+            ProductStock(product_id=p2.id, warehouse_id=w1.id, stock=2, company_id=comp.id),
+        ])
+        db.session.commit()
+        return {'company': comp.id, 'user': user.id, 'p1': p1.id, 'p2': p2.id, 'w1': w1.id, 'w2': w2.id}
+
+
+def _stock(product_id, warehouse_id):
+    ps = ProductStock.query.filter_by(product_id=product_id, warehouse_id=warehouse_id).first()
+    return ps.stock if ps else None
+
+
+def test_withdraw_merges_lines_and_never_oversells(ids):
+    with app.app_context():
+        merged = inventory.withdraw(
+            ids['company'], ids['w1'], [(ids['p2'], 1), (ids['p1'], 2), (ids['p1'], 1)],
+            executed_by=ids['user'], reference_type='Order', reference_id=9,
+        )
+        db.session.commit()
+        assert merged == [(ids['p1'], 3), (ids['p2'], 1)]
+        assert _stock(ids['p1'], ids['w1']) == 2
+        assert db.session.get(Product, ids['p1']).stock == 2
+        assert InventoryMovement.query.filter_by(reference_type='Order', reference_id=9).count() == 2
+
+        with pytest.raises(inventory.InsufficientStock) as info:
+            inventory.withdraw(ids['company'], ids['w1'], [(ids['p1'], 1), (ids['p2'], 5)], executed_by=ids['user'])
+        db.session.rollback()
+        assert info.value.product_id == ids['p2']
+        assert _stock(ids['p1'], ids['w1']) == 2
+        assert InventoryMovement.query.count() == 2
+
+
+def test_parallel_withdrawals_do_not_lose_updates(ids):
+    outcomes = []
+
+    def _buy():
+        with app.app_context():
+            try:
+                inventory.withdraw(ids['company'], ids['w1'], [(ids['p1'], 1)], executed_by=ids['user'])
+                db.session.commit()
+                outcomes.append('ok')
+            except inventory.InsufficientStock:
+                db.session.rollback()
+                outcomes.append('sin_stock')
+
+    threads = [threading.Thread(target=_buy) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert outcomes.count('ok') == 5
+    with app.app_context():
+        assert _stock(ids['p1'], ids['w1']) == 0
+        assert db.session.get(Product, ids['p1']).stock == 0
+        assert InventoryMovement.query.count() == 5
+
+
+def test_transfer_and_set_level(ids):
+    with app.app_context():
+        inventory.transfer(ids['company'], ids['p1'], ids['w1'], ids['w2'], 4, executed_by=ids['user'])
+        inventory.transfer(ids['company'], ids['p1'], ids['w2'], ids['w1'], 1, executed_by=ids['user'])
+        assert inventory.set_level(ids['company'], ids['w2'], ids['p2'], 7, executed_by=ids['user']) == 7
+        db.session.commit()
+        assert _stock(ids['p1'], ids['w1']) == 2
+        assert _stock(ids['p1'], ids['w2']) == 3
+        assert db.session.get(Product, ids['p1']).stock == 5
+        assert _stock(ids['p2'], ids['w2']) == 7
+        assert db.session.get(Product, ids['p2']).stock == 9
+        with pytest.raises(inventory.InsufficientStock):
+            inventory.transfer(ids['company'], ids['p1'], ids['w2'], ids['w1'], 10, executed_by=ids['user'])
+        db.session.rollback()
+
+
+def _quotation(ids, lines, qty=1):
+    from datetime import timedelta
+    from models import Client, Quotation, QuotationItem, dom_now
+    client = Client(name='Cli', company_id=ids['company'])
+    db.session.add(client)
+    db.session.flush()
+    quotation = Quotation(client_id=client.id, valid_until=dom_now() + timedelta(days=5), subtotal=0, itbis=0,
+                          total=0, company_id=ids['company'], warehouse_id=ids['w1'])
+    db.session.add(quotation)
+    db.session.flush()
+    for n in range(lines):
+        product = Product(code=f'Q{quotation.id}-{n}', name=f'Linea {n}', unit='u', price=1, stock=10,
+                          company_id=ids['company'])
+        db.session.add(product)
+        db.session.flush()
+        db.session.add_all([
+            ProductStock(product_id=product.id, warehouse_id=ids['w1'], stock=10, company_id=ids['company']),
+            QuotationItem(quotation_id=quotation.id, code=product.code, product_name=product.name, unit='u',
+                          unit_price=1, quantity=qty, company_id=ids['company']),
+        ])
+    db.session.commit()
+    return quotation.id
+
+
+def test_quotation_conversion_uses_constant_stock_queries(ids, tmp_path):
+    from sqlalchemy import event
+    from models import Order
+    app.config['PDF_ARCHIVE_ROOT'] = str(tmp_path / 'pdf_archive')
+    counts = []
+    with app.app_context():
+        small, large = _quotation(ids, 3), _quotation(ids, 40)
+        c = app.test_client()
+        c.post('/login', data={'username': 'inv', 'password': 'pass'})
+        for quotation_id in (small, large):
+            statements = []
+
+            def track(conn, cursor, statement, *args):
+                if 'product' in statement.lower():
+                    statements.append(statement)
+
+            event.listen(db.engine, 'before_cursor_execute', track)
+            try:
+                c.post(f'/cotizaciones/{quotation_id}/convertir', data={'warehouse_id': ids['w1']})
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', track)
+            counts.append(len(statements))
+        db.session.expire_all()
+        assert Order.query.count() == 2
+        assert ProductStock.query.filter_by(warehouse_id=ids['w1'], stock=9).count() == 43
+        assert InventoryMovement.query.filter_by(movement_type='salida', reference_type='Order').count() == 43
+    assert counts[0] == counts[1]
+
+
+def test_quotation_conversion_rolls_back_when_one_line_is_short(ids, tmp_path):
+    from models import Order, Quotation
+    app.config['PDF_ARCHIVE_ROOT'] = str(tmp_path / 'pdf_archive')
+    with app.app_context():
+        quotation_id = _quotation(ids, 5, qty=11)
+        c = app.test_client()
+        c.post('/login', data={'username': 'inv', 'password': 'pass'})
+        c.post(f'/cotizaciones/{quotation_id}/convertir', data={'warehouse_id': ids['w1']})
+        db.session.expire_all()
+        assert Order.query.count() == 0
+        assert db.session.get(Quotation, quotation_id).status != 'convertida'
+        assert ProductStock.query.filter_by(warehouse_id=ids['w1'], stock=10).count() == 5
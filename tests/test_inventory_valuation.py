@@ -0,0 +1,105 @@
+import os
+import sys
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import event
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+import inventory
+from app import app, db, inventory_valuation, invalidate_catalog_cache
+from models import CompanyInfo, User, Product, Warehouse, ProductStock, InventoryMovement, dom_now
+
+
+@pytest.fixture
+def ids(tmp_path):
+    app.config.from_object('config.TestingConfig')
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{tmp_path / "valuation.sqlite"}'
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        comp = CompanyInfo(name='Val', street='', sector='', province='', phone='', rnc='')
+        db.session.add(comp)
+        db.session.flush()
+        user = User(username='val', first_name='V', last_name='S', role='manager', company_id=comp.id)
+        user.set_password('pass')
+        fast = Product(code='F1', name='Rápido', unit='u', price=10, cost_price=2, stock=30, company_id=comp.id)
+        slow = Product(code='S1', name='Lento', unit='u', price=10, cost_price=5, stock=40, company_id=comp.id)
+        idle = Product(code='I1', name='Quieto', unit='u', price=10, cost_price=1, stock=10, company_id=comp.id)
+        w1 = Warehouse(name='Central', company_id=comp.id)
+        w2 = Warehouse(name='Sucursal', company_id=comp.id)
+        db.session.add_all([user, fast, slow, idle, w1, w2])
+        db.session.flush()
+        db.session.add_all([
+            ProductStock(product_id=fast.id, warehouse_id=w1.id, stock=30, company_id=comp.id),
+            ProductStock(product_id=slow.id, warehouse_id=w1.id, stock=40, company_id=comp.id),
+            ProductStock(product_id=idle.id, warehouse_id=w2.id, stock=10, company_id=comp.id),
+        ])
+        old = dom_now() - timedelta(days=200)
+        db.session.add_all([
+            InventoryMovement(product_id=fast.id, quantity=90, movement_type='salida', warehouse_id=w1.id,
+                              company_id=comp.id, executed_by=user.id, timestamp=dom_now() - timedelta(days=10)),
+            InventoryMovement(product_id=slow.id, quantity=2, movement_type='salida', warehouse_id=w1.id,
+                              company_id=comp.id, executed_by=user.id, timestamp=dom_now() - timedelta(days=5)),
+            InventoryMovement(product_id=idle.id, quantity=50, movement_type='salida', warehouse_id=w2.id,
+                              company_id=comp.id, executed_by=user.id, timestamp=old),
+        ])
+        db.session.commit()
+        ids = {'company': comp.id, 'user': user.id, 'fast': fast.id, 'w1': w1.id, 'w2': w2.id}
+    invalidate_catalog_cache()
+    return ids
+
+
+def test_valuation_groups_value_rotation_and_slow_movers(ids):
+    with app.app_context():
+        report = inventory_valuation(ids['company'], 90)
+        central, branch = report['warehouses']
+        assert central == {
+            'warehouse_id': ids['w1'], 'warehouse': 'Central', 'units': 70, 'value': 260.0,
+            'outflow': 92, 'outflow_value': 190.0, 'days_of_inventory': 68.5,
+            'slow_count': 1, 'slow_value': 200.0,
+        }
+        assert branch['days_of_inventory'] is None and branch['slow_count'] == 1
+        assert report['total_value'] == 270.0
+        assert [(p['code'], p['days_of_inventory']) for p in report['slow_movers']] == [('S1', 1800.0), ('I1', None)]
+
+
+def test_valuation_is_cached_until_stock_moves(ids):
+    statements = []
+
+    def track(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    with app.app_context():
+        first = inventory_valuation(ids['company'], 90)
+        event.listen(db.engine, 'before_cursor_execute', track)
+        try:
+            assert inventory_valuation(ids['company'], 90) is first
+            assert not any('product_stock' in s for s in statements)
+            inventory.withdraw(ids['company'], ids['w1'], [(ids['fast'], 10)], executed_by=ids['user'])
+            db.session.commit()
+            refreshed = inventory_valuation(ids['company'], 90)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', track)
+        assert refreshed is not first
+        assert refreshed['warehouses'][0]['units'] == 60
+
+
+def test_valuation_page_and_streamed_csv(ids):
+    with app.test_client() as c:
+        c.post('/login', data={'username': 'val', 'password': 'pass'})
+        with c.session_transaction() as sess:
+            sess['role'] = 'manager'
+        page = c.get('/reportes/inventario/valoracion').get_data(as_text=True)
+        assert 'Productos de lenta rotación' in page and 'Lento' in page
+        lines = c.get('/reportes/inventario/valoracion/export?days=90').get_data(as_text=True).splitlines()
+        assert lines[0].startswith('Almacén,Código,Producto,Stock,Costo,Valor,Salidas 90 días')
+        assert lines[1:] == [
+            'Central,S1,Lento,40,5.00,200.00,2,1800.0,sí',
+            'Central,F1,Rápido,30,2.00,60.00,90,30.0,no',
+            'Sucursal,I1,Quieto,10,1.00,10.00,0,,sí',
+        ]
+        with c.session_transaction() as sess:
+            sess['role'] = 'company'
+        assert c.get('/reportes/inventario/valoracion').status_code == 403
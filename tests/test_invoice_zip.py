@@ -0,0 +1,104 @@
+import os
+import sys
+import zipfile
+from datetime import datetime
+from io import BytesIO
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from app import app, db, _ZipStreamBuffer
+from models import CompanyInfo, User, Client, Order, Invoice, InvoiceItem, Warehouse
+
+
+def _setup(tmp_path):
+    db_path = tmp_path / 'test.sqlite'
+    app.config.from_object('config.TestingConfig')
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
+    app.config['PDF_ARCHIVE_ROOT'] = str(tmp_path / 'generated_docs')
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        company = CompanyInfo(name='Zip SRL', street='', sector='', province='', phone='', rnc='')
+        db.session.add(company)
+        db.session.flush()
+        user = User(username='u_zip', first_name='U', last_name='Zip', role='company', company_id=company.id)
+        user.set_password('pass')
+        db.session.add(user)
+        client = Client(name='Cliente Zip', company_id=company.id)
+        warehouse = Warehouse(name='Principal', company_id=company.id)
+        db.session.add_all([client, warehouse])
+        db.session.flush()
+        order = Order(client_id=client.id, subtotal=100, itbis=18, total=118, status='Entregado', warehouse_id=warehouse.id, company_id=company.id)
+        db.session.add(order)
+        db.session.flush()
+        for idx, day in enumerate((5, 12, 20), start=1):
+            inv = Invoice(
+                client_id=client.id, order_id=order.id, subtotal=100, itbis=18, total=118,
+                ncf=f'B02{idx:08d}', invoice_type='Consumidor Final', status='Pendiente',
+                date=datetime(2026, 3, day, 10, 0), company_id=company.id,
+            )
+            db.session.add(inv)
+            db.session.flush()
+            db.session.add(InvoiceItem(
+                invoice_id=inv.id, code='P1', product_name='Prod', unit='Unidad',
+                unit_price=100, quantity=1, discount=0, company_id=company.id,
+            ))
+        other = CompanyInfo(name='Otra', street='', sector='', province='', phone='', rnc='')
+        db.session.add(other)
+        db.session.flush()
+        other_client = Client(name='Ajeno', company_id=other.id)
+        db.session.add(other_client)
+        db.session.flush()
+        other_order = Order(client_id=other_client.id, subtotal=1, itbis=0, total=1, company_id=other.id)
+        db.session.add(other_order)
+        db.session.flush()
+        db.session.add(Invoice(
+            client_id=other_client.id, order_id=other_order.id, subtotal=1, itbis=0, total=1,
+            ncf='B02999', date=datetime(2026, 3, 6), company_id=other.id,
+        ))
+        db.session.commit()
+
+
+def test_zip_stream_buffer_drains_written_chunks():
+    sink = _ZipStreamBuffer()
+    with zipfile.ZipFile(sink, mode='w') as zf:
+        zf.writestr('a.txt', 'hola')
+        first = sink.drain()
+    rest = sink.drain()
+    assert first
+    assert sink.drain() == b''
+    with zipfile.ZipFile(BytesIO(first + rest)) as zf:
+        assert zf.read('a.txt') == b'hola'
+
+
+def test_invoice_zip_streams_range_and_renders_missing_pdfs(tmp_path):
+    _setup(tmp_path)
+    with app.test_client() as c:
+        c.post('/login', data={'username': 'u_zip', 'password': 'pass'})
+        resp = c.get('/facturas/zip?desde=2026-03-01&hasta=2026-03-12')
+        assert resp.status_code == 200
+        assert resp.mimetype == 'application/zip'
+        assert resp.is_streamed
+        payload = resp.get_data()
+
+    with zipfile.ZipFile(BytesIO(payload)) as zf:
+        names = zf.namelist()
+        assert names == ['factura-00001-B0200000001.pdf', 'factura-00002-B0200000002.pdf']
+        assert zf.read(names[0]).startswith(b'%PDF')
+
+    with app.app_context():
+        rendered = db.session.get(Invoice, 1)
+        assert rendered.generated_doc_path and rendered.generated_doc_path.startswith('/generated_docs/')
+        assert db.session.get(Invoice, 3).generated_doc_path is None
+
+
+def test_invoice_zip_respects_max_documents(tmp_path):
+    _setup(tmp_path)
+    app.config['ZIP_MAX_DOCUMENTS'] = '2'
+    try:
+        with app.test_client() as c:
+            c.post('/login', data={'username': 'u_zip', 'password': 'pass'})
+            resp = c.get('/facturas/zip?desde=2026-03-01&hasta=2026-03-31')
+        assert resp.status_code == 302
+    finally:
+        app.config['ZIP_MAX_DOCUMENTS'] = '1000'
@@ -0,0 +1,60 @@
+import logging
+import os
+import sys
+from logging.handlers import QueueHandler, RotatingFileHandler
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+import app as app_module
+from app import app
+
+
+class _ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+def _events(handler):
+    return [m for m in handler.messages if '"event": "request_' in m]
+
+
+def test_app_logger_only_enqueues_records():
+    handlers = app.logger.handlers
+    assert any(isinstance(h, QueueHandler) for h in handlers)
+    assert not any(isinstance(h, RotatingFileHandler) for h in handlers)
+    assert app_module.file_handler.maxBytes >= 64 * 1024
+    assert app_module.file_handler in app_module._log_listener.handlers
+
+
+def test_health_and_static_requests_are_not_logged(monkeypatch):
+    app.config.from_object('config.TestingConfig')
+    handler = _ListHandler()
+    app.logger.addHandler(handler)
+    try:
+        with app.test_client() as c:
+            c.get('/__health')
+            c.get('/static/does-not-exist.css')
+            c.get('/login')
+    finally:
+        app.logger.removeHandler(handler)
+    events = _events(handler)
+    assert len(events) == 2
+    assert all('"path": "/login"' in m for m in events)
+
+
+def test_request_start_can_be_sampled_out(monkeypatch):
+    app.config.from_object('config.TestingConfig')
+    monkeypatch.setattr(app_module, 'LOG_REQUEST_START_SAMPLE_RATE', 0.0)
+    handler = _ListHandler()
+    app.logger.addHandler(handler)
+    try:
+        with app.test_client() as c:
+            c.get('/login')
+    finally:
+        app.logger.removeHandler(handler)
+    events = _events(handler)
+    assert len(events) == 1 and '"event": "request_end"' in events[0]
@@ -0,0 +1,112 @@
+import os
+import sys
+
+import pytest
+from sqlalchemy import event
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+import app as app_module
+from app import app, db, reconcile_low_stock_alerts
+from models import CompanyInfo, User, Product, Warehouse, ProductStock, Notification
+
+
+@pytest.fixture
+def client(tmp_path):
+    app.config.from_object('config.TestingConfig')
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{tmp_path / "low.sqlite"}'
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        comp = CompanyInfo(name='Comp', street='', sector='', province='', phone='', rnc='')
+        db.session.add(comp)
+        db.session.flush()
+        user = User(username='low', first_name='L', last_name='S', role='company', company_id=comp.id)
+        user.set_password('pass')
+        prod = Product(code='P1', name='Tornillo', unit='u', price=10, stock=5, min_stock=3, company_id=comp.id)
+        w1 = Warehouse(name='W1', company_id=comp.id)
+        w2 = Warehouse(name='W2', company_id=comp.id)
+        db.session.add_all([user, prod, w1, w2])
+        db.session.flush()
+        db.session.add(ProductStock(product_id=prod.id, warehouse_id=w1.id, stock=5, min_stock=3, company_id=comp.id))
+        db.session.commit()
+    with app.test_client() as c:
+        c.post('/login', data={'username': 'low', 'password': 'pass'})
+        yield c
+
+
+def _alerts():
+    return Notification.query.filter(Notification.message == 'Stock bajo: Tornillo').count()
+
+
+def _adjust(client, mtype, qty):
+    return client.post('/inventario/ajustar', data={'product_id': 1, 'warehouse_id': 1, 'quantity': qty, 'movement_type': mtype})
+
+
+def test_adjust_alerts_once_per_crossing(client):
+    _adjust(client, 'salida', 1)
+    with app.app_context():
+        assert _alerts() == 0
+    _adjust(client, 'salida', 2)
+    _adjust(client, 'salida', 1)
+    with app.app_context():
+        assert _alerts() == 1
+        assert db.session.get(ProductStock, 1).low_stock_alert_at is not None
+    _adjust(client, 'entrada', 5)
+    with app.app_context():
+        assert db.session.get(ProductStock, 1).low_stock_alert_at is None
+    _adjust(client, 'ajuste', 0)
+    with app.app_context():
+        assert _alerts() == 2
+
+
+def test_transfer_alerts_origin_warehouse(client):
+    client.post('/inventario/transferir', data={'product_id': 1, 'origin_id': 1, 'dest_id': 2, 'quantity': 4})
+    with app.app_context():
+        assert _alerts() == 1
+        dest = ProductStock.query.filter_by(warehouse_id=2).one()
+        assert dest.stock == 4 and dest.low_stock_alert_at is None
+
+
+def test_reconcile_catches_changes_that_bypassed_the_routes(client):
+    with app.app_context():
+        ProductStock.query.filter_by(id=1).update({ProductStock.stock: 1})
+        db.session.commit()
+        assert reconcile_low_stock_alerts() == {'opened': 1, 'closed': 0, 'checked': 1}
+        assert reconcile_low_stock_alerts()['checked'] == 0
+        ProductStock.query.filter_by(id=1).update({ProductStock.stock: 9})
+        db.session.commit()
+        assert reconcile_low_stock_alerts()['closed'] == 1
+        assert _alerts() == 1
+    result = app.test_cli_runner().invoke(args=['low_stock_reconcile'])
+    assert result.exit_code == 0 and 'opened:' in result.output
+
+
+def test_reconcile_treats_null_stock_and_minimum_as_zero(client):
+    with app.app_context():
+        ProductStock.query.filter_by(id=1).update({ProductStock.stock: None})
+        db.session.commit()
+        assert reconcile_low_stock_alerts()['opened'] == 1
+        ProductStock.query.filter_by(id=1).update({ProductStock.min_stock: None})
+        db.session.commit()
+        assert reconcile_low_stock_alerts() == {'opened': 0, 'closed': 1, 'checked': 0}
+        assert db.session.get(ProductStock, 1).low_stock_alert_at is None
+        assert reconcile_low_stock_alerts()['closed'] == 0
+
+
+def test_page_render_never_scans_inventory(client, monkeypatch):
+    monkeypatch.setattr(app_module, 'ENABLE_NOTIFICATIONS_CONTEXT', True)
+    monkeypatch.setattr(app_module, 'ENABLE_LOW_STOCK_SCAN', True)
+    statements = []
+
+    def _listener(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', _listener)
+    try:
+        assert client.get('/cotizaciones').status_code == 200
+    finally:
+        with app.app_context():
+            event.remove(db.engine, 'before_cursor_execute', _listener)
+    assert not [sql for sql in statements if 'product_stock' in sql]
@@ -0,0 +1,134 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+import app as app_module
+from app import app, db
+from metrics import MetricsRegistry
+from models import User
+
+
+def _setup(tmp_path, monkeypatch):
+    app.config.from_object('config.TestingConfig')
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'metrics.sqlite'}"
+    app.config['METRICS_TOKEN'] = 'scrape-secret'
+    registry = MetricsRegistry(str(tmp_path / 'metrics'), flush_interval=0)
+    registry._meta = dict(app_module.METRICS._meta)
+    monkeypatch.setattr(app_module, 'METRICS', registry)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        admin = User(username='admin_m', first_name='A', last_name='M', role='admin')
+        admin.set_password('pass')
+        db.session.add(admin)
+        db.session.commit()
+    return registry
+
+
+def test_metrics_requires_admin_or_token(tmp_path, monkeypatch):
+    _setup(tmp_path, monkeypatch)
+    with app.test_client() as c:
+        assert c.get('/__metrics').status_code == 404
+        assert c.get('/__metrics', headers={'Authorization': 'Bearer nope'}).status_code == 404
+        assert c.get('/__metrics', headers={'Authorization': 'Bearer scrape-secret'}).status_code == 200
+        assert c.get('/__metrics?token=scrape-secret').status_code == 404
+        c.post('/login', data={'username': 'admin_m', 'password': 'pass'})
+        assert c.get('/__metrics').status_code == 200
+
+
+def test_metrics_exposes_requests_sql_email_and_ecf(tmp_path, monkeypatch):
+    _setup(tmp_path, monkeypatch)
+    with app.test_client() as c:
+        c.get('/login')
+        c.post('/login', data={'username': 'admin_m', 'password': 'wrong'})
+        body = c.get('/__metrics', headers={'Authorization': 'Bearer scrape-secret'}).get_data(as_text=True)
+
+    assert 'tiendix_http_requests_total{endpoint="auth.login",method="GET",status="200"} 1' in body
+    assert 'tiendix_http_request_duration_seconds_bucket{endpoint="auth.login",le="+Inf"} 2' in body
+    assert '# TYPE tiendix_http_request_duration_seconds histogram' in body
+    assert 'tiendix_sql_queries_total{endpoint="auth.login"}' in body
+    assert 'tiendix_email_outbox_depth{status="pending"} 0' in body
+    assert '# TYPE tiendix_email_total counter' in body
+
+
+def test_default_metrics_dir_stays_out_of_the_app_tree_when_testing(tmp_path, monkeypatch):
+    _setup(tmp_path, monkeypatch)
+    registry = MetricsRegistry(None, flush_interval=0)
+    monkeypatch.setattr(app_module, 'METRICS', registry)
+    with app.test_client() as c:
+        c.get('/login')
+    assert registry.directory and not registry.directory.startswith(app.instance_path)
+    assert os.listdir(registry.directory)
+
+
+def test_metrics_are_merged_across_worker_snapshots(tmp_path):
+    directory = str(tmp_path / 'shared')
+    other_worker = MetricsRegistry(directory, flush_interval=0)
+    other_worker.inc('tiendix_http_requests_total', endpoint='index', status=200)
+    other_worker.observe('tiendix_pdf_render_seconds', 0.2, renderer='generate_pdf_bytes')
+    other_worker.set_gauge('tiendix_db_pool_checked_out', 3)
+    other_worker.flush(force=True)
+    os.replace(
+        os.path.join(directory, f'metrics-{os.getpid()}.json'),
+        os.path.join(directory, f'metrics-{os.getppid()}.json'),
+    )
+
+    this_worker = MetricsRegistry(directory, flush_interval=0)
+    this_worker.inc('tiendix_http_requests_total', 2, endpoint='index', status=200)
+    this_worker.observe('tiendix_pdf_render_seconds', 3.0, renderer='generate_pdf_bytes')
+    body = this_worker.render()
+
+    assert 'tiendix_http_requests_total{endpoint="index",status="200"} 3' in body
+    assert 'tiendix_pdf_render_seconds_bucket{renderer="generate_pdf_bytes",le="0.25"} 1' in body
+    assert 'tiendix_pdf_render_seconds_count{renderer="generate_pdf_bytes"} 2' in body
+    assert f'tiendix_db_pool_checked_out{{pid="{os.getppid()}"}} 3' in body
+
+
+def _dead_pid():
+    pid = 99999
+    while True:
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return pid
+        except OSError:
+            pass
+        pid += 1
+
+
+def test_dead_worker_snapshots_are_retired_and_counters_stay_monotonic(tmp_path):
+    directory = tmp_path / 'shared'
+    dead = MetricsRegistry(str(directory), flush_interval=0)
+    dead.inc('tiendix_http_requests_total', 5, endpoint='index', status=200)
+    dead.observe('tiendix_pdf_render_seconds', 0.2, renderer='generate_pdf_bytes')
+    dead.set_gauge('tiendix_db_pool_checked_out', 3)
+    dead.flush(force=True)
+    dead_pid = _dead_pid()
+    os.replace(directory / f'metrics-{os.getpid()}.json', directory / f'metrics-{dead_pid}.json')
+
+    scraper = MetricsRegistry(str(directory), flush_interval=0)
+    scraper.inc('tiendix_http_requests_total', endpoint='index', status=200)
+    scraper.flush(force=True)
+    first = scraper.render()
+    assert 'tiendix_http_requests_total{endpoint="index",status="200"} 6' in first
+    assert 'tiendix_pdf_render_seconds_count{renderer="generate_pdf_bytes"} 1' in first
+    assert 'tiendix_db_pool_checked_out' not in first
+    assert sorted(p.name for p in directory.glob('metrics-*.json')) == sorted(
+        ['metrics-retired.json', f'metrics-{os.getpid()}.json']
+    )
+    assert scraper.render() == first
+
+
+def test_reused_pid_does_not_overwrite_a_dead_workers_totals(tmp_path):
+    directory = tmp_path / 'shared'
+    previous = MetricsRegistry(str(directory), flush_interval=0)
+    previous.inc('tiendix_http_requests_total', 4, endpoint='index', status=200)
+    previous.flush(force=True)
+
+    # A new process that got the same pid starts counting from zero.
+    successor = MetricsRegistry(str(directory), flush_interval=0)
+    successor.inc('tiendix_http_requests_total', endpoint='index', status=200)
+    successor.flush(force=True)
+
+    assert 'tiendix_http_requests_total{endpoint="index",status="200"} 5' in successor.render()
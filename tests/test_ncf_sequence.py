@@ -0,0 +1,117 @@
+import os
+import sys
+import threading
+
+import pytest
+from sqlalchemy import event
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+import ncf_sequence
+from app import app, db
+from models import CompanyInfo, Client, Order, Invoice
+
+
+@pytest.fixture
+def ids(tmp_path):
+    app.config.from_object('config.TestingConfig')
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{tmp_path / "ncf.sqlite"}'
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        comp = CompanyInfo(name='Ncf', street='', sector='', province='', phone='', rnc='', ncf_final=1, ncf_fiscal=1)
+        db.session.add(comp)
+        db.session.flush()
+        client = Client(name='Cli', company_id=comp.id)
+        db.session.add(client)
+        db.session.flush()
+        order = Order(client_id=client.id, subtotal=1, itbis=0, total=1, company_id=comp.id)
+        db.session.add(order)
+        db.session.commit()
+        return {'company': comp.id, 'client': client.id, 'order': order.id}
+
+
+def _invoice(ids, ncf):
+    db.session.add(Invoice(client_id=ids['client'], order_id=ids['order'], subtotal=1, itbis=0, total=1,
+                           ncf=ncf, company_id=ids['company']))
+
+
+def _counter(ids):
+    return db.session.get(CompanyInfo, ids['company']).ncf_final
+
+
+def test_next_ncf_advances_counter_and_rolls_back_with_caller(ids):
+    with app.app_context():
+        assert ncf_sequence.next_ncf(ids['company'], 'B02') == 'B0200000001'
+        assert ncf_sequence.next_ncf(ids['company'], 'B02') == 'B0200000002'
+        assert ncf_sequence.next_ncf(ids['company'], 'B01') == 'B0100000001'
+        db.session.commit()
+        assert _counter(ids) == 3
+        ncf_sequence.next_ncf(ids['company'], 'B02')
+        db.session.rollback()
+        assert _counter(ids) == 3
+
+
+def test_used_numbers_are_skipped_with_constant_queries(ids):
+    statements = []
+
+    def track(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    with app.app_context():
+        for n in range(1, 301):
+            _invoice(ids, f'B02{n:08d}')
+        db.session.commit()
+        event.listen(db.engine, 'before_cursor_execute', track)
+        try:
+            assert ncf_sequence.next_ncf(ids['company'], 'B02') == 'B0200000301'
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', track)
+        assert len(statements) <= 6
+        db.session.commit()
+        assert _counter(ids) == 302
+
+
+def test_concurrent_allocations_never_repeat(ids):
+    issued = []
+
+    def _issue():
+        with app.app_context():
+            for _ in range(5):
+                issued.append(ncf_sequence.next_ncf(ids['company'], 'B02'))
+                db.session.commit()
+
+    threads = [threading.Thread(target=_issue) for _ in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sorted(issued) == [f'B02{n:08d}' for n in range(1, 31)]
+
+
+def test_block_allocator_reserves_numbers_per_worker(ids):
+    allocator = ncf_sequence.NcfBlockAllocator(block_size=10)
+    with app.app_context():
+        _invoice(ids, 'B0200000003')
+        db.session.commit()
+        issued = [allocator.next(ids['company'], 'B02') for _ in range(10)]
+        assert issued[:3] == ['B0200000001', 'B0200000002', 'B0200000004']
+        assert issued[-1] == 'B0200000011'
+        assert _counter(ids) == 21
+        assert allocator.next(ids['company'], 'B02') == 'B0200000012'
+
+
+def test_manual_counter_change_drops_blocks_on_every_worker(ids):
+    first = ncf_sequence.NcfBlockAllocator(block_size=10)
+    second = ncf_sequence.NcfBlockAllocator(block_size=10)
+    with app.app_context():
+        assert first.next(ids['company'], 'B02') == 'B0200000001'
+        assert second.next(ids['company'], 'B02') == 'B0200000011'
+        # Same change as Ajustes: only one worker handles the request.
+        company = db.session.get(CompanyInfo, ids['company'])
+        company.ncf_final = 100
+        ncf_sequence.bump_epoch(company)
+        db.session.commit()
+        assert first.next(ids['company'], 'B02') == 'B0200000100'
+        assert second.next(ids['company'], 'B02') == 'B0200000110'
+        assert first.next(ids['company'], 'B02') == 'B0200000101'
@@ -0,0 +1,107 @@
+import os
+import sys
+
+from sqlalchemy import event
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+import app as app_module
+from app import app, db, notify, unread_notification_count
+from models import CompanyInfo, Notification, NotificationCounter, User
+
+
+def _setup(tmp_path):
+    app.config.from_object('config.TestingConfig')
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{tmp_path / "notif.sqlite"}'
+    app_module.invalidate_tenant_cache()
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        company = CompanyInfo(name='Notif SRL', street='', sector='', province='', phone='', rnc='')
+        db.session.add(company)
+        db.session.flush()
+        user = User(username='notif', first_name='N', last_name='U', role='company', company_id=company.id)
+        user.set_password('pass')
+        db.session.add(user)
+        db.session.commit()
+        return company.id
+
+
+def test_notify_coalesces_into_callers_commit(tmp_path):
+    cid = _setup(tmp_path)
+    with app.app_context():
+        assert unread_notification_count(cid) == 0
+        statements = []
+
+        def _listener(conn, cursor, statement, *args):
+            if 'notification_counter' in statement:
+                statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', _listener)
+        try:
+            for n in range(3):
+                notify(f'Evento {n}', company_id=cid)
+            assert Notification.query.count() == 3  # autoflush applies the counter in the same transaction
+            db.session.commit()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', _listener)
+        assert len(statements) == 1 and statements[0].startswith('UPDATE')
+        assert unread_notification_count(cid) == 3
+
+        notify('Descartada', company_id=cid)
+        db.session.rollback()
+        assert unread_notification_count(cid) == 3
+
+
+def test_reading_notification_decrements_shared_counter(tmp_path):
+    cid = _setup(tmp_path)
+    with app.app_context():
+        notify('Primera', company_id=cid)
+        notify('Segunda', company_id=cid)
+        db.session.commit()
+        first_id = Notification.query.order_by(Notification.id).first().id
+    with app.test_client() as c:
+        c.post('/login', data={'username': 'notif', 'password': 'pass'})
+        resp = c.post(f'/notificaciones/{first_id}/leer', headers={'X-Requested-With': 'XMLHttpRequest'})
+        assert resp.get_json()['ok'] is True
+        c.post(f'/notificaciones/{first_id}/leer', headers={'X-Requested-With': 'XMLHttpRequest'})
+    with app.app_context():
+        assert unread_notification_count(cid) == 1
+        assert db.session.get(NotificationCounter, cid).unread == 1
+
+
+def test_missing_counter_is_backfilled_from_existing_rows(tmp_path):
+    cid = _setup(tmp_path)
+    with app.app_context():
+        db.session.add_all([
+            Notification(company_id=cid, message='a'),
+            Notification(company_id=cid, message='b', is_read=True),
+        ])
+        db.session.commit()
+        NotificationCounter.query.delete()
+        db.session.commit()
+        assert unread_notification_count(cid) == 1
+        notify('c', company_id=cid)
+        db.session.commit()
+        assert unread_notification_count(cid) == 2
+
+
+def test_counter_created_concurrently_keeps_callers_flush(tmp_path, monkeypatch):
+    cid = _setup(tmp_path)
+    with app.app_context():
+        NotificationCounter.query.delete()
+        db.session.commit()
+        original_total = app_module._unread_notifications_total
+
+        def _racing_total(conn, company_id):
+            # Another worker backfills the row between our UPDATE and INSERT.
+            conn.execute(NotificationCounter.__table__.insert().values(
+                company_id=company_id, unread=5, updated_at=app_module.dom_now()))
+            return original_total(conn, company_id)
+
+        monkeypatch.setattr(app_module, '_unread_notifications_total', _racing_total)
+        notify('Carrera', company_id=cid)
+        db.session.commit()
+        monkeypatch.undo()
+        assert Notification.query.filter_by(message='Carrera').count() == 1
+        assert unread_notification_count(cid) == 6
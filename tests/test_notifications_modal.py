@@ -28,6 +28,7 @@ def test_notifications_modal_and_archive_flow(tmp_path):
         c.post('/login', data={'username': 'u_notif', 'password': 'pass'})
         with app.app_context():
             notify('Notificación de prueba')
+            db.session.commit()
             nid = Notification.query.order_by(Notification.id.desc()).first().id
 
         resp = c.get('/cotizaciones')
@@ -0,0 +1,92 @@
+import os
+import re
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from PIL import Image
+
+import weasy_pdf
+
+CLIENT = {'name': 'Cliente', 'identifier': '001'}
+
+
+def _items(count):
+    return [
+        {'code': f'P{n}', 'reference': '', 'product_name': f'Producto {n}', 'unit': 'Unidad',
+         'unit_price': 10.0, 'quantity': 1, 'discount': 0.0}
+        for n in range(count)
+    ]
+
+
+def test_company_layout_is_compiled_once_per_company(tmp_path, monkeypatch):
+    logo = tmp_path / 'logo.png'
+    Image.new('RGB', (40, 40), (30, 58, 138)).save(logo)
+    company = {'name': 'Layout SRL', 'address': 'Calle Larga 123, Sector Norte, Santiago', 'phone': '809', 'logo': str(logo)}
+    weasy_pdf._layout_cache.clear()
+    loads = []
+    original_load = weasy_pdf._load_logo
+    monkeypatch.setattr(weasy_pdf, '_load_logo', lambda value: loads.append(value) or original_load(value))
+
+    first = weasy_pdf.generate_pdf_bytes('Factura', company, CLIENT, _items(2), 20, 3.6, 23.6, doc_number=1)
+    second = weasy_pdf.generate_pdf_bytes('Factura', dict(company), CLIENT, _items(3), 30, 5.4, 35.4, doc_number=2)
+
+    assert first.startswith(b'%PDF') and second.startswith(b'%PDF')
+    assert len(loads) == 1
+    assert weasy_pdf.company_layout(company) is weasy_pdf.company_layout(dict(company))
+    assert weasy_pdf.company_layout({**company, 'name': 'Otra'}) is not weasy_pdf.company_layout(company)
+
+
+def test_multi_page_invoice_repeats_table_header_without_a_footer(monkeypatch):
+    captured = []
+    original_cell = weasy_pdf._cell
+
+    def tracked_cell(pdf, w, h=0, txt='', *args, **kwargs):
+        captured.append(str(txt))
+        return original_cell(pdf, w, h, txt, *args, **kwargs)
+
+    monkeypatch.setattr(weasy_pdf, '_cell', tracked_cell)
+    company = {'name': 'Paginas SRL', 'address': 'Dir', 'phone': '809'}
+    payload = weasy_pdf.generate_pdf_bytes('Factura', company, CLIENT, _items(120), 1200, 216, 1416, doc_number=7)
+
+    assert payload.startswith(b'%PDF')
+    pages = len(re.findall(rb'/Type /Page\b(?!s)', payload))
+    assert pages >= 3
+    assert not any('Pagina ' in t for t in captured)
+    assert captured.count('Codigo') == pages
+    assert captured.count('Factura No. 7') == pages
+
+
+def test_address_wrap_keeps_line_breaks_and_splits_long_tokens():
+    pdf = weasy_pdf.FPDF()
+    pdf.add_page()
+    pdf.set_font('Helvetica', '', 10)
+    width = 40
+
+    lines = weasy_pdf._wrap_text(pdf, 'Calle 1\nSector Norte', width)
+    assert lines == ['Calle 1', 'Sector Norte']
+
+    token = 'https://tienda.example.com/' + 'x' * 60
+    lines = weasy_pdf._wrap_text(pdf, f'Web {token} fin', width)
+    assert len(lines) > 2
+    assert ''.join(lines).replace(' ', '') == f'Web{token}fin'
+    assert all(pdf.get_string_width(line) <= width for line in lines)
+
+
+def test_shared_layout_renders_concurrently(tmp_path):
+    from concurrent.futures import ThreadPoolExecutor
+
+    logo = tmp_path / 'logo.png'
+    Image.new('RGB', (40, 40), (30, 58, 138)).save(logo)
+    company = {'name': 'Hilos SRL', 'address': 'Calle 5\nLos Prados', 'phone': '809', 'logo': str(logo)}
+    weasy_pdf._layout_cache.clear()
+
+    def render(n):
+        return weasy_pdf.generate_pdf_bytes('Factura', dict(company), CLIENT, _items(3), 30, 5.4, 35.4, doc_number=n)
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        payloads = list(pool.map(render, range(32)))
+
+    assert all(p.startswith(b'%PDF') and b'/Subtype /Image' in p for p in payloads)
+    assert len(weasy_pdf._layout_cache) == 1
+    assert isinstance(weasy_pdf.company_layout(company).logo, bytes)
@@ -0,0 +1,182 @@
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+import product_search
+from app import app, db, invalidate_catalog_cache
+from models import CompanyInfo, User, Product
+
+
+def _row(pid, code, name, reference=''):
+    return {'id': pid, 'code': code, 'name': name, 'reference': reference, 'unit': 'u', 'price': 1.0}
+
+
+def test_index_folds_accents_and_ranks_code_matches_first():
+    index = product_search.ProductSearchIndex([
+        _row(1, 'CAF-01', 'Café molido', 'CAF001'),
+        _row(2, 'X9', 'Azúcar de caña', 'AZU001'),
+        _row(3, 'CAFE', 'Taza para café', 'TAZ001'),
+        _row(4, 'Z1', 'Cafetera eléctrica', 'CAF002'),
+    ])
+    assert [r['id'] for r in index.search('cafe')] == [3, 1, 4]
+    assert [r['id'] for r in index.search('CAÑA')] == [2]
+    assert [r['id'] for r in index.search('caf mol')] == [1]
+    assert [r['id'] for r in index.search('caf002')] == [4]
+    assert index.search('olid') == []
+    assert len(index.search('caf', limit=2)) == 2
+
+
+def test_large_catalog_search_only_scans_matching_tokens(monkeypatch):
+    words = ['arroz', 'frijol', 'aceite', 'azucar', 'harina', 'leche', 'queso', 'jamon', 'pan', 'cafe']
+    index = product_search.ProductSearchIndex(
+        _row(n, f'P{n:06d}', f'{words[n % 10]} {words[(n // 10) % 10]} marca {n % 97}') for n in range(20000)
+    )
+    scanned = []
+    matching = product_search.ProductSearchIndex._matching
+
+    def counting(self, term):
+        ids = matching(self, term)
+        scanned.extend(token for token in self._tokens if token.startswith(term))
+        return ids
+
+    monkeypatch.setattr(product_search.ProductSearchIndex, '_matching', counting)
+    for query, expected in (('arr', 1), ('leche queso', 2), ('P0123', 100), ('marca 5', 12)):
+        scanned.clear()
+        assert index.search(query)
+        # A bisect range per term, never a pass over the 20k-token vocabulary.
+        assert len(scanned) == expected, query
+
+
+def test_registry_evicts_least_recently_searched_company():
+    loaded = []
+
+    def loader(company_id):
+        loaded.append(company_id)
+        return [_row(company_id, f'C{company_id}', f'Producto {company_id}')]
+
+    registry = product_search.ProductSearchRegistry(loader, ttl=0, max_companies=2)
+    registry.get(1)
+    registry.get(2)
+    registry.get(1)
+    registry.get(3)
+    assert list(registry._indexes) == [1, 3]
+    registry.get(1)
+    assert loaded == [1, 2, 3]
+    registry.get(2)
+    assert loaded == [1, 2, 3, 2]
+    assert list(registry._indexes) == [1, 2]
+
+
+def test_registry_rebuild_does_not_block_other_companies():
+    started, release = threading.Event(), threading.Event()
+
+    def loader(company_id):
+        if company_id == 1:
+            started.set()
+            release.wait(5)
+        return [_row(company_id, f'C{company_id}', 'Producto')]
+
+    registry = product_search.ProductSearchRegistry(loader, ttl=0)
+    slow = threading.Thread(target=registry.get, args=(1,))
+    slow.start()
+    assert started.wait(5)
+    try:
+        assert [r['id'] for r in registry.get(2).search('producto')] == [2]
+    finally:
+        release.set()
+        slow.join(5)
+    assert [r['id'] for r in registry.get(1).search('producto')] == [1]
+
+
+@pytest.fixture
+def client(tmp_path):
+    app.config.from_object('config.TestingConfig')
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{tmp_path / "search.sqlite"}'
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        own = CompanyInfo(name='Own', street='', sector='', province='', phone='', rnc='')
+        other = CompanyInfo(name='Other', street='', sector='', province='', phone='', rnc='')
+        db.session.add_all([own, other])
+        db.session.flush()
+        user = User(username='search', first_name='S', last_name='S', role='company', company_id=own.id)
+        user.set_password('pass')
+        db.session.add_all([
+            user,
+            Product(code='M1', name='Martillo', unit='u', price=5, company_id=own.id),
+            Product(code='M2', name='Martillo ajeno', unit='u', price=5, company_id=other.id),
+        ])
+        db.session.commit()
+    invalidate_catalog_cache()
+    with app.test_client() as c:
+        c.post('/login', data={'username': 'search', 'password': 'pass'})
+        yield c
+
+
+def test_search_endpoint_is_tenant_scoped_and_refreshed_on_edit(client):
+    data = client.get('/api/products/search?q=mart').get_json()
+    assert [p['code'] for p in data['products']] == ['M1']
+
+    client.post('/productos/edit/1', data={
+        'code': 'M1', 'name': 'Mazo', 'unit': 'u', 'price': '5', 'category': '', 'reference': 'MAZ001',
+    })
+    assert client.get('/api/products/search?q=mart').get_json()['products'] == []
+    assert [p['name'] for p in client.get('/api/products/search?q=maz').get_json()['products']] == ['Mazo']
+
+
+def test_list_filters_are_not_capped_by_autocomplete_limit(client):
+    with app.app_context():
+        db.session.add_all([
+            Product(code=f'T{n:03d}', name=f'Tornillo {n:03d}', unit='u', price=1, company_id=1) for n in range(60)
+        ])
+        db.session.commit()
+    invalidate_catalog_cache()
+    assert len(client.get('/api/products/search?q=torn&limit=100').get_json()['products']) == 50
+    assert 'T059' in client.get('/productos?q=torn&page=2').get_data(as_text=True)
+    assert 'Tornillo 059' in client.get('/inventario/ajustar?product_q=torn').get_data(as_text=True)
+
+
+def test_catalog_is_columnar_and_revalidates_by_version(client):
+    from io import BytesIO
+    resp = client.get('/api/catalog')
+    assert resp.status_code == 200
+    data = resp.get_json()
+    assert data['products']['code'] == ['M1']
+    assert set(data['products']) == {'id', 'code', 'name', 'unit', 'price', 'has_itbis', 'category'}
+    etag = resp.headers['ETag']
+    assert not etag.startswith('W/')
+    assert 'no-cache' in resp.headers['Cache-Control']
+
+    cached = client.get('/api/catalog', headers={'If-None-Match': etag})
+    assert cached.status_code == 304
+    assert cached.headers['ETag'] == etag
+
+    tags = {etag}
+
+    def assert_catalog_changed():
+        resp = client.get('/api/catalog', headers={'If-None-Match': etag})
+        assert resp.status_code == 200
+        assert resp.headers['ETag'] not in tags
+        tags.add(resp.headers['ETag'])
+        return resp.headers['ETag']
+
+    edited = {'code': 'M1', 'name': 'Mazo', 'unit': 'u', 'price': '6', 'category': ''}
+    assert client.post('/productos/edit/1', data=edited).status_code == 302
+    etag = assert_catalog_changed()
+    created = {'code': 'N1', 'name': 'Nuevo', 'unit': 'u', 'price': '2', 'category': 'Otros'}
+    assert client.post('/productos', data=created).status_code == 302
+    etag = assert_catalog_changed()
+    assert client.get('/productos/delete/1').status_code == 302
+    etag = assert_catalog_changed()
+    assert client.get('/api/catalog').get_json()['products']['code'] == ['N1']
+    with client.session_transaction() as sess:
+        sess['role'] = 'manager'
+    unchanged = client.get('/api/catalog').headers['ETag']
+    client.post('/productos/importar', data={'file': (BytesIO(b'code,name,unit,price\nN1,Nuevo,u,2\n'), 'p.csv')})
+    assert client.get('/api/catalog').headers['ETag'] == unchanged
+    client.post('/productos/importar', data={'file': (BytesIO(b'code,name,unit,price\nN2,Otro,u,3\n'), 'p.csv')})
+    assert client.get('/api/catalog').headers['ETag'] != unchanged
@@ -0,0 +1,90 @@
+import os
+import random
+import sys
+from datetime import timedelta
+
+import pytest
+from click.testing import CliRunner
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+import reorder
+from app import app, db
+from models import CompanyInfo, User, Product, Warehouse, ProductStock, InventoryMovement, dom_now
+
+
+def test_reorder_points_follow_demand_and_variability():
+    rows = [(1, 10, 4), (1, 10, 4), (1, 11, 1), (1, 11, 1), (1, 11, 1), (1, 11, 1), (2, 10, 3)]
+    points = reorder.reorder_points(rows, days=4, lead_time=4, z=1, use_numpy=False)
+    # (1, 10): mean 2/day, sample std 2.31 -> 8 + 2.31 * 2; (1, 11): steady 1/day -> exactly 4.
+    assert points == {(1, 10): 13, (1, 11): 4, (2, 10): 6}
+    assert reorder.reorder_points([], days=4, lead_time=4, z=1) == {}
+
+
+def test_numpy_and_python_engines_agree():
+    pytest.importorskip('numpy')
+    rng = random.Random(7)
+    rows = [(rng.randint(1, 3), rng.randint(1, 500), rng.randint(1, 40)) for _ in range(5000)]
+    assert reorder.reorder_points(rows, days=90, lead_time=5, z=1.65, use_numpy=True) == \
+        reorder.reorder_points(rows, days=90, lead_time=5, z=1.65, use_numpy=False)
+
+
+@pytest.fixture
+def ids(tmp_path):
+    app.config.from_object('config.TestingConfig')
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{tmp_path / "reorder.sqlite"}'
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        comp = CompanyInfo(name='Ro', street='', sector='', province='', phone='', rnc='')
+        db.session.add(comp)
+        db.session.flush()
+        user = User(username='ro', first_name='R', last_name='O', role='manager', company_id=comp.id)
+        user.set_password('pass')
+        sold = Product(code='R1', name='Vendido', unit='u', price=1, stock=10, company_id=comp.id)
+        moved = Product(code='R2', name='Trasladado', unit='u', price=1, stock=10, company_id=comp.id)
+        wh = Warehouse(name='W', company_id=comp.id)
+        db.session.add_all([user, sold, moved, wh])
+        db.session.flush()
+        db.session.add_all([
+            ProductStock(product_id=sold.id, warehouse_id=wh.id, stock=3, min_stock=1, company_id=comp.id),
+            ProductStock(product_id=moved.id, warehouse_id=wh.id, stock=10, min_stock=2, company_id=comp.id,
+                         suggested_min_stock=99),
+        ])
+        now = dom_now()
+        for day in range(10):
+            db.session.add(InventoryMovement(
+                product_id=sold.id, quantity=2, movement_type='salida', warehouse_id=wh.id, company_id=comp.id,
+                executed_by=user.id, reference_type='Order', timestamp=now - timedelta(days=day),
+            ))
+        db.session.add(InventoryMovement(
+            product_id=moved.id, quantity=50, movement_type='salida', warehouse_id=wh.id, company_id=comp.id,
+            executed_by=user.id, reference_type='transfer', timestamp=now,
+        ))
+        db.session.commit()
+        return {'company': comp.id, 'sold': sold.id, 'moved': moved.id, 'wh': wh.id}
+
+
+def _stock(product_id):
+    return ProductStock.query.filter_by(product_id=product_id).first()
+
+
+def test_suggestions_are_computed_and_applied_in_bulk(ids):
+    result = CliRunner().invoke(app.cli, ['reorder_suggest', '--days', '10', '--lead-time', '7'])
+    assert result.exit_code == 0, result.output
+    assert 'Sugerencias calculadas: 1 filas' in result.output
+    assert ('numpy no está instalado' in result.output) == (reorder.np is None)
+    with app.app_context():
+        assert _stock(ids['sold']).suggested_min_stock == 14  # 2/day x 7 days, no variability
+        assert _stock(ids['moved']).suggested_min_stock is None  # transfers are not demand
+
+    with app.test_client() as c:
+        c.post('/login', data={'username': 'ro', 'password': 'pass'})
+        page = c.get(f"/inventario?warehouse_id={ids['wh']}").get_data(as_text=True)
+        assert 'Sugerido: 14' in page and 'Aplicar sugeridos' in page
+        c.post('/inventario/minimos/aplicar', data={'warehouse_id': ids['wh']})
+    with app.app_context():
+        row = _stock(ids['sold'])
+        assert (row.min_stock, row.suggested_min_stock) == (14, None)
+        assert row.low_stock_alert_at is not None
+        assert _stock(ids['moved']).min_stock == 2
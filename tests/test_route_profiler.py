@@ -0,0 +1,68 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+import app as app_module
+from app import app, db
+from models import CompanyInfo, User
+
+
+def _setup(tmp_path, monkeypatch, sample_rate=0.0):
+    app.config.from_object('config.TestingConfig')
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'profiles.sqlite'}"
+    app.config['ROUTE_PROFILING_DIR'] = str(tmp_path / 'profiles')
+    monkeypatch.setattr(app_module, 'ENABLE_ROUTE_PROFILING', True)
+    monkeypatch.setattr(app_module, 'ROUTE_PROFILING_SAMPLE_RATE', sample_rate)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        company = CompanyInfo(name='Perf SRL', street='', sector='', province='', phone='', rnc='')
+        db.session.add(company)
+        db.session.flush()
+        admin = User(username='perf_admin', first_name='P', last_name='A', role='admin', company_id=company.id)
+        admin.set_password('pass')
+        db.session.add(admin)
+        db.session.commit()
+
+
+def _login(c):
+    c.post('/login', data={'username': 'perf_admin', 'password': 'pass'})
+
+
+def test_signed_header_profiles_request_and_admin_page_lists_hot_functions(tmp_path, monkeypatch):
+    _setup(tmp_path, monkeypatch)
+    with app.test_client() as c:
+        _login(c)
+        assert not (tmp_path / 'profiles').exists()
+        with app.test_request_context():
+            token = app_module.generate_route_profile_token(1)
+
+        c.get('/clientes', headers={app_module.ROUTE_PROFILE_HEADER: token})
+        c.get('/clientes', headers={app_module.ROUTE_PROFILE_HEADER: 'forged'})
+
+        assert len(list((tmp_path / 'profiles' / 'clients').glob('*.prof'))) == 1
+        page = c.get('/cpaneltx/perfiles?ruta=clients')
+        assert page.status_code == 200
+        html = page.get_data(as_text=True)
+        assert '1 muestras' in html
+        assert '.py:' in html
+
+
+def test_sampled_profiles_rotate_per_endpoint(tmp_path, monkeypatch):
+    _setup(tmp_path, monkeypatch, sample_rate=1.0)
+    monkeypatch.setattr(app_module, 'ROUTE_PROFILING_MAX_FILES', 2)
+    with app.test_client() as c:
+        _login(c)
+        for _ in range(4):
+            c.get('/clientes')
+
+    assert len(list((tmp_path / 'profiles' / 'clients').glob('*.prof'))) == 2
+
+
+def test_profiles_page_hidden_when_profiling_disabled(tmp_path, monkeypatch):
+    _setup(tmp_path, monkeypatch)
+    monkeypatch.setattr(app_module, 'ENABLE_ROUTE_PROFILING', False)
+    with app.test_client() as c:
+        _login(c)
+        assert c.get('/cpaneltx/perfiles').status_code == 404
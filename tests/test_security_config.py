@@ -1,4 +1,5 @@
 import os
+import smtplib
 import sys
 
 import pytest
@@ -47,7 +48,7 @@ def test_send_email_retries_and_metrics(monkeypatch):
     monkeypatch.setattr(app_module, 'MAIL_DEFAULT_SENDER', 'no-reply@example.com')
     monkeypatch.setattr(app_module, 'MAIL_MAX_RETRIES', 3)
     monkeypatch.setattr(app_module, 'MAIL_RETRY_DELAY_SEC', 0)
-    monkeypatch.setattr(app_module.smtplib, 'SMTP', FakeSMTP)
+    monkeypatch.setattr(smtplib, 'SMTP', FakeSMTP)
 
     for key in app_module.EMAIL_METRICS:
         app_module.EMAIL_METRICS[key] = 0
@@ -70,7 +71,7 @@ def test_send_email_skips_when_mail_disabled(monkeypatch):
     monkeypatch.setattr(app_module, 'MAIL_ENABLED', False)
     monkeypatch.setattr(app_module, 'MAIL_SERVER', 'smtp.example.com')
     monkeypatch.setattr(app_module, 'MAIL_DEFAULT_SENDER', 'no-reply@example.com')
-    monkeypatch.setattr(app_module.smtplib, 'SMTP', FakeSMTP)
+    monkeypatch.setattr(smtplib, 'SMTP', FakeSMTP)
 
     for key in app_module.EMAIL_METRICS:
         app_module.EMAIL_METRICS[key] = 0
@@ -114,8 +115,8 @@ def test_deliver_email_uses_smtp_ssl_without_starttls(monkeypatch):
     monkeypatch.setattr(app_module, 'MAIL_PASSWORD', 'secret')
     monkeypatch.setattr(app_module, 'MAIL_USE_SSL', True)
     monkeypatch.setattr(app_module, 'MAIL_USE_TLS', False)
-    monkeypatch.setattr(app_module.smtplib, 'SMTP_SSL', FakeSMTPSSL)
-    monkeypatch.setattr(app_module.smtplib, 'SMTP', FakeSMTP)
+    monkeypatch.setattr(smtplib, 'SMTP_SSL', FakeSMTPSSL)
+    monkeypatch.setattr(smtplib, 'SMTP', FakeSMTP)
 
     app_module._deliver_email('to@example.com', 'subject', '<b>ok</b>')
 
@@ -159,8 +160,8 @@ def test_deliver_email_uses_starttls_when_enabled(monkeypatch):
     monkeypatch.setattr(app_module, 'MAIL_PASSWORD', 'secret')
     monkeypatch.setattr(app_module, 'MAIL_USE_SSL', False)
     monkeypatch.setattr(app_module, 'MAIL_USE_TLS', True)
-    monkeypatch.setattr(app_module.smtplib, 'SMTP_SSL', FakeSMTPSSL)
-    monkeypatch.setattr(app_module.smtplib, 'SMTP', FakeSMTP)
+    monkeypatch.setattr(smtplib, 'SMTP_SSL', FakeSMTPSSL)
+    monkeypatch.setattr(smtplib, 'SMTP', FakeSMTP)
 
     app_module._deliver_email('to@example.com', 'subject', '<b>ok</b>')
 
@@ -354,3 +355,87 @@ def test_password_columns_are_wide_enough_for_werkzeug_hashes():
 
     assert User.password.property.columns[0].type.length >= 255
     assert AccountRequest.password.property.columns[0].type.length >= 255
+
+
+class _PooledFakeSMTP:
+    instances = []
+
+    def __init__(self, *args, **kwargs):
+        self.logins = 0
+        self.sent = []
+        self.closed = False
+        self.fail_next_with = None
+        _PooledFakeSMTP.instances.append(self)
+
+    def starttls(self):
+        return None
+
+    def login(self, *_):
+        self.logins += 1
+
+    def noop(self):
+        return (250, b'OK')
+
+    def sendmail(self, _sender, recipients, _msg):
+        if self.fail_next_with is not None:
+            exc, self.fail_next_with = self.fail_next_with, None
+            raise exc
+        self.sent.extend(recipients)
+
+    def quit(self):
+        self.closed = True
+
+
+def _configure_pooled_smtp(monkeypatch, max_per_connection=50):
+    _PooledFakeSMTP.instances = []
+    monkeypatch.setattr(app_module, 'MAIL_ENABLED', True)
+    monkeypatch.setattr(app_module, 'MAIL_SERVER', 'smtp.example.com')
+    monkeypatch.setattr(app_module, 'MAIL_DEFAULT_SENDER', 'no-reply@example.com')
+    monkeypatch.setattr(app_module, 'MAIL_USERNAME', 'user@example.com')
+    monkeypatch.setattr(app_module, 'MAIL_PASSWORD', 'secret')
+    monkeypatch.setattr(app_module, 'MAIL_USE_SSL', False)
+    monkeypatch.setattr(app_module, 'MAIL_RETRY_DELAY_SEC', 0)
+    monkeypatch.setattr(app_module, 'MAIL_MAX_MESSAGES_PER_CONNECTION', max_per_connection)
+    monkeypatch.setattr(smtplib, 'SMTP', _PooledFakeSMTP)
+
+
+def test_worker_connection_is_reused_across_messages(monkeypatch):
+    _configure_pooled_smtp(monkeypatch, max_per_connection=2)
+    connection = app_module._SMTPConnection()
+
+    for n in range(5):
+        app_module._deliver_email(f'to{n}@example.com', 'subject', '<b>ok</b>', connection=connection)
+    connection.close()
+
+    assert [len(s.sent) for s in _PooledFakeSMTP.instances] == [2, 2, 1]
+    assert all(s.logins == 1 and s.closed for s in _PooledFakeSMTP.instances)
+
+
+def test_worker_connection_reconnects_when_server_disconnects(monkeypatch):
+    _configure_pooled_smtp(monkeypatch)
+    connection = app_module._SMTPConnection()
+    app_module._deliver_email('first@example.com', 'subject', '<b>ok</b>', connection=connection)
+    _PooledFakeSMTP.instances[0].fail_next_with = smtplib.SMTPServerDisconnected('gone')
+
+    for key in app_module.EMAIL_METRICS:
+        app_module.EMAIL_METRICS[key] = 0
+    app_module._deliver_email('second@example.com', 'subject', '<b>ok</b>', connection=connection, max_retries=1)
+
+    assert len(_PooledFakeSMTP.instances) == 2
+    assert _PooledFakeSMTP.instances[1].sent == ['second@example.com']
+    assert app_module.EMAIL_METRICS['sent'] == 1
+    assert app_module.EMAIL_METRICS['reconnects'] == 1
+    assert app_module.EMAIL_METRICS['failed'] == 0
+
+
+def test_worker_connection_closes_after_idle_timeout(monkeypatch):
+    _configure_pooled_smtp(monkeypatch)
+    monkeypatch.setattr(app_module, 'MAIL_CONNECTION_IDLE_SEC', 0)
+    connection = app_module._SMTPConnection()
+    app_module._deliver_email('to@example.com', 'subject', '<b>ok</b>', connection=connection)
+    assert connection.is_open
+
+    connection.close_if_idle()
+
+    assert not connection.is_open
+    assert _PooledFakeSMTP.instances[0].closed
@@ -49,6 +49,7 @@ def test_manager_can_update_ncf_and_log(client):
         log = NcfLog.query.filter_by(company_id=company.id).first()
         assert log is not None
         assert log.new_final == old_final + 5
+        assert db.session.get(CompanyInfo, company.id).ncf_epoch == 1
 
 
 def test_ncf_cannot_decrease(client):
@@ -0,0 +1,79 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+import app as app_module
+from app import app, db, sql_fingerprint
+from models import CompanyInfo, SqlQueryStat, User
+
+
+def test_fingerprint_strips_literals_and_collapses_lists():
+    a = sql_fingerprint("SELECT * FROM invoice WHERE company_id = 3 AND ncf = 'B0100000001' AND id IN (1, 2, 3)")
+    b = sql_fingerprint("SELECT *  FROM invoice WHERE company_id = 7 AND ncf = 'B02' AND id IN (9)")
+    c = sql_fingerprint("SELECT * FROM invoice WHERE company_id = %s AND ncf = %s AND id IN (%s, %s)")
+    assert a == b == c
+    assert a[1] == 'SELECT * FROM invoice WHERE company_id = ? AND ncf = ? AND id IN (?...)'
+
+    insert = sql_fingerprint('INSERT INTO t (a, b) VALUES (?, ?), (?, ?), (?, ?)')[1]
+    assert insert == 'INSERT INTO t (a, b) VALUES (?, ?), ...'
+    assert sql_fingerprint('SELECT t1.id FROM t1')[1] == 'SELECT t1.id FROM t1'
+
+
+def test_stats_are_aggregated_flushed_and_listed(tmp_path, monkeypatch):
+    app.config.from_object('config.TestingConfig')
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'sql.sqlite'}"
+    monkeypatch.setattr(app_module, 'SQL_STATS_FLUSH_SEC', 3600)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        company = CompanyInfo(name='SQL SRL', street='', sector='', province='', phone='', rnc='')
+        db.session.add(company)
+        db.session.flush()
+        admin = User(username='sql_admin', first_name='S', last_name='A', role='admin', company_id=company.id)
+        admin.set_password('pass')
+        db.session.add(admin)
+        db.session.commit()
+        app_module.flush_sql_stats(force=True)
+        SqlQueryStat.query.delete()
+        db.session.commit()
+
+    app_module._sql_stats.clear()
+    for duration, rid in ((10.0, 'r1'), (30.0, 'r2'), (20.0, 'r3')):
+        app_module._record_sql_stat('SELECT * FROM product WHERE id = 5', duration, rid)
+    app_module._record_sql_stat('SELECT * FROM product WHERE id = 6', 5.0, 'r4')
+
+    with app.app_context():
+        assert app_module.flush_sql_stats(force=True) == 1
+        row = SqlQueryStat.query.one()
+        assert row.calls == 4 and row.total_ms == 65.0
+        assert row.max_ms == 30.0 and row.p95_ms == 30.0
+        assert row.sample_request_id == 'r2'
+
+    with app.test_client() as c:
+        c.post('/login', data={'username': 'sql_admin', 'password': 'pass'})
+        resp = c.get('/cpaneltx/sql?horas=24')
+        html = resp.get_data(as_text=True)
+    assert resp.status_code == 200
+    assert 'SELECT * FROM product WHERE id = ?' in html
+    assert 'r2' in html
+
+
+def test_requests_never_write_sql_stats(tmp_path, monkeypatch):
+    app.config.from_object('config.TestingConfig')
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'sql_req.sqlite'}"
+    monkeypatch.setattr(app_module, 'SQL_STATS_FLUSH_SEC', 0)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+    app_module._sql_stats.clear()
+    app_module._record_sql_stat('SELECT * FROM product WHERE id = 5', 10.0, 'r1')
+
+    with app.test_client() as c:
+        c.get('/login')
+
+    assert app_module._sql_stats
+    with app.app_context():
+        assert SqlQueryStat.query.count() == 0
+        assert app_module.flush_sql_stats() == 1
+    assert app_module.SQL_FINGERPRINT_MIN_MS > 0
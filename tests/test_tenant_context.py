@@ -0,0 +1,134 @@
+import os
+import sys
+
+from sqlalchemy import event
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+import app as app_module
+from app import app, db
+from models import CompanyInfo, User
+
+
+def _setup(tmp_path):
+    app.config.from_object('config.TestingConfig')
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{tmp_path / "tenant.sqlite"}'
+    app_module.invalidate_tenant_cache()
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        company = CompanyInfo(name='Tenant SRL', street='Calle 1', sector='Centro', province='Santiago', phone='809', rnc='101')
+        db.session.add(company)
+        db.session.flush()
+        user = User(username='tenant', first_name='T', last_name='U', role='manager', company_id=company.id)
+        user.set_password('pass')
+        db.session.add(user)
+        db.session.commit()
+        return company.id
+
+
+def _count_company_selects(statements):
+    def _listener(conn, cursor, statement, *args):
+        if 'FROM company_info' in statement:
+            statements.append(statement)
+    return _listener
+
+
+def test_tenant_context_is_loaded_once_per_request(tmp_path):
+    cid = _setup(tmp_path)
+    selects = []
+    with app.test_request_context('/'):
+        app_module.session['company_id'] = cid
+        listener = _count_company_selects(selects)
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        try:
+            tenant = app_module.current_tenant()
+            assert app_module.current_tenant() is tenant
+            info = app_module.get_company_info()
+            info['name'] = 'mutado'
+            assert app_module.get_company_info()['name'] == 'Tenant SRL'
+            path = app_module._archived_pdf_path('factura', 'abc', company_id=cid)
+            assert app_module.request_company().id == cid
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', listener)
+    assert len(selects) == 1
+    assert tenant.archive_slug == 'tenant-srl'
+    assert tenant.archive_token == app_module._company_private_token(cid, 'Tenant SRL')
+    assert path.parts[-4:-2] == (tenant.archive_slug, tenant.archive_token)
+
+
+def test_tenant_cache_spans_requests_until_settings_change(tmp_path, monkeypatch):
+    cid = _setup(tmp_path)
+    monkeypatch.setattr(app_module, 'TENANT_CACHE_TTL_SEC', 60.0)
+    selects = []
+    with app.test_client() as c:
+        c.post('/login', data={'username': 'tenant', 'password': 'pass'})
+        with app.app_context():
+            listener = _count_company_selects(selects)
+            event.listen(db.engine, 'before_cursor_execute', listener)
+        try:
+            with app.test_request_context('/'):
+                app_module.session['company_id'] = cid
+                assert app_module.current_tenant().name == 'Tenant SRL'
+            with app.test_request_context('/'):
+                app_module.session['company_id'] = cid
+                assert app_module.current_tenant().name == 'Tenant SRL'
+            assert len(selects) == 1
+
+            with app.app_context():
+                company = db.session.get(CompanyInfo, cid)
+                form = {'name': 'Nuevo Nombre', 'ncf_final': company.ncf_final, 'ncf_fiscal': company.ncf_fiscal}
+            resp = c.post('/ajustes/empresa', data=form)
+            assert resp.status_code == 302
+            with app.test_request_context('/'):
+                app_module.session['company_id'] = cid
+                assert app_module.current_tenant().name == 'Nuevo Nombre'
+        finally:
+            with app.app_context():
+                event.remove(db.engine, 'before_cursor_execute', listener)
+    app_module.invalidate_tenant_cache()
+
+
+def test_document_lists_use_cached_tenant_name(tmp_path, monkeypatch):
+    from datetime import timedelta
+    from models import Client, Quotation, Order, Invoice, dom_now
+
+    cid = _setup(tmp_path)
+    with app.app_context():
+        client = Client(name='Cli', company_id=cid)
+        db.session.add(client)
+        db.session.flush()
+        db.session.add(Quotation(client_id=client.id, valid_until=dom_now() + timedelta(days=30),
+                                 subtotal=1, itbis=0, total=1, company_id=cid))
+        order = Order(client_id=client.id, subtotal=1, itbis=0, total=1, company_id=cid)
+        db.session.add(order)
+        db.session.flush()
+        db.session.add(Invoice(client_id=client.id, order_id=order.id, subtotal=1, itbis=0, total=1,
+                               ncf='B0200000001', date=dom_now(), company_id=cid))
+        db.session.commit()
+    monkeypatch.setattr(app_module, 'TENANT_CACHE_TTL_SEC', 60.0)
+    names = []
+    archived_pdf = tmp_path / 'factura.pdf'
+    archived_pdf.write_bytes(b'%PDF-1.4')
+
+    def _resolve(doc_type, doc_id, *, company_name=None, company_id=None, **kwargs):
+        names.append(company_name)
+        return tmp_path / 'no-existe.pdf'
+
+    def _archive_file(invoice, *, company_name, company_id):
+        names.append(company_name)
+        return archived_pdf
+
+    monkeypatch.setattr(app_module, '_resolve_archived_pdf_path', _resolve)
+    monkeypatch.setattr(app_module, '_invoice_archive_file', _archive_file)
+    try:
+        with app.test_client() as c:
+            c.post('/login', data={'username': 'tenant', 'password': 'pass'})
+            c.get('/notificaciones')  # warms the tenant cache in an earlier request
+            for url in ('/cotizaciones', '/pedidos', '/facturas'):
+                assert c.get(url).status_code == 200
+            assert c.get('/facturas/zip').get_data()
+    finally:
+        app_module.invalidate_tenant_cache()
+    assert len(names) >= 4
+    assert set(names) == {'Tenant SRL'}
@@ -6,8 +6,11 @@ but renders directly with fpdf2 to avoid native WeasyPrint dependencies.
 from __future__ import annotations
 
 from datetime import datetime
+from functools import lru_cache
 import inspect
+import io
 import os
+import threading
 import unicodedata
 from zoneinfo import ZoneInfo
 from pathlib import Path
@@ -56,32 +59,62 @@ def _fmt_money(value: float) -> str:
     return f"RD$ {value:,.2f}"
 
 
-def _safe_text(value) -> str:
-    """Return latin-1-safe text for built-in fonts (keeps Spanish accents)."""
-    text = '' if value is None else str(value)
+@lru_cache(maxsize=8192)
+def _normalize_text(text: str) -> str:
     normalized = unicodedata.normalize('NFKD', text)
     cleaned = normalized.encode('ascii', 'ignore').decode('ascii')
     return cleaned.replace('?', '')
 
 
+def _safe_text(value) -> str:
+    """Return latin-1-safe text for built-in fonts (keeps Spanish accents)."""
+    text = '' if value is None else str(value)
+    if not text:
+        return ''
+    return _normalize_text(text)
+
 
+_WIDTH_CACHE_MAX = 16384
+_width_cache: dict[tuple, float] = {}
 
 
+def _string_width(pdf: FPDF, text: str) -> float:
+    """Memoized ``get_string_width`` keyed by the active font metrics."""
+    key = (
+        getattr(pdf, 'font_family', ''),
+        getattr(pdf, 'font_style', ''),
+        getattr(pdf, 'font_size_pt', 0),
+        getattr(pdf, 'char_spacing', 0),
+        getattr(pdf, 'font_stretching', 100),
+        getattr(pdf, 'k', 1),
+        text,
+    )
+    width = _width_cache.get(key)
+    if width is None:
+        if len(_width_cache) >= _WIDTH_CACHE_MAX:
+            _width_cache.clear()
+        width = pdf.get_string_width(text)
+        _width_cache[key] = width
+    return width
 
 
 def _fit_cell_text(pdf: FPDF, value, max_width: float, ellipsis: str = '...') -> str:
     text = _safe_text(value)
     if not text:
         return ''
-    get_width = getattr(pdf, 'get_string_width', None)
-    if not callable(get_width):
+    if not callable(getattr(pdf, 'get_string_width', None)):
         return text
-    if get_width(text) <= max_width:
+    if _string_width(pdf, text) <= max_width:
         return text
-    trimmed = text
-    while trimmed and get_width(trimmed + ellipsis) > max_width:
-        trimmed = trimmed[:-1]
-    return (trimmed + ellipsis) if trimmed else ''
+    # Largest prefix that still fits with the ellipsis; widths grow monotonically with length.
+    low, high = 0, len(text) - 1
+    while low < high:
+        mid = (low + high + 1) // 2
+        if _string_width(pdf, text[:mid] + ellipsis) <= max_width:
+            low = mid
+        else:
+            high = mid - 1
+    return (text[:low] + ellipsis) if low else ''
 
 def _clean_optional(value) -> str:
     if value is None:
@@ -132,38 +165,188 @@ def _client_to_dict(client) -> dict:
     }
 
 
+def _load_logo(logo) -> bytes | None:
+    """Read the company logo once; each render decodes its own copy so nothing mutable is shared."""
+    if not logo:
+        return None
+    try:
+        return Path(str(logo)).read_bytes()
+    except OSError:
+        return None
+
+
+class _CompanyLayout:
+    """Static company header pieces compiled once per company and reused by every document.
+
+    Instances are shared across request threads, so they only hold immutable values plus the
+    wrapped-address cache, which is written under ``_layout_lock``.
+    """
+
+    def __init__(self, company: dict):
+        self.name = _safe_text(company.get('name', 'Tiendix'))
+        self.address = _safe_text(company['address']) if company.get('address') else ''
+        self.website = _safe_text(company['website']) if company.get('website') else ''
+        self.phone = _safe_text(f"Tel: {company['phone']}") if company.get('phone') else ''
+        self.logo = _load_logo(company.get('logo'))
+        self._address_lines: dict[tuple, tuple[str, ...]] = {}
+
+    def address_lines(self, pdf: FPDF, max_width: float) -> tuple[str, ...]:
+        """Word-wrap the address for ``max_width`` once and reuse the split lines."""
+        key = (
+            getattr(pdf, 'font_family', ''),
+            getattr(pdf, 'font_style', ''),
+            getattr(pdf, 'font_size_pt', 0),
+            round(max_width, 2),
+        )
+        lines = self._address_lines.get(key)
+        if lines is None:
+            lines = tuple(_wrap_text(pdf, self.address, max_width))
+            with _layout_lock:
+                lines = self._address_lines.setdefault(key, lines)
+        return lines
+
+
+def _break_word(pdf: FPDF, word: str, max_width: float) -> list[str]:
+    """Split a single token wider than ``max_width`` into chunks that fit."""
+    chunks: list[str] = []
+    current = ''
+    for char in word:
+        if current and _string_width(pdf, current + char) > max_width:
+            chunks.append(current)
+            current = char
+        else:
+            current += char
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _wrap_text(pdf: FPDF, text: str, max_width: float) -> list[str]:
+    """Wrap ``text`` to ``max_width``, keeping explicit line breaks and hard-breaking long tokens."""
+    if not text:
+        return []
+    if not callable(getattr(pdf, 'get_string_width', None)):
+        return text.splitlines()
+    lines: list[str] = []
+    for paragraph in text.splitlines():
+        current = ''
+        for word in paragraph.split():
+            candidate = f"{current} {word}" if current else word
+            if _string_width(pdf, candidate) <= max_width:
+                current = candidate
+                continue
+            if current:
+                lines.append(current)
+            if _string_width(pdf, word) <= max_width:
+                current = word
+            else:
+                *full, current = _break_word(pdf, word, max_width)
+                lines.extend(full)
+        if current:
+            lines.append(current)
+    return lines
+
+
+_LAYOUT_CACHE_MAX = 256
+_layout_cache: dict[tuple, _CompanyLayout] = {}
+_layout_lock = threading.Lock()
+
+
+def company_layout(company: dict) -> _CompanyLayout:
+    """Return the compiled header layout for ``company``, building it on first use."""
+    logo = company.get('logo')
+    try:
+        logo_mtime = os.path.getmtime(logo) if logo else None
+    except OSError:
+        logo_mtime = None
+    key = (
+        company.get('name', 'Tiendix'),
+        company.get('address'),
+        company.get('website'),
+        company.get('phone'),
+        str(logo) if logo else None,
+        logo_mtime,
+    )
+    with _layout_lock:
+        layout = _layout_cache.get(key)
+    if layout is None:
+        built = _CompanyLayout(company)
+        with _layout_lock:
+            layout = _layout_cache.get(key)
+            if layout is None:
+                if len(_layout_cache) >= _LAYOUT_CACHE_MAX:
+                    _layout_cache.clear()
+                layout = _layout_cache[key] = built
+    return layout
+
+
+class _DocumentPDF(FPDF):
+    """FPDF document that stamps the running header and table header on continuation pages."""
+
+    def __init__(self, layout: _CompanyLayout, title: str, doc_number: int | None = None):
+        super().__init__()
+        self.layout = layout
+        self.doc_title = _safe_text(title)
+        self.doc_number = doc_number
+        # (headers, widths) while an items table is being drawn, so it repeats after page breaks.
+        self.table_header = None
+        self.set_auto_page_break(auto=True, margin=14)
+
+    def header(self):
+        if self.page_no() == 1:
+            return
+        self.set_y(8)
+        self.set_text_color(*BLUE)
+        self.set_font('Helvetica', 'B', 11)
+        _cell(self, 0, 6, self.layout.name, new_x=XPos.LMARGIN, new_y=YPos.TOP)
+        self.set_text_color(0, 0, 0)
+        self.set_font('Helvetica', '', 9)
+        label = f"{self.doc_title} No. {self.doc_number}" if self.doc_number is not None else self.doc_title
+        _cell(self, 0, 6, label, align='R', new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+        self.ln(2)
+        if self.table_header:
+            _draw_table_header(self, *self.table_header)
+            self.set_text_color(0, 0, 0)
+            self.set_font('Helvetica', '', 8)
+
+
+def _new_document(title: str, company: dict, doc_number: int | None) -> _DocumentPDF:
+    pdf = _DocumentPDF(company_layout(company), title, doc_number)
+    pdf.add_page()
+    return pdf
+
+
 def _draw_header(pdf: FPDF, title: str, company: dict, date: datetime, doc_number: int | None, ncf: str | None, valid_until: datetime | None):
+    layout = getattr(pdf, 'layout', None) or company_layout(company)
     left_x = pdf.l_margin
     top_y = 10
     logo_box_w = 28
     text_x = left_x + logo_box_w + 4
 
     # Logo a la izquierda
-    logo = company.get('logo')
     logo_bottom_y = top_y
-    if logo:
-        logo_path = str(logo)
-        if os.path.exists(logo_path):
-            pdf.image(logo_path, x=left_x, y=top_y, w=logo_box_w)
-            logo_bottom_y = top_y + logo_box_w
+    if layout.logo is not None:
+        pdf.image(io.BytesIO(layout.logo), x=left_x, y=top_y, w=logo_box_w)
+        logo_bottom_y = top_y + logo_box_w
 
     # Nombre y dirección/web a la derecha del logo
     pdf.set_xy(text_x, top_y)
     pdf.set_text_color(*BLUE)
     pdf.set_font('Helvetica', 'B', 18)
-    _cell(pdf, 0, 8, _safe_text(company.get('name', 'Tiendix')), new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+    _cell(pdf, 0, 8, layout.name, new_x=XPos.LMARGIN, new_y=YPos.NEXT)
 
     pdf.set_text_color(0, 0, 0)
     pdf.set_font('Helvetica', '', 10)
-    if company.get('address'):
+    if layout.address:
+        for line in layout.address_lines(pdf, pdf.w - pdf.r_margin - text_x - 2):
+            pdf.set_x(text_x)
+            _cell(pdf, 0, 5, line, new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+    if layout.website:
         pdf.set_x(text_x)
-        pdf.multi_cell(0, 5, _safe_text(company['address']))
-    if company.get('website'):
+        _cell(pdf, 0, 5, layout.website, new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+    if layout.phone:
         pdf.set_x(text_x)
-        _cell(pdf, 0, 5, _safe_text(company['website']), new_x=XPos.LMARGIN, new_y=YPos.NEXT)
-    if company.get('phone'):
-        pdf.set_x(text_x)
-        _cell(pdf, 0, 5, _safe_text(f"Tel: {company['phone']}"), new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+        _cell(pdf, 0, 5, layout.phone, new_x=XPos.LMARGIN, new_y=YPos.NEXT)
 
     company_block_bottom = max(pdf.get_y(), logo_bottom_y)
     pdf.set_y(company_block_bottom + 15)  # 1.5 cm
@@ -220,11 +403,28 @@ def _draw_meta_block(pdf: FPDF, seller: str | None, payment_method: str | None,
             _cell(pdf, 0, 5, _safe_text(line), new_x=XPos.LMARGIN, new_y=YPos.NEXT)
 
 
-def _draw_items_table(pdf: FPDF, items: list[dict], min_rows: int = 15):
-    headers = ["Código", "Ref", "Producto", "Unidad", "Precio", "Cant.", "Desc.", "Total"]
-    widths = [18, 18, 52, 18, 24, 14, 22, 24]
+_ITEM_HEADERS = ["Código", "Ref", "Producto", "Unidad", "Precio", "Cant.", "Desc.", "Total"]
+_ITEM_WIDTHS = [18, 18, 52, 18, 24, 14, 22, 24]
+_ITEM_ALIGNS = ['L', 'L', 'L', 'L', 'R', 'C', 'R', 'R']
+_ITEM_FIT_COLUMNS = (0, 1, 2, 3, 5)
+
+
+def _item_row(item: dict) -> tuple[str, ...]:
+    """Pre-convert an item dict to the raw cell strings of the items table."""
+    line_total = item['unit_price'] * item['quantity'] - item.get('discount', 0)
+    return (
+        str(item.get('code', '')),
+        str(item.get('reference', '')),
+        str(item.get('product_name', '')),
+        str(item.get('unit', '')),
+        _fmt_money(item['unit_price']),
+        str(item['quantity']),
+        _fmt_money(item.get('discount', 0)),
+        _fmt_money(line_total),
+    )
 
-    pdf.ln(3)
+
+def _draw_table_header(pdf: FPDF, headers, widths):
     pdf.set_fill_color(*BLUE)
     pdf.set_text_color(255, 255, 255)
     pdf.set_font('Helvetica', 'B', 8)
@@ -232,33 +432,32 @@ def _draw_items_table(pdf: FPDF, items: list[dict], min_rows: int = 15):
         _cell(pdf, w, 7, _safe_text(h), border=1, align='C', fill=True, new_x=XPos.RIGHT, new_y=YPos.TOP)
     pdf.ln()
 
+
+def _draw_items_table(pdf: FPDF, items: list[dict], min_rows: int = 15):
+    widths = _ITEM_WIDTHS
+
+    pdf.ln(3)
+    _draw_table_header(pdf, _ITEM_HEADERS, widths)
+    pdf.table_header = (_ITEM_HEADERS, widths)
+
     pdf.set_text_color(0, 0, 0)
     pdf.set_font('Helvetica', '', 8)
+    fit_widths = {idx: max(widths[idx] - 1.5, 1) for idx in _ITEM_FIT_COLUMNS}
     for i in items:
-        line_total = i['unit_price'] * i['quantity'] - i.get('discount', 0)
-        row = [
-            str(i.get('code', '')),
-            str(i.get('reference', '')),
-            str(i.get('product_name', '')),
-            str(i.get('unit', '')),
-            _fmt_money(i['unit_price']),
-            str(i['quantity']),
-            _fmt_money(i.get('discount', 0)),
-            _fmt_money(line_total),
-        ]
+        row = _item_row(i)
         for idx, (text, w) in enumerate(zip(row, widths)):
-            align = 'R' if idx in (4, 6, 7) else ('C' if idx == 5 else 'L')
-            display_text = _fit_cell_text(pdf, text, max(w - 1.5, 1)) if idx in (0, 1, 2, 3, 5) else _safe_text(text)
-            _cell(pdf, w, 6, display_text, border=1, align=align, new_x=XPos.RIGHT, new_y=YPos.TOP)
+            fit_width = fit_widths.get(idx)
+            display_text = _fit_cell_text(pdf, text, fit_width) if fit_width is not None else _safe_text(text)
+            _cell(pdf, w, 6, display_text, border=1, align=_ITEM_ALIGNS[idx], new_x=XPos.RIGHT, new_y=YPos.TOP)
         pdf.ln()
 
     # Añade filas vacías para que el documento no se vea vacío cuando hay pocos productos.
     empty_rows = max(0, min_rows - len(items))
     for _ in range(empty_rows):
         for idx, w in enumerate(widths):
-            align = 'R' if idx in (4, 6, 7) else ('C' if idx == 5 else 'L')
-            _cell(pdf, w, 6, '', border=1, align=align, new_x=XPos.RIGHT, new_y=YPos.TOP)
+            _cell(pdf, w, 6, '', border=1, align=_ITEM_ALIGNS[idx], new_x=XPos.RIGHT, new_y=YPos.TOP)
         pdf.ln()
+    pdf.table_header = None
 
 
 def _draw_totals(pdf: FPDF, subtotal: float, itbis: float, total: float, discount: float, note: str | None, footer: str | None):
@@ -292,9 +491,7 @@ def generate_pdf(title: str, company: dict, client: dict, items: list,
     item_dicts = [_item_to_dict(i) for i in items]
     client_dict = _client_to_dict(client)
 
-    pdf = FPDF()
-    pdf.set_auto_page_break(auto=True, margin=14)
-    pdf.add_page()
+    pdf = _new_document(title, company, doc_number)
 
     base_date = _to_dom_time(date or datetime.now(DOM_TZ))
     _draw_header(pdf, title, company, base_date, doc_number, ncf, valid_until)
@@ -334,9 +531,7 @@ def generate_pdf_bytes(title: str, company: dict, client: dict, items: list,
     item_dicts = [_item_to_dict(i) for i in items]
     client_dict = _client_to_dict(client)
 
-    pdf = FPDF()
-    pdf.set_auto_page_break(auto=True, margin=14)
-    pdf.add_page()
+    pdf = _new_document(title, company, doc_number)
 
     base_date = _to_dom_time(date or datetime.now(DOM_TZ))
     _draw_header(pdf, title, company, base_date, doc_number, ncf, valid_until)
@@ -365,9 +560,7 @@ def generate_service_pdf_bytes(title: str, company: dict, client: dict, items: l
     item_dicts = [_item_to_dict(i) for i in items]
     client_dict = _client_to_dict(client)
 
-    pdf = FPDF()
-    pdf.set_auto_page_break(auto=True, margin=14)
-    pdf.add_page()
+    pdf = _new_document(title, company, doc_number)
 
     base_date = _to_dom_time(date or datetime.now(DOM_TZ))
     _draw_header(pdf, title, company, base_date, doc_number, ncf, valid_until)
@@ -378,12 +571,8 @@ def generate_service_pdf_bytes(title: str, company: dict, client: dict, items: l
     widths = [14, 104, 16, 26, 30]
 
     pdf.ln(3)
-    pdf.set_fill_color(*BLUE)
-    pdf.set_text_color(255, 255, 255)
-    pdf.set_font('Helvetica', 'B', 8)
-    for h, w in zip(headers, widths):
-        _cell(pdf, w, 7, _safe_text(h), border=1, align='C', fill=True, new_x=XPos.RIGHT, new_y=YPos.TOP)
-    pdf.ln()
+    _draw_table_header(pdf, headers, widths)
+    pdf.table_header = (headers, widths)
 
     pdf.set_text_color(0, 0, 0)
     pdf.set_font('Helvetica', '', 8)
@@ -404,6 +593,7 @@ def generate_service_pdf_bytes(title: str, company: dict, client: dict, items: l
             display_text = _fit_cell_text(pdf, text, max(w - 1.5, 1)) if col == 1 else _safe_text(text)
             _cell(pdf, w, 6, display_text, border=1, align=align, new_x=XPos.RIGHT, new_y=YPos.TOP)
         pdf.ln()
+    pdf.table_header = None
 
     total_discount = sum(float(i.get('discount', 0) or 0) for i in item_dicts)
     _draw_totals(pdf, subtotal, itbis, total, total_discount, note, footer)